@@ -27,7 +27,7 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 REACT_BUILD_PATH_STATIC = '/Users/ernestilchenko/project/frontend/build/static'
 REACT_BUILD_PATH = '/Users/ernestilchenko/project/frontend/build'
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 ALLOWED_HOSTS = ['*']
 CSRF_TRUSTED_ORIGINS = [
     'https://backend-1004166685896.europe-central2.run.app',
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'rest_framework',
     'allauth',
     'allauth.account',
@@ -61,13 +62,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core_app.middleware.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.common.CommonMiddleware',
     'allauth.account.middleware.AccountMiddleware',
 ]
 AUTHENTICATION_BACKENDS = [
@@ -121,6 +123,27 @@ DATABASES = {
     }
 }
 
+# Pula połączeń psycopg (Django 5.1, wymaga psycopg 3): każdy proces trzyma
+# od DB_POOL_MIN_SIZE do DB_POOL_MAX_SIZE połączeń, a CONN_HEALTH_CHECKS
+# sprawdza połączenie przed wydaniem z puli.
+# DB_POOL_MAX_SIZE=0 wyłącza pulę - zostają trwałe połączenia (DB_CONN_MAX_AGE).
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if DB_POOL_MAX_SIZE:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': 300,
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 600))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -158,9 +181,51 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     REACT_BUILD_PATH_STATIC,
 ]
+
+# Pliki statyczne serwuje WhiteNoise: nazwy z hashem treści, wersje .gz/.br
+# przygotowane przy collectstatic i nagłówki Cache-Control na rok
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+# Brak pliku w manifeście nie przerywa renderowania - zostaje adres bez hasha
+WHITENOISE_MANIFEST_STRICT = False
+# Pliki z hashem w nazwie: z manifestu Django (base.0123456789ab.css) i z buildu Reacta (main.1a2b3c4d.chunk.js)
+WHITENOISE_IMMUTABLE_FILE_TEST = r'^.+\.[0-9a-f]{8,12}\.'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Skrót SHA-256 liczony w trakcie odbierania pliku (core_app.dedup) - przed domyślnymi handlerami
+FILE_UPLOAD_HANDLERS = [
+    'core_app.dedup.Sha256UploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Katalog cache na dysku - poza MEDIA_ROOT, nigdy nie serwowany przez /media/
+CACHE_ROOT = os.getenv('CACHE_ROOT', os.path.join(BASE_DIR, 'cache'))
+
+# Cache odpowiedzi z danymi tabel (core_app.cache)
+RESPONSE_CACHE_ROOT = os.path.join(CACHE_ROOT, 'responses')
+RESPONSE_CACHE_MEMORY_ITEMS = 512
+# Limit rozmiaru wpisów na dysku - po przekroczeniu usuwane są najdawniej używane
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Token wymagany przez /metrics (nagłówek Authorization: Bearer); pusty - endpoint otwarty
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Cache Django (m.in. profile użytkowników) - na dysku, wspólny dla wszystkich procesów
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_ROOT, 'django'),
+    }
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
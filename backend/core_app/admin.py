@@ -6,10 +6,18 @@ from django.contrib import messages
 from django.db import connection
 from django.http import FileResponse
 from django.http import HttpResponse, HttpResponseRedirect
+from django.template.defaultfilters import filesizeformat
 from django.urls import path, reverse
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
 
-from .models import UploadedFile, CSVFile, DatabaseTable, Section, Folder, FileRecord
+from .cache import bump_table_version, streaming_table_response
+from .dedup import uploaded_sha256
+from .indexes import advise_table
+from .models import UploadedFile, CSVFile, DatabaseTable, Section, Folder, FileRecord, IngestionJob, TableStats, \
+    UploadSession, drop_table_metadata
+from .streaming import PREVIEW_ROWS, iter_csv_file_rows, iter_table_rows, streaming_csv_response, \
+    streaming_html_response
 
 
 # Register your models here.
@@ -22,6 +30,14 @@ class CSVFileAdmin(admin.ModelAdmin):
 
     get_file_name.short_description = 'Plik'
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            # Skrót policzony przy odbieraniu pliku - model nie czyta go drugi raz
+            obj.sha256 = uploaded_sha256(request, 'file') or ''
+        super().save_model(request, obj, form, change)
+        if getattr(obj, 'sync_stats', None):
+            self.message_user(request, f'Synchronizacja {obj.title}: {obj.sync_stats}')
+
 
 logger = logging.getLogger(__name__)
 
@@ -65,36 +81,15 @@ class UploadedFileAdmin(admin.ModelAdmin):
     download_link.short_description = 'Pobieranie'
 
     def view_csv(self, request, pk):
-        import csv
-
         uploaded_file = UploadedFile.objects.get(pk=pk)
+        return streaming_table_response(request, uploaded_file.table_name, f'view_csv:{pk}',
+                                        lambda: self.render_csv(uploaded_file))
 
-        html_content = ['<html><head><style>',
-                        'table { border-collapse: collapse; width: 100%; }',
-                        'th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }',
-                        'tr:nth-child(even) { background-color: #f2f2f2; }',
-                        'th { background-color: #4CAF50; color: white; }',
-                        '</style></head><body><table>']
-
-        with uploaded_file.file.open(mode='r') as f:
-            csv_reader = csv.reader(f)
-            # Заголовки
-            headers = next(csv_reader)
-            html_content.append('<tr>')
-            for header in headers:
-                html_content.append(f'<th>{header}</th>')
-            html_content.append('</tr>')
-
-            # Данные
-            for row in csv_reader:
-                html_content.append('<tr>')
-                for cell in row:
-                    html_content.append(f'<td>{cell}</td>')
-                html_content.append('</tr>')
-
-        html_content.append('</table></body></html>')
-
-        return HttpResponse(''.join(html_content))
+    def render_csv(self, uploaded_file):
+        rows = iter_csv_file_rows(uploaded_file)
+        # Заголовки
+        headers = next(rows, [])
+        return streaming_html_response(headers, rows)
 
     def download_file(self, request, pk):
         uploaded_file = UploadedFile.objects.get(pk=pk)
@@ -102,9 +97,31 @@ class UploadedFileAdmin(admin.ModelAdmin):
         return response
 
 
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('title', 'phase', 'rows_processed', 'rows_per_second', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('phase', 'file_type', 'created_at')
+    search_fields = ('title', 'worker', 'sync_table')
+    readonly_fields = ('id', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'status', 'size_display', 'chunk_count', 'job', 'created_at', 'updated_at')
+    list_filter = ('status', 'file_type', 'created_at')
+    search_fields = ('filename', 'title')
+    readonly_fields = ('id', 'job', 'created_at', 'updated_at')
+
+    def size_display(self, obj):
+        return filesizeformat(obj.size)
+
+    size_display.short_description = 'Rozmiar'
+
+
 @admin.register(DatabaseTable)
 class DatabaseTableAdmin(admin.ModelAdmin):
-    list_display = ('table_name', 'row_count', 'view_table_link', 'delete_table_link')
+    list_display = ('table_name', 'row_count_display', 'size_on_disk', 'indexes_size', 'indexes_display',
+                    'last_ingested_at', 'view_table_link', 'delete_table_link')
     list_display_links = ('table_name',)
     search_fields = ('table_name',)
 
@@ -117,6 +134,35 @@ class DatabaseTableAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+    def row_count_display(self, obj):
+        if obj.row_count_exact:
+            return obj.row_count
+        url = reverse('admin:count-table-rows', args=[obj.table_name])
+        return format_html('~{} <a href="{}">(policz dokładnie)</a>', obj.row_count, url)
+
+    row_count_display.short_description = 'Liczba wierszy'
+
+    def size_on_disk(self, obj):
+        return filesizeformat(obj.total_size)
+
+    size_on_disk.short_description = 'Rozmiar na dysku'
+
+    def indexes_size(self, obj):
+        return filesizeformat(obj.index_size)
+
+    indexes_size.short_description = 'Rozmiar indeksów'
+
+    def indexes_display(self, obj):
+        indexes = format_html_join(
+            mark_safe('<br>'), '{}{}: {} odczytów, {}',
+            ((index['name'], ' (auto)' if index['managed'] else '', index['scans'], filesizeformat(index['size']))
+             for index in getattr(obj, 'indexes', []))
+        )
+        url = reverse('admin:advise-table-indexes', args=[obj.table_name])
+        return format_html('{}<br><a href="{}">Dobierz indeksy</a>', indexes, url)
+
+    indexes_display.short_description = 'Indeksy'
+
     def view_table_link(self, obj):
         if obj and obj.table_name:
             url = reverse('admin:view-table-content', args=[obj.table_name])
@@ -147,11 +193,26 @@ class DatabaseTableAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.view_table_content),
                 name='view-table-content',
             ),
+            path(
+                'export_table/<str:table_name>/',
+                self.admin_site.admin_view(self.export_table_csv),
+                name='export-table-csv',
+            ),
+            path(
+                'advise_indexes/<str:table_name>/',
+                self.admin_site.admin_view(self.advise_table_indexes),
+                name='advise-table-indexes',
+            ),
             path(
                 'delete_table/<str:table_name>/',
                 self.admin_site.admin_view(self.delete_table),
                 name='delete-table',
             ),
+            path(
+                'count_rows/<str:table_name>/',
+                self.admin_site.admin_view(self.count_table_rows),
+                name='count-table-rows',
+            ),
         ]
         return custom_urls + urls
 
@@ -174,6 +235,8 @@ class DatabaseTableAdmin(admin.ModelAdmin):
                     else:
                         # Удаляем таблицу
                         cursor.execute(f'DROP TABLE "{table_name}" CASCADE')
+                        drop_table_metadata(table_name)
+                        bump_table_version(table_name)
                         messages.success(request, f'Tabela {table_name} została usunięta.')
             except Exception as e:
                 logger.error(f"Error deleting table {table_name}: {str(e)}")
@@ -181,7 +244,7 @@ class DatabaseTableAdmin(admin.ModelAdmin):
 
             return HttpResponseRedirect(reverse('admin:core_app_databasetable_changelist'))
 
-    def view_table_content(self, request, table_name):
+    def count_table_rows(self, request, table_name):
         try:
             with connection.cursor() as cursor:
                 cursor.execute("""
@@ -193,9 +256,42 @@ class DatabaseTableAdmin(admin.ModelAdmin):
                 """, [table_name])
                 exists = cursor.fetchone()[0]
 
-                if not exists:
-                    return HttpResponse(f"Tabela {table_name} nie istnieje")
+            if not exists:
+                messages.error(request, f'Tabela {table_name} nie istnieje.')
+            else:
+                row_count = TableStats.count_exact(table_name)
+                messages.success(request, f'Tabela {table_name} zawiera {row_count} wierszy.')
+        except Exception as e:
+            logger.error(f"Error counting rows in {table_name}: {str(e)}")
+            messages.error(request, f'Błąd podczas liczenia wierszy: {str(e)}')
+
+        return HttpResponseRedirect(reverse('admin:core_app_databasetable_changelist'))
+
+    def advise_table_indexes(self, request, table_name):
+        try:
+            proposals = advise_table(table_name)
+            if proposals:
+                created = ', '.join(f'{p.column} ({p.method})' for p in proposals)
+                messages.success(request, f'Utworzono indeksy dla {table_name}: {created}')
+            else:
+                messages.info(request, f'Tabela {table_name} nie potrzebuje nowych indeksów.')
+        except Exception as e:
+            logger.error(f"Error advising indexes for {table_name}: {str(e)}")
+            messages.error(request, f'Błąd podczas doboru indeksów: {str(e)}')
+
+        return HttpResponseRedirect(reverse('admin:core_app_databasetable_changelist'))
+
+    def view_table_content(self, request, table_name):
+        return streaming_table_response(request, table_name, 'view_table',
+                                        lambda: self.render_table_content(table_name))
 
+    def export_table_csv(self, request, table_name):
+        return streaming_table_response(request, table_name, 'export_csv',
+                                        lambda: self.render_table_content(table_name, export=True))
+
+    def render_table_content(self, table_name, export=False):
+        try:
+            with connection.cursor() as cursor:
                 cursor.execute("""
                     SELECT column_name 
                     FROM information_schema.columns 
@@ -205,36 +301,20 @@ class DatabaseTableAdmin(admin.ModelAdmin):
                 """, [table_name])
                 columns = [col[0] for col in cursor.fetchall()]
 
-                cursor.execute(f'SELECT * FROM "{table_name}" LIMIT 1000')
-                rows = cursor.fetchall()
-
-                html_content = ['<html><head><style>',
-                                'table { border-collapse: collapse; width: 100%; margin-top: 20px; }',
-                                'th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }',
-                                'tr:nth-child(even) { background-color: #f2f2f2; }',
-                                'th { background-color: #4CAF50; color: white; }',
-                                '.table-info { padding: 10px; background-color: #f8f9fa; border-radius: 5px; }',
-                                '</style></head><body>',
-                                f'<div class="table-info">',
-                                f'<h2>Tabela: {table_name}</h2>',
-                                f'<p>Liczba kolumn: {len(columns)}</p>',
-                                f'<p>Wyświetlone rekordy: {len(rows)} (maksymalnie 1000)</p>',
-                                '</div><table>']
-
-                html_content.append('<tr>')
-                for column in columns:
-                    html_content.append(f'<th>{column}</th>')
-                html_content.append('</tr>')
-
-                for row in rows:
-                    html_content.append('<tr>')
-                    for cell in row:
-                        html_content.append(f'<td>{cell if cell is not None else ""}</td>')
-                    html_content.append('</tr>')
-
-                html_content.append('</table></body></html>')
-
-                return HttpResponse(''.join(html_content))
+            if not columns:
+                return HttpResponse(f"Tabela {table_name} nie istnieje")
+
+            if export:
+                return streaming_csv_response(columns, iter_table_rows(table_name, columns), f'{table_name}.csv')
+
+            export_url = reverse('admin:export-table-csv', args=[table_name])
+            header_html = format_html(
+                '<div class="table-info"><h2>Tabela: {}</h2><p>Liczba kolumn: {}</p>'
+                '<p>Podgląd pierwszych {} rekordów. <a href="{}">Pobierz całą tabelę jako CSV</a></p></div>',
+                table_name, len(columns), PREVIEW_ROWS, export_url
+            )
+            return streaming_html_response(columns, iter_table_rows(table_name, columns, limit=PREVIEW_ROWS),
+                                           header_html)
         except Exception as e:
             logger.error(f"Error viewing table {table_name}: {str(e)}")
             return HttpResponse(f"Błąd podczas wyświetlania tabeli: {str(e)}")
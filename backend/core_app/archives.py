@@ -0,0 +1,200 @@
+"""
+Pliki przesyłane w postaci skompresowanej (.gz, .zst, .zip).
+
+Plik zostaje w storage tak, jak przyszedł - rozpakowywany jest dopiero przy
+imporcie, strumieniowo, prosto do czytnika CSV albo pliku przestrzennego
+(bez rozpakowywania do pliku tymczasowego). Typ danych bierze się z nazwy
+(dzialki.geojson.gz); w archiwum zip wybierany jest jedyny plik danych,
+a pliki towarzyszące shapefile (.dbf, .shx, .prj, .cpg) czytane są z tego
+samego archiwum.
+
+Ochrona przed "bombami" dekompresji: strumień jest przerywany, gdy
+rozpakowane dane przekroczą INGEST_MAX_DECOMPRESSED_SIZE albo MAX_RATIO
+razy rozmiar pliku skompresowanego.
+"""
+import gzip
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+
+DATA_EXTENSIONS = ('.geojson', '.kml', '.shp', '.csv', '.gml')
+COMPRESSED_EXTENSIONS = ('.gz', '.zst', '.zip')
+
+# Domyślny limit rozpakowanych danych (INGEST_MAX_DECOMPRESSED_SIZE nadpisuje)
+MAX_DECOMPRESSED_SIZE = 20 * 1024 * 1024 * 1024
+
+# Dane tekstowe kompresują się typowo 5-20x; limit stosunku obowiązuje od MIN_RATIO_CHECK bajtów
+MAX_RATIO = 200
+MIN_RATIO_CHECK = 64 * 1024 * 1024
+
+MAX_ZIP_MEMBERS = 10000
+
+_READ_BUFFER = 256 * 1024
+
+
+class ArchiveError(ValueError):
+    """Archiwum nie nadaje się do importu - komunikat trafia do użytkownika"""
+
+
+def max_decompressed_size():
+    return int(os.getenv('INGEST_MAX_DECOMPRESSED_SIZE', 0)) or MAX_DECOMPRESSED_SIZE
+
+
+def split_upload_name(filename):
+    """
+    Tytuł, rozszerzenie danych i rozszerzenie kompresji z nazwy pliku:
+    'dzialki.geojson.gz' -> ('dzialki', '.geojson', '.gz'). W nazwie
+    archiwum zip rozszerzenie danych jest opcjonalne ('dzialki.zip' -> ('dzialki', '', '.zip')).
+    """
+    base, extension = os.path.splitext(os.path.basename(filename or ''))
+    extension = extension.lower()
+    if extension not in COMPRESSED_EXTENSIONS:
+        return base, extension, ''
+    title, inner = os.path.splitext(base)
+    if inner.lower() in DATA_EXTENSIONS:
+        return title, inner.lower(), extension
+    return base, '', extension
+
+
+def compression_of(name):
+    return split_upload_name(name)[2]
+
+
+def _data_members(archive):
+    members = archive.infolist()
+    if len(members) > MAX_ZIP_MEMBERS:
+        raise ArchiveError(f'Archive has more than {MAX_ZIP_MEMBERS} files')
+    return [
+        member for member in members
+        if not member.is_dir() and not member.filename.startswith('__MACOSX/')
+        and not os.path.basename(member.filename).startswith('.')
+        and os.path.splitext(member.filename)[1].lower() in DATA_EXTENSIONS
+    ]
+
+
+def zip_member(archive, file_type=None):
+    """Jedyny plik danych w archiwum (o typie `file_type`, jeśli podany)"""
+    members = _data_members(archive)
+    if file_type:
+        members = [member for member in members if os.path.splitext(member.filename)[1].lower() == f'.{file_type}']
+    if not members:
+        raise ArchiveError('Archive contains no supported data file')
+    if len(members) > 1:
+        raise ArchiveError('Archive contains several data files: '
+                           + ', '.join(member.filename for member in members[:10]))
+    return members[0]
+
+
+def upload_file_type(filename, fileobj=None):
+    """
+    Tytuł i typ danych ('csv', 'shp', ...) przesyłanego pliku. Typ pliku zip
+    ustalany jest z jego zawartości, gdy podano otwarty plik `fileobj`.
+    """
+    title, extension, compression = split_upload_name(filename)
+    if compression == '.zip' and fileobj is not None:
+        try:
+            with zipfile.ZipFile(fileobj) as archive:
+                extension = os.path.splitext(zip_member(archive, extension[1:]).filename)[1].lower()
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f'Invalid zip archive: {e}')
+    if extension not in DATA_EXTENSIONS:
+        raise ArchiveError('Invalid file type')
+    return title, extension[1:]
+
+
+class _BoundedReader(io.RawIOBase):
+    """Rozpakowywany strumień przerywany po przekroczeniu limitów rozmiaru"""
+
+    def __init__(self, stream, compressed_size, name):
+        self.stream = stream
+        self.name = name
+        self.limit = max_decompressed_size()
+        self.ratio_limit = max(MIN_RATIO_CHECK, compressed_size * MAX_RATIO)
+        self.produced = 0
+
+    def readable(self):
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.produced += len(data)
+        if self.produced > self.limit:
+            raise ArchiveError(f'{self.name}: decompressed data exceeds {self.limit} bytes')
+        if self.produced > self.ratio_limit:
+            raise ArchiveError(f'{self.name}: compression ratio above {MAX_RATIO}:1, refusing to decompress')
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _bounded(stream, compressed_size, name):
+    return io.BufferedReader(_BoundedReader(stream, compressed_size, name), buffer_size=_READ_BUFFER)
+
+
+def _decompressor(fileobj, compression):
+    if compression == '.gz':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError('Zstandard archives require the zstandard package')
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True, closefd=False)
+
+
+def _check_member(member):
+    if member.flag_bits & 0x1:
+        raise ArchiveError(f'{member.filename}: encrypted archives are not supported')
+    if member.file_size > max_decompressed_size() or (
+            member.file_size > MIN_RATIO_CHECK and member.file_size > member.compress_size * MAX_RATIO):
+        raise ArchiveError(f'{member.filename}: declared size {member.file_size} bytes exceeds the limits')
+
+
+@contextmanager
+def open_data(field_file, file_type):
+    """
+    Otwarty binarnie strumień danych pliku z storage (rozpakowywany w locie)
+    i funkcja open_sibling(ext) dla plików towarzyszących shapefile.
+    """
+    compression = compression_of(field_file.name)
+    storage = field_file.storage
+
+    if compression != '.zip':
+        base_name = os.path.splitext(field_file.name[:len(field_file.name) - len(compression)])[0]
+
+        def open_sibling(ext):
+            name = base_name + ext
+            return storage.open(name, 'rb') if storage.exists(name) else None
+
+        with field_file.open(mode='rb') as file:
+            if not compression:
+                yield file, open_sibling
+                return
+            with _decompressor(file, compression) as stream:
+                yield _bounded(stream, field_file.size, field_file.name), open_sibling
+        return
+
+    with field_file.open(mode='rb') as file:
+        try:
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f'Invalid zip archive: {e}')
+        with archive:
+            member = zip_member(archive, file_type)
+            members = {member_info.filename.lower(): member_info for member_info in archive.infolist()}
+            member_base = os.path.splitext(member.filename)[0].lower()
+
+            def open_member(member_info):
+                _check_member(member_info)
+                return _bounded(archive.open(member_info), member_info.compress_size, member_info.filename)
+
+            def open_sibling(ext):
+                sibling = members.get(member_base + ext)
+                return open_member(sibling) if sibling is not None else None
+
+            with open_member(member) as stream:
+                yield stream, open_sibling
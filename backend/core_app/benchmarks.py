@@ -0,0 +1,294 @@
+"""
+Benchmarki importu, drzewa sekcji i przeglądania tabel.
+
+Każdy zestaw (suite) przygotowuje dane poza pomiarem i zleca pomiary
+obiektowi Benchmark, który wykonuje je w kilku rundach. Wyniki mają układ
+JSON jak w pytest-benchmark, więc przebiegi z różnych commitów można
+porównać (manage.py benchmark --compare).
+"""
+import csv
+import os
+import platform
+import random
+import statistics
+import struct
+import subprocess
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import bump_table_version
+from .models import DatabaseTable, FileRecord, Folder, Section, UploadedFile
+from .tree import build_tree, invalidate_user_tree
+
+DEFAULT_SIZES = (10_000, 100_000)
+DEFAULT_ROUNDS = 5
+
+# Drzewo: sekcje x foldery w sekcji x pliki w folderze
+TREE_SHAPE = (20, 25, 40)
+# Liczba tabel w zestawie `tables`
+MANY_TABLES = 200
+
+# Kolumny eksportu DzialkiZaMniej (bez geometrii - ta jest opcjonalna)
+PARCEL_COLUMNS = [
+    'identyfikator', 'województwo', 'powiat', 'gmina', 'obręb', 'numer', 'B_Link_do_oferty',
+    'C_Cena_zl', 'D_Cena_m2_zl', 'K_Komentarz', 'J_Data_dodania', 'A_zdjecie', 'G_film',
+    'F_Przeznaczenie', 'E_Powierzchnia_dzialki', 'H_Studium_WMS', 'I_Miejscowe_plany_WMS',
+]
+
+_REGIONS = [
+    ('pomorskie', 'pucki', ['Hel (miasto)', 'Jastarnia', 'Puck', 'Władysławowo']),
+    ('pomorskie', 'kartuski', ['Kartuzy', 'Żukowo', 'Somonino']),
+    ('mazowieckie', 'piaseczyński', ['Piaseczno', 'Konstancin-Jeziorna', 'Lesznowola']),
+    ('małopolskie', 'krakowski', ['Skawina', 'Wieliczka', 'Zielonki', 'Michałowice']),
+    ('dolnośląskie', 'wrocławski', ['Kobierzyce', 'Siechnice', 'Długołęka']),
+]
+_PURPOSES = ['budowlana', 'rolna', 'rekreacyjna', 'usługowa', 'leśna']
+_COMMENTS = ['informacja o działce', 'dojazd drogą gminną', 'media w drodze', 'blisko lasu', '']
+
+# Prostokąt w EPSG:2180 jako EWKB (hex) - ten sam zapis co kolumna geom w eksporcie
+_EWKB_POLYGON_2180 = struct.pack('<BII', 1, 0x20000003, 2180)
+
+
+def parcel_geometry(x, y, width, height):
+    ring = [(x, y), (x + width, y), (x + width, y + height), (x, y + height), (x, y)]
+    points = b''.join(struct.pack('<dd', px, py) for px, py in ring)
+    return (_EWKB_POLYGON_2180 + struct.pack('<II', 1, len(ring)) + points).hex().upper()
+
+
+def generate_parcels_csv(path, rows, seed=0, geometry=False):
+    """Syntetyczny plik CSV o układzie eksportu DzialkiZaMniej (deterministyczny dla danego seed)"""
+    rng = random.Random(seed)
+    start_date = date(2024, 1, 1)
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow((['geom'] if geometry else []) + PARCEL_COLUMNS)
+        for i in range(rows):
+            voivodeship, county, communes = _REGIONS[i % len(_REGIONS)]
+            commune = rng.choice(communes)
+            teryt = 220000 + rng.randrange(10000)
+            number = f'{rng.randrange(1, 2000)}/{rng.randrange(1, 100)}'
+            area = rng.randrange(300, 20000)
+            price_m2 = rng.randrange(20, 900)
+            row = [
+                f'{teryt}_1.{i % 10000:04d}.{number}', voivodeship, county, commune, commune, number,
+                'dzialkizamniej.pl', area * price_m2, price_m2, rng.choice(_COMMENTS),
+                (start_date + timedelta(days=rng.randrange(365))).isoformat(),
+                f'https://storage.googleapis.com/parcels/{rng.getrandbits(64):016x}', '',
+                rng.choice(_PURPOSES), area,
+                f'https://mpzp.igeomap.pl/cgi-bin/{teryt}', f'https://mpzp.igeomap.pl/cgi-bin/{teryt}',
+            ]
+            if geometry:
+                x, y = 400000 + rng.random() * 300000, 500000 + rng.random() * 300000
+                row.insert(0, parcel_geometry(x, y, area ** 0.5, area ** 0.5))
+            writer.writerow(row)
+    return path
+
+
+def machine_info():
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW server_version')
+        server_version = cursor.fetchone()[0]
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'node': platform.node(),
+        'python_version': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'postgresql_version': server_version,
+        'commit': commit,
+    }
+
+
+class Benchmark:
+    """Pomiar przypadków w rundach; statystyki w sekundach jak w pytest-benchmark"""
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, warmup=True):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.results = []
+
+    def run(self, group, name, func, setup=None, teardown=None, rounds=None, **params):
+        """
+        Wykonuje `func` w `rounds` rundach. `setup()` (poza pomiarem) zwraca
+        argumenty dla `func`, a `teardown(wynik)` sprząta po każdej rundzie.
+        """
+        timings = []
+        total_rounds = rounds or self.rounds
+        for round_number in range(total_rounds + (1 if self.warmup else 0)):
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            result = func(*args)
+            elapsed = time.perf_counter() - start
+            if teardown:
+                teardown(result)
+            if self.warmup and round_number == 0:
+                continue
+            timings.append(elapsed)
+
+        stats = {
+            'min': min(timings),
+            'max': max(timings),
+            'mean': statistics.mean(timings),
+            'median': statistics.median(timings),
+            'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            'rounds': len(timings),
+            'data': timings,
+        }
+        self.results.append({
+            'group': group,
+            'name': name,
+            'fullname': f'{group}::{name}',
+            'params': params,
+            'stats': stats,
+        })
+        return stats
+
+    def report(self):
+        return {
+            'machine_info': machine_info(),
+            'datetime': timezone.now().isoformat(),
+            'benchmarks': self.results,
+        }
+
+
+def _superuser_client():
+    user, _ = get_user_model().objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True, 'is_superuser': True, 'email': 'benchmark@example.com'}
+    )
+    client = Client()
+    client.force_login(user)
+    return user, client
+
+
+def _consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _upload(path, title):
+    uploaded_file = UploadedFile(title=title, file_type='csv')
+    with open(path, 'rb') as f:
+        uploaded_file.file.save(os.path.basename(path), File(f), save=False)
+    return uploaded_file
+
+
+def parcels_file(workdir, rows):
+    """Plik z `rows` działkami w katalogu roboczym - generowany raz na przebieg"""
+    path = os.path.join(workdir, f'parcels_{rows}.csv')
+    if not os.path.exists(path):
+        generate_parcels_csv(path, rows)
+    return path
+
+
+def ingestion_suite(bench, workdir, sizes):
+    """UploadedFile.save() dla plików 10k/100k/1M wierszy"""
+    for rows in sizes:
+        path = parcels_file(workdir, rows)
+
+        counter = iter(range(1_000_000))
+        bench.run(
+            'ingestion', f'uploaded_file_save[{rows}]',
+            lambda uploaded_file: uploaded_file.save() or uploaded_file,
+            setup=lambda: (_upload(path, f'bench_parcels_{rows}_{next(counter)}'),),
+            teardown=lambda uploaded_file: uploaded_file.delete(),
+            rows=rows,
+        )
+
+
+def tree_suite(bench, workdir, sizes):
+    """Drzewo sekcji: budowa z bazy, odpowiedź z pustym cache i z ETagiem (304)"""
+    sections, folders, files = TREE_SHAPE
+    user, client = _superuser_client()
+    Section.objects.filter(user=user).delete()
+
+    section_objects = Section.objects.bulk_create(
+        Section(user=user, name=f'Sekcja {s}', order=s) for s in range(sections)
+    )
+    folder_objects = Folder.objects.bulk_create(
+        Folder(section=section, name=f'Folder {f}', order=f) for section in section_objects for f in range(folders)
+    )
+    FileRecord.objects.bulk_create(
+        FileRecord(folder=folder, name=f'plik_{n}.geojson', file_type='geojson', order=n)
+        for folder in folder_objects for n in range(files)
+    )
+    nodes = sections * folders * (files + 1) + sections
+    url = reverse('section-tree')
+
+    bench.run('tree', 'build_tree', lambda: build_tree(user), nodes=nodes)
+
+    def invalidate():
+        invalidate_user_tree(user.pk)
+        return ()
+
+    bench.run('tree', 'section_tree[cold]', lambda: _consume(client.get(url)), setup=invalidate, nodes=nodes)
+
+    etag = client.get(url)['ETag']
+    bench.run('tree', 'section_tree[304]', lambda: client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+              nodes=nodes)
+
+    Section.objects.filter(user=user).delete()
+
+
+def tables_suite(bench, workdir, sizes):
+    """DatabaseTable.get_all_tables() i lista tabel w adminie przy wielu tabelach"""
+    _, client = _superuser_client()
+    tables = MANY_TABLES
+    names = [f'bench_table_{n}' for n in range(tables)]
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {name} (id serial PRIMARY KEY, value text)')
+            cursor.execute(f"INSERT INTO {name} (value) SELECT 'wartość ' || g FROM generate_series(1, 100) g")
+        cursor.execute('ANALYZE')
+
+    bench.run('tables', 'get_all_tables', lambda: len(list(DatabaseTable.get_all_tables())), tables=tables)
+    url = reverse('admin:core_app_databasetable_changelist')
+    bench.run('tables', 'admin_changelist', lambda: _consume(client.get(url)), tables=tables)
+
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f'DROP TABLE IF EXISTS {name}')
+
+
+def admin_suite(bench, workdir, sizes):
+    """Podglądy w adminie: tabela (HTML), plik CSV i eksport całej tabeli"""
+    _, client = _superuser_client()
+    for rows in sizes:
+        uploaded_file = _upload(parcels_file(workdir, rows), f'bench_admin_{rows}')
+        uploaded_file.save()
+
+        previews = {
+            'view_table': reverse('admin:view-table-content', args=[uploaded_file.table_name]),
+            'export_csv': reverse('admin:export-table-csv', args=[uploaded_file.table_name]),
+            'view_csv': reverse('admin:view-csv', args=[uploaded_file.pk]),
+        }
+        def invalidate():
+            # Nowa wersja tabeli w każdej rundzie - bez 304 z ETagu
+            bump_table_version(uploaded_file.table_name)
+            return ()
+
+        for name, url in previews.items():
+            bench.run('admin', f'{name}[{rows}]', lambda url=url: _consume(client.get(url)),
+                      setup=invalidate, rows=rows)
+
+        uploaded_file.delete()
+
+
+SUITES = {
+    'ingestion': ingestion_suite,
+    'tree': tree_suite,
+    'tables': tables_suite,
+    'admin': admin_suite,
+}
@@ -0,0 +1,286 @@
+"""
+Wersjonowany cache odpowiedzi dla danych z tabel użytkowników.
+
+Wpisy są kluczowane nazwą tabeli i jej wersją, podbijaną przy każdej
+zmianie tabeli (UploadedFile.save/delete, usunięcie tabeli w adminie).
+Wersje trzymane są w PostgreSQL (CacheVersion), więc podbicie widzą
+wszystkie procesy i instancje; odczytana wersja jest pamiętana przez
+VERSION_TTL sekund, żeby trafienia w cache nie pytały bazy.
+Przed magazynem na dysku (RESPONSE_CACHE_ROOT) stoi pamięciowy LRU, więc
+powtarzane odczyty nie dotykają PostgreSQL. Magazyn na dysku ma limit
+RESPONSE_CACHE_MAX_BYTES - po jego przekroczeniu usuwane są wpisy najdawniej
+używane.
+
+Klucze budowane są przez cache_key() z już sparsowanych parametrów, nigdy
+z surowego query stringu - dowolne dodatkowe parametry nie tworzą nowych wpisów.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+_TABLE_NAME_RE = re.compile(r'\w+')
+
+# Przegląd katalogu po zapisaniu tej części limitu - inne procesy też zapisują wpisy
+PRUNE_EVERY_FRACTION = 16
+# Przycinanie schodzi do tej części limitu, żeby nie przeglądać katalogu przy każdym zapisie
+PRUNE_TARGET_FRACTION = 0.75
+
+# Jak długo proces ufa odczytanej wersji - o tyle może spóźnić się unieważnienie z innej instancji
+VERSION_TTL = 2.0
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+class CacheEntry:
+    def __init__(self, etag, content_type, body):
+        self.etag = etag
+        self.content_type = content_type
+        self.body = body
+
+
+def cache_key(kind, **params):
+    """Klucz wpisu: rodzaj odpowiedzi i sparsowane parametry w stałej kolejności"""
+    return f'{kind}:{json.dumps(params, sort_keys=True, separators=(",", ":"))}'
+
+
+def _remember_version(name, version):
+    with _versions_lock:
+        previous = _versions.get(name)
+        _versions[name] = (version, time.monotonic())
+    # Inna instancja podbiła wersję - lokalne wpisy starej wersji nie będą już czytane
+    if previous is not None and previous[0] != version:
+        response_cache.clear_table(name)
+
+
+def get_table_version(table_name, max_age=VERSION_TTL):
+    """Wersja tabeli (albo innej przestrzeni nazw), odczytana z bazy najwyżej `max_age` sekund temu"""
+    with _versions_lock:
+        remembered = _versions.get(table_name)
+    if remembered is not None and time.monotonic() - remembered[1] < max_age:
+        return remembered[0]
+
+    from .models import CacheVersion
+    version = CacheVersion.objects.filter(name=table_name).values_list('version', flat=True).first() or 0
+    _remember_version(table_name, version)
+    return version
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _touch(path):
+    # Znacznik czasu z zegara o pełnej rozdzielczości - czas w i-węźle bywa zaokrąglany do ticku jądra
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def bump_table_version(table_name):
+    """Unieważnienie wszystkich odpowiedzi zbudowanych z danej tabeli"""
+    from .models import CacheVersion
+    # Jedno polecenie - współbieżne podbicia z różnych procesów się nie gubią
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {CacheVersion._meta.db_table} (name, version) VALUES (%s, 1)
+            ON CONFLICT (name) DO UPDATE SET version = {CacheVersion._meta.db_table}.version + 1
+            RETURNING version
+        """, [table_name])
+        version = cursor.fetchone()[0]
+    _remember_version(table_name, version)
+    response_cache.clear_table(table_name)
+    logger.info(f"Table {table_name} cache version bumped to {version}")
+    return version
+
+
+class ResponseCache:
+    """LRU w pamięci przed magazynem plików na dysku"""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._written = 0
+
+    @property
+    def root(self):
+        # Nie 'entries' - tam leżą wpisy z wersjami z plików, które mogłyby pokryć się z wersjami z bazy
+        return os.path.join(settings.RESPONSE_CACHE_ROOT, 'tables')
+
+    @property
+    def max_bytes(self):
+        return settings.RESPONSE_CACHE_MAX_BYTES
+
+    def _path(self, table_name, version, key):
+        # Sól z SECRET_KEY - nazwy plików nie są przewidywalne, nawet gdyby katalog był dostępny z zewnątrz
+        digest = hashlib.sha256(f'{settings.SECRET_KEY}:{key}'.encode()).hexdigest()
+        return os.path.join(self.root, table_name, str(version), digest)
+
+    def get(self, table_name, version, key):
+        memory_key = (table_name, version, key)
+        with self._lock:
+            entry = self._memory.get(memory_key)
+            if entry is not None:
+                self._memory.move_to_end(memory_key)
+                return entry
+
+        path = self._path(table_name, version, key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                entry = CacheEntry(header['etag'], header['content_type'], f.read())
+            # Czas modyfikacji służy jako czas ostatniego użycia przy przycinaniu
+            _touch(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self._remember(memory_key, entry)
+        return entry
+
+    def set(self, table_name, version, key, content_type, body):
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        entry = CacheEntry(etag, content_type, body)
+
+        header = json.dumps({'etag': etag, 'content_type': content_type}).encode()
+        data = header + b'\n' + body
+        if len(data) <= self.max_bytes * PRUNE_TARGET_FRACTION:
+            path = self._path(table_name, version, key)
+            try:
+                _atomic_write(path, data)
+                _touch(path)
+            except OSError as e:
+                logger.error(f"Error writing cache entry for {table_name}: {str(e)}")
+            else:
+                self._account(len(data))
+
+        self._remember((table_name, version, key), entry)
+        return entry
+
+    def _account(self, size):
+        with self._lock:
+            self._written += size
+            if self._written < self.max_bytes // PRUNE_EVERY_FRACTION:
+                return
+            self._written = 0
+        self.prune()
+
+    def prune(self):
+        """
+        Usuwa najdawniej używane wpisy z dysku, gdy razem przekraczają
+        max_bytes. Zwraca liczbę usuniętych plików.
+        """
+        files = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        target = self.max_bytes * PRUNE_TARGET_FRACTION
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        logger.info(f"Response cache pruned: {removed} entries removed, {total} bytes left")
+        return removed
+
+    def _remember(self, memory_key, entry):
+        with self._lock:
+            self._memory[memory_key] = entry
+            self._memory.move_to_end(memory_key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def clear_table(self, table_name):
+        with self._lock:
+            for memory_key in [k for k in self._memory if k[0] == table_name]:
+                del self._memory[memory_key]
+        shutil.rmtree(os.path.join(self.root, table_name), ignore_errors=True)
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MEMORY_ITEMS)
+
+
+def cached_table_response(request, table_name, key, render, max_age=VERSION_TTL):
+    """
+    Odpowiedź z cache dla tabeli `table_name`, z silnym ETagiem i obsługą
+    If-None-Match. `render()` buduje odpowiedź przy braku wpisu; cache'owane
+    są tylko odpowiedzi 200. `max_age` - jak stara może być odczytana wersja.
+    """
+    if not _TABLE_NAME_RE.fullmatch(table_name or ''):
+        return render()
+
+    version = get_table_version(table_name, max_age)
+    entry = response_cache.get(table_name, version, key)
+
+    if entry is None:
+        with span('build'):
+            response = render()
+        if response.status_code != 200 or response.streaming:
+            return response
+        entry = response_cache.set(table_name, version, key, response['Content-Type'], response.content)
+
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if entry.etag in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry.body, content_type=entry.content_type)
+    response['ETag'] = entry.etag
+    return response
+
+
+def streaming_table_response(request, table_name, key, render):
+    """
+    Odpowiedź strumieniowa dla tabeli `table_name`. Treść nie trafia do cache,
+    ale słaby ETag wynika z wersji tabeli, więc przy niezmienionej tabeli
+    If-None-Match daje 304 bez czytania wierszy.
+    """
+    if not _TABLE_NAME_RE.fullmatch(table_name or ''):
+        return render()
+
+    version = get_table_version(table_name)
+    digest = hashlib.sha256(f'{settings.SECRET_KEY}:{table_name}:{version}:{key}'.encode()).hexdigest()
+    etag = f'W/"{digest[:32]}"'
+
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    else:
+        response = render()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    return response
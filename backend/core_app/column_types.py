@@ -0,0 +1,186 @@
+import logging
+import re
+from datetime import datetime
+from functools import partial
+
+from .geometry import DEFAULT_SRID, detect_srid, geometry_type, geometry_type_srid, is_geometry_type, parse_geometry
+
+logger = logging.getLogger(__name__)
+
+# Liczba początkowych wierszy, na podstawie których zgadujemy typy kolumn
+INFER_SAMPLE_ROWS = 1000
+
+INTEGER = 'INTEGER'
+BIGINT = 'BIGINT'
+NUMERIC = 'NUMERIC'
+DATE = 'DATE'
+BOOLEAN = 'BOOLEAN'
+TEXT = 'TEXT'
+
+_INTEGER_RE = re.compile(r'^[+-]?(0|[1-9]\d*)$')
+# Separator tysięcy jako spacja, część dziesiętna po przecinku lub kropce, opcjonalna waluta
+_NUMERIC_RE = re.compile(r'^([+-]?(?:0|[1-9]\d*|[1-9]\d{0,2}(?:[ \xa0]\d{3})+)(?:[.,]\d+)?)\s*(?:zł|PLN)?$',
+                         re.IGNORECASE)
+_DATE_FORMATS = ['%Y/%m/%d', '%Y-%m-%d', '%d.%m.%Y']
+_TRUE_VALUES = {'true', 't', 'yes', 'tak', 'prawda'}
+_FALSE_VALUES = {'false', 'f', 'no', 'nie', 'fałsz'}
+
+
+def _parse_integer(value, low=-2 ** 31, high=2 ** 31 - 1):
+    value = value.strip()
+    if not _INTEGER_RE.match(value):
+        raise ValueError(value)
+    number = int(value)
+    if not low <= number <= high:
+        raise ValueError(value)
+    return str(number)
+
+
+def _parse_bigint(value):
+    return _parse_integer(value, -2 ** 63, 2 ** 63 - 1)
+
+
+def _parse_numeric(value):
+    match = _NUMERIC_RE.match(value.strip())
+    if not match:
+        raise ValueError(value)
+    return match.group(1).replace(' ', '').replace('\xa0', '').replace(',', '.')
+
+
+def _parse_date(value):
+    value = value.strip()
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+def _parse_boolean(value):
+    value = value.strip().lower()
+    if value in _TRUE_VALUES:
+        return 't'
+    if value in _FALSE_VALUES:
+        return 'f'
+    raise ValueError(value)
+
+
+PARSERS = {
+    BOOLEAN: _parse_boolean,
+    INTEGER: _parse_integer,
+    BIGINT: _parse_bigint,
+    NUMERIC: _parse_numeric,
+    DATE: _parse_date,
+}
+
+# Kolejność sprawdzania typów przy zgadywaniu - od najwęższego
+INFERENCE_ORDER = [BOOLEAN, INTEGER, BIGINT, NUMERIC, DATE]
+
+# Typy, na które poszerzamy kolumnę, gdy wartość nie pasuje do zgadniętego typu
+FALLBACKS = {
+    INTEGER: [BIGINT, NUMERIC, TEXT],
+    BIGINT: [NUMERIC, TEXT],
+    NUMERIC: [TEXT],
+    DATE: [TEXT],
+    BOOLEAN: [TEXT],
+}
+
+
+def get_parser(column_type):
+    if is_geometry_type(column_type):
+        return partial(parse_geometry, srid=geometry_type_srid(column_type))
+    return PARSERS[column_type]
+
+
+def _accepts(column_type, value):
+    if column_type == TEXT:
+        return True
+    try:
+        get_parser(column_type)(value)
+        return True
+    except ValueError:
+        return False
+
+
+def infer_column_type(values):
+    """Najwęższy typ pasujący do wszystkich niepustych wartości z próbki"""
+    values = [value for value in values if value is not None and value.strip()]
+    if not values:
+        return TEXT
+
+    # Geometria (WKT, (E)WKB w hex, GeoJSON) w układzie z pierwszej wartości, która go podaje
+    srid = next((s for s in map(detect_srid, values) if s), DEFAULT_SRID)
+    if all(_accepts(geometry_type(srid), value) for value in values):
+        return geometry_type(srid)
+
+    for column_type in INFERENCE_ORDER:
+        if all(_accepts(column_type, value) for value in values):
+            return column_type
+    return TEXT
+
+
+def infer_column_types(sample, width):
+    return [infer_column_type(row[idx] for row in sample) for idx in range(width)]
+
+
+class TypedRows:
+    """
+    Konwersja wierszy tekstowych do postaci zgodnej z typami kolumn.
+
+    Jeśli wartość spoza próbki nie pasuje do typu kolumny, kolumna jest
+    poszerzana (ALTER TABLE) do pierwszego typu z FALLBACKS, który ją przyjmie.
+    Kolumny poszerzone do TEXT nadal normalizują wartości zgodne z pierwotnym
+    typem, żeby dane w kolumnie pozostały spójne.
+    """
+
+    def __init__(self, cursor, table_name, columns, column_types, rows):
+        self.cursor = cursor
+        self.table_name = table_name
+        self.columns = columns
+        self.column_types = list(column_types)
+        self.inferred_types = list(column_types)
+        self.parsers = [None if t == TEXT else get_parser(t) for t in column_types]
+        self.inferred_parsers = list(self.parsers)
+        self.rows = rows
+
+    def __iter__(self):
+        for row in self.rows:
+            yield [self._convert(idx, value) for idx, value in enumerate(row)]
+
+    def _convert(self, idx, value):
+        column_type = self.column_types[idx]
+        inferred_type = self.inferred_types[idx]
+
+        if inferred_type == TEXT:
+            return value
+        if value is None or not value.strip():
+            return None
+
+        if column_type != TEXT:
+            try:
+                return self.parsers[idx](value)
+            except ValueError:
+                column_type = self.widen(idx, value)
+
+        try:
+            return self.inferred_parsers[idx](value)
+        except ValueError:
+            return value if column_type == TEXT else self.parsers[idx](value)
+
+    def widen(self, idx, value):
+        """Poszerzenie kolumny `idx` do pierwszego typu z FALLBACKS, który przyjmie `value`; zwraca typ kolumny"""
+        column = self.columns[idx]
+        if _accepts(self.column_types[idx], value):
+            # Kolumna już poszerzona - np. zakres z równoległego parsowania sparsowany przed poszerzeniem
+            return self.column_types[idx]
+        new_type = next(t for t in FALLBACKS.get(self.column_types[idx], [TEXT]) if _accepts(t, value))
+
+        logger.warning(f"Column {column} in {self.table_name}: value {value!r} does not fit "
+                       f"{self.column_types[idx]}, widening to {new_type}")
+        self.cursor.execute(
+            f'ALTER TABLE {self.table_name} ALTER COLUMN {column} TYPE {new_type} USING {column}::{new_type}'
+        )
+        self.column_types[idx] = new_type
+        self.parsers[idx] = None if new_type == TEXT else get_parser(new_type)
+        return new_type
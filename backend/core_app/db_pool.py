@@ -0,0 +1,46 @@
+"""
+Stan puli połączeń PostgreSQL (psycopg_pool przez OPTIONS['pool'] w Django 5.1).
+
+Liczniki z ConnectionPool.get_stats() są narastające od startu procesu;
+każdy proces gunicorna ma własną pulę, więc wartości dotyczą jednego procesu.
+"""
+import time
+
+from django.db import connections
+
+# Klucze get_stats() publikowane na zewnątrz - reszta zależy od wersji psycopg_pool
+POOL_STATS = {
+    'pool_min': 'Minimalny rozmiar puli',
+    'pool_max': 'Maksymalny rozmiar puli',
+    'pool_size': 'Połączenia otwarte przez pulę',
+    'pool_available': 'Połączenia wolne w puli',
+    'requests_waiting': 'Żądania czekające teraz na połączenie',
+    'requests_num': 'Pobrania połączenia z puli',
+    'requests_queued': 'Pobrania, które musiały czekać',
+    'requests_wait_ms': 'Łączny czas oczekiwania na połączenie (ms)',
+    'requests_errors': 'Pobrania zakończone błędem lub przekroczeniem czasu',
+    'usage_ms': 'Łączny czas użycia połączeń (ms)',
+    'connections_num': 'Nawiązane połączenia z bazą',
+    'connections_ms': 'Łączny czas nawiązywania połączeń (ms)',
+    'connections_errors': 'Nieudane próby połączenia',
+    'connections_lost': 'Połączenia odrzucone przez sprawdzenie stanu',
+    'returns_bad': 'Połączenia zwrócone w złym stanie',
+}
+
+
+def pool_stats(alias='default'):
+    """Liczniki puli połączeń albo None, gdy pula jest wyłączona"""
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    return {key: stats.get(key, 0) for key in POOL_STATS}
+
+
+def check_database(alias='default'):
+    """Czas (ms) prostego zapytania do bazy; wyjątek, gdy baza nie odpowiada"""
+    start = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return (time.perf_counter() - start) * 1000
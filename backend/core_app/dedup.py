@@ -0,0 +1,49 @@
+"""
+Deduplikacja przesyłanych plików po treści.
+
+Sha256UploadHandler (pierwszy w FILE_UPLOAD_HANDLERS) liczy SHA-256
+każdego pliku z formularza w trakcie odbierania danych, zanim plik trafi
+do pamięci albo pliku tymczasowego. Plik o znanym już skrócie nie jest
+ponownie zapisywany w storage ani importowany - nowy rekord wskazuje na
+istniejący plik i tabelę (UploadedFile.find_original).
+"""
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+_READ_CHUNK = 1024 * 1024
+
+
+class Sha256UploadHandler(FileUploadHandler):
+    """Skrót SHA-256 przesyłanych plików; dane przekazuje dalej bez zmian"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_sha256'):
+            self.request.upload_sha256 = {}
+        self.request.upload_sha256[self.field_name] = self.digest.hexdigest()
+        return None
+
+
+def uploaded_sha256(request, field_name):
+    """Skrót pliku z pola formularza policzony przy odbieraniu żądania (albo None)"""
+    return getattr(request, 'upload_sha256', {}).get(field_name)
+
+
+def file_sha256(file):
+    """SHA-256 otwartego pliku (File, UploadedFile albo plik z storage), od początku"""
+    digest = hashlib.sha256()
+    if hasattr(file, 'chunks'):
+        for chunk in file.chunks(_READ_CHUNK):
+            digest.update(chunk)
+    else:
+        while data := file.read(_READ_CHUNK):
+            digest.update(data)
+    return digest.hexdigest()
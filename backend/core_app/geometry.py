@@ -0,0 +1,171 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Układ współrzędnych przyjmowany, gdy plik nie zawiera informacji o SRID
+DEFAULT_SRID = 4326
+
+GEOMETRY = 'geometry'
+
+# Układy, w których GML w zapisie URN/HTTP podaje współrzędne w kolejności (y, x)
+LAT_LON_FIRST_SRIDS = {4326, 2180}
+
+_SRID_PREFIX_RE = re.compile(r'^SRID=(\d+);', re.IGNORECASE)
+_HEX_WKB_RE = re.compile(r'^0[01][0-9A-Fa-f]{40,}$')
+_WKT_RE = re.compile(
+    r'^(POINT|LINESTRING|POLYGON|MULTIPOINT|MULTILINESTRING|MULTIPOLYGON|GEOMETRYCOLLECTION|'
+    r'CIRCULARSTRING|COMPOUNDCURVE|CURVEPOLYGON|MULTICURVE|MULTISURFACE|POLYHEDRALSURFACE|TIN|TRIANGLE)'
+    r'\s*(Z|M|ZM)?\s*(\(|EMPTY)',
+    re.IGNORECASE
+)
+_EPSG_RE = re.compile(r'EPSG(?:::?|/\d+/|\.xml#)(\d+)', re.IGNORECASE)
+_WKB_SRID_FLAG = 0x20000000
+
+
+def geometry_type(srid):
+    return f'{GEOMETRY}(Geometry, {srid})'
+
+
+def is_geometry_type(column_type):
+    return column_type.startswith(GEOMETRY)
+
+
+def geometry_type_srid(column_type):
+    return int(column_type.rsplit(',', 1)[1].strip(' )'))
+
+
+def srid_from_name(name):
+    """SRID z nazwy układu (EPSG:2180, urn:ogc:def:crs:EPSG::2180, .../EPSG/0/2180)"""
+    match = _EPSG_RE.search(name or '')
+    return int(match.group(1)) if match else None
+
+
+def _hex_wkb_srid(value):
+    """SRID zapisany w nagłówku EWKB albo None"""
+    header = bytes.fromhex(value[:18])
+    byteorder = 'little' if header[0] == 1 else 'big'
+    geom_type = int.from_bytes(header[1:5], byteorder)
+    if (geom_type & 0x0FFFFFFF) % 1000 not in range(1, 18):
+        raise ValueError(value[:18])
+    if geom_type & _WKB_SRID_FLAG:
+        return int.from_bytes(header[5:9], byteorder)
+    return None
+
+
+def detect_srid(value):
+    """SRID zapisany w samej wartości geometrii (EWKT/EWKB) albo None"""
+    value = value.strip()
+    match = _SRID_PREFIX_RE.match(value)
+    if match:
+        return int(match.group(1))
+    if len(value) % 2 == 0 and _HEX_WKB_RE.match(value):
+        try:
+            return _hex_wkb_srid(value)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_geometry(value, srid):
+    """
+    Normalizacja geometrii WKT/EWKT, (E)WKB w hex lub GeoJSON do postaci
+    akceptowanej przez typ geometry PostGIS z podanym SRID.
+    """
+    value = value.strip()
+    embedded_srid = None
+    match = _SRID_PREFIX_RE.match(value)
+    if match:
+        embedded_srid = int(match.group(1))
+        value = value[match.end():].strip()
+
+    if value.startswith('{'):
+        try:
+            value = geojson_to_wkt(json.loads(value))
+        except (AttributeError, TypeError) as e:
+            raise ValueError(str(e))
+    elif len(value) % 2 == 0 and _HEX_WKB_RE.match(value):
+        wkb_srid = _hex_wkb_srid(value)
+        if wkb_srid is not None:
+            if wkb_srid != srid:
+                raise ValueError(f'SRID {wkb_srid} != {srid}')
+            return value
+    elif not _WKT_RE.match(value):
+        raise ValueError(value[:30])
+
+    if embedded_srid is not None and embedded_srid != srid:
+        raise ValueError(f'SRID {embedded_srid} != {srid}')
+    return f'SRID={srid};{value}'
+
+
+def _position(coordinates):
+    return ' '.join(repr(float(c)) for c in coordinates)
+
+
+def _positions(coordinates):
+    return f"({', '.join(_position(c) for c in coordinates)})"
+
+
+def _rings(rings):
+    return f"({', '.join(_positions(ring) for ring in rings)})"
+
+
+def geojson_to_wkt(geometry):
+    """Zamiana geometrii GeoJSON (dict) na WKT"""
+    geom_type = geometry.get('type')
+
+    if geom_type == 'GeometryCollection':
+        members = geometry.get('geometries') or []
+        if not members:
+            return 'GEOMETRYCOLLECTION EMPTY'
+        return f"GEOMETRYCOLLECTION({', '.join(geojson_to_wkt(g) for g in members)})"
+
+    coordinates = geometry.get('coordinates')
+    if geom_type not in ('Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon'):
+        raise ValueError(f'Nieobsługiwany typ geometrii: {geom_type}')
+    if not coordinates:
+        return f'{geom_type.upper()} EMPTY'
+
+    if geom_type == 'Point':
+        return f'POINT({_position(coordinates)})'
+    if geom_type == 'MultiPoint':
+        return f"MULTIPOINT({', '.join(f'({_position(c)})' for c in coordinates)})"
+    if geom_type == 'LineString':
+        return f'LINESTRING{_positions(coordinates)}'
+    if geom_type == 'MultiLineString':
+        return f'MULTILINESTRING{_rings(coordinates)}'
+    if geom_type == 'Polygon':
+        return f'POLYGON{_rings(coordinates)}'
+    return f"MULTIPOLYGON({', '.join(_rings(polygon) for polygon in coordinates)})"
+
+
+def collect_geometries(geometries):
+    """Połączenie geometrii w Multi* (jeśli są jednego typu) lub GeometryCollection"""
+    geometries = [g for g in geometries if g]
+    if not geometries:
+        return None
+    if len(geometries) == 1:
+        return geometries[0]
+
+    types = {g['type'] for g in geometries}
+    if len(types) == 1 and types <= {'Point', 'LineString', 'Polygon'}:
+        return {'type': f'Multi{types.pop()}', 'coordinates': [g['coordinates'] for g in geometries]}
+    return {'type': 'GeometryCollection', 'geometries': geometries}
+
+
+def to_ewkt(geometry, srid):
+    if geometry is None:
+        return None
+    return f'SRID={srid};{geojson_to_wkt(geometry)}'
+
+
+def ensure_postgis(cursor):
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+
+
+def create_spatial_index(cursor, table_name, column):
+    """Indeks GiST budowany jednorazowo po zakończeniu ładowania"""
+    cursor.execute(f'CREATE INDEX {table_name}_{column}_gist ON {table_name} USING GIST ({column})')
+    cursor.execute(f'ANALYZE {table_name}')
+    logger.info(f"Created GiST index on {table_name}.{column}")
@@ -0,0 +1,260 @@
+"""
+Doradca indeksów dla tabel z importu.
+
+Propozycje wynikają z ruchu zapytań (pg_stat_statements, jeśli rozszerzenie
+jest dostępne) oraz z kardynalności kolumn w pg_stats. Indeksy są budowane
+przez CREATE INDEX CONCURRENTLY i zapisywane w TableIndex, dzięki czemu
+nieużywane indeksy założone przez doradcę można później usunąć.
+"""
+import hashlib
+import logging
+import re
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import TableIndex, UploadedFile
+
+logger = logging.getLogger(__name__)
+
+# Minimalna liczba wywołań zapytania, żeby uznać je za rzeczywisty ruch
+MIN_QUERY_CALLS = 50
+
+# Kolumny o mniejszej liczbie różnych wartości nie dostają indeksu B-tree
+MIN_DISTINCT_VALUES = 20
+
+# Bez danych o ruchu indeksujemy tylko kolumny prawie unikalne (identyfikatory)
+NATURAL_KEY_DISTINCT_RATIO = 0.9
+
+# Indeks doradcy, którego licznik odczytów nie zmienił się przez ten czas, jest usuwany
+UNUSED_INDEX_AGE = timedelta(days=7)
+
+Proposal = namedtuple('Proposal', ['column', 'method', 'reason'])
+
+_WHERE_RE = re.compile(r'\bWHERE\b(.*?)(?:\bORDER\s+BY\b|\bLIMIT\b|\bGROUP\s+BY\b|$)', re.IGNORECASE | re.DOTALL)
+_ORDER_BY_RE = re.compile(r'\bORDER\s+BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|$)', re.IGNORECASE | re.DOTALL)
+
+# Metoda dostępu PostgreSQL (pg_am.amname) odpowiadająca metodzie doradcy
+_ACCESS_METHODS = {
+    TableIndex.METHOD_BTREE: 'btree',
+    TableIndex.METHOD_TRIGRAM: 'gin',
+    TableIndex.METHOD_GIST: 'gist',
+}
+
+
+def index_name(table_name, column, method):
+    name = f'{table_name}_{column}_{method}'
+    if len(name) > 63:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        name = f'{name[:54]}_{digest}'
+    return name
+
+
+def get_existing_indexes(cursor, table_name):
+    """Pary (kolumna, metoda dostępu) dla pierwszych kolumn istniejących indeksów"""
+    cursor.execute("""
+        SELECT a.attname, am.amname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = ic.relam
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE n.nspname = 'public' AND c.relname = %s
+    """, [table_name])
+    return set(cursor.fetchall())
+
+
+def get_column_stats(cursor, table_name):
+    """
+    Statystyki kolumn z pg_stats: {kolumna: (typ, liczba różnych wartości, liczba wierszy)}.
+    Tabela bez statystyk jest najpierw analizowana.
+    """
+    query = """
+        SELECT c.column_name, c.udt_name, s.n_distinct, t.reltuples
+        FROM information_schema.columns c
+        JOIN pg_class t ON t.relname = c.table_name
+        JOIN pg_namespace n ON n.oid = t.relnamespace AND n.nspname = c.table_schema
+        LEFT JOIN pg_stats s ON s.schemaname = c.table_schema
+            AND s.tablename = c.table_name AND s.attname = c.column_name
+        WHERE c.table_schema = 'public' AND c.table_name = %s
+        ORDER BY c.ordinal_position
+    """
+    cursor.execute(query, [table_name])
+    rows = cursor.fetchall()
+    if rows and all(n_distinct is None for _, _, n_distinct, _ in rows):
+        cursor.execute(f'ANALYZE "{table_name}"')
+        cursor.execute(query, [table_name])
+        rows = cursor.fetchall()
+
+    stats = {}
+    for column, udt_name, n_distinct, reltuples in rows:
+        reltuples = max(reltuples or 0, 0)
+        # Ujemne n_distinct w pg_stats to ułamek liczby wierszy
+        distinct = -n_distinct * reltuples if n_distinct is not None and n_distinct < 0 else n_distinct
+        stats[column] = (udt_name, distinct, reltuples)
+    return stats
+
+
+def get_query_traffic(cursor, table_name, columns):
+    """
+    Liczba wywołań zapytań z pg_stat_statements używających kolumn tabeli:
+    {(kolumna, metoda): wywołania}. Pusty słownik, gdy rozszerzenia nie ma.
+    """
+    cursor.execute("SELECT EXISTS (SELECT FROM pg_extension WHERE extname = 'pg_stat_statements')")
+    if not cursor.fetchone()[0]:
+        return {}
+
+    cursor.execute("""
+        SELECT query, calls
+        FROM pg_stat_statements
+        WHERE query LIKE %s
+    """, [f'%"{table_name}"%'])
+
+    traffic = {}
+    for query, calls in cursor.fetchall():
+        where = _WHERE_RE.search(query)
+        order_by = _ORDER_BY_RE.search(query)
+        for column in columns:
+            quoted = re.escape(f'"{column}"')
+            if where and re.search(rf'{quoted}(::text)?\s+I?LIKE\b', where.group(1), re.IGNORECASE):
+                method = TableIndex.METHOD_TRIGRAM
+            elif where and re.search(rf'{quoted}\s*(=|<>|<|>|\bIN\b|\bBETWEEN\b)', where.group(1), re.IGNORECASE):
+                method = TableIndex.METHOD_BTREE
+            elif order_by and re.search(quoted, order_by.group(1)):
+                method = TableIndex.METHOD_BTREE
+            else:
+                continue
+            traffic[column, method] = traffic.get((column, method), 0) + calls
+    return traffic
+
+
+def propose_indexes(table_name):
+    """Indeksy, których brakuje tabeli, z uzasadnieniem"""
+    with connection.cursor() as cursor:
+        stats = get_column_stats(cursor, table_name)
+        existing = get_existing_indexes(cursor, table_name)
+        traffic = get_query_traffic(cursor, table_name, [column for column in stats if column != 'id'])
+
+    proposals = []
+    for column, (udt_name, distinct, reltuples) in stats.items():
+        if column == 'id':
+            continue
+
+        if udt_name == 'geometry':
+            candidates = [Proposal(column, TableIndex.METHOD_GIST, 'kolumna geometrii')]
+        else:
+            candidates = []
+            trigram_calls = traffic.get((column, TableIndex.METHOD_TRIGRAM), 0)
+            if udt_name == 'text' and trigram_calls >= MIN_QUERY_CALLS:
+                candidates.append(Proposal(column, TableIndex.METHOD_TRIGRAM,
+                                           f'{trigram_calls} wywołań ILIKE'))
+
+            btree_calls = traffic.get((column, TableIndex.METHOD_BTREE), 0)
+            if distinct is not None and distinct >= MIN_DISTINCT_VALUES:
+                if btree_calls >= MIN_QUERY_CALLS:
+                    candidates.append(Proposal(column, TableIndex.METHOD_BTREE,
+                                               f'{btree_calls} wywołań, ~{int(distinct)} różnych wartości'))
+                elif reltuples and distinct >= NATURAL_KEY_DISTINCT_RATIO * reltuples:
+                    candidates.append(Proposal(column, TableIndex.METHOD_BTREE, 'kolumna prawie unikalna'))
+
+        proposals += [p for p in candidates if (column, _ACCESS_METHODS[p.method]) not in existing]
+    return proposals
+
+
+def build_index(table_name, proposal):
+    """
+    Utworzenie indeksu bez blokowania zapisu do tabeli. CREATE INDEX
+    CONCURRENTLY nie może działać w transakcji, więc funkcja wymaga trybu
+    autocommit (nie wolno jej wołać wewnątrz transaction.atomic).
+    """
+    name = index_name(table_name, proposal.column, proposal.method)
+    column = f'"{proposal.column}"'
+    if proposal.method == TableIndex.METHOD_TRIGRAM:
+        using = f'gin ({column} gin_trgm_ops)'
+    else:
+        using = f'{_ACCESS_METHODS[proposal.method]} ({column})'
+
+    with connection.cursor() as cursor:
+        if proposal.method == TableIndex.METHOD_TRIGRAM:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        try:
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table_name}" USING {using}')
+        except Exception:
+            # Przerwane CREATE INDEX CONCURRENTLY zostawia nieprawidłowy indeks
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+            raise
+
+    TableIndex.objects.update_or_create(
+        index_name=name,
+        defaults={'table_name': table_name, 'column_name': proposal.column,
+                  'method': proposal.method, 'reason': proposal.reason}
+    )
+    logger.info(f"Created {proposal.method} index {name} on {table_name}.{proposal.column} ({proposal.reason})")
+    return name
+
+
+def advise_table(table_name, build=True):
+    """
+    Propozycje indeksów dla tabeli. Przy build=True indeksy są od razu
+    tworzone, a wynik zawiera tylko te, które udało się zbudować.
+    """
+    proposals = propose_indexes(table_name)
+    if not build:
+        return proposals
+
+    built = []
+    for proposal in proposals:
+        try:
+            build_index(table_name, proposal)
+            built.append(proposal)
+        except Exception as e:
+            logger.error(f"Error creating index on {table_name}.{proposal.column}: {str(e)}")
+    return built
+
+
+def drop_unused_indexes(min_age=UNUSED_INDEX_AGE, dry_run=False):
+    """
+    Usunięcie indeksów doradcy, z których nikt nie czytał od `min_age`.
+
+    idx_scan liczy odczyty od ostatniego resetu statystyk, więc każde
+    wywołanie zapisuje jego wartość, a indeks jest usuwany dopiero wtedy,
+    gdy licznik nie zmienił się przez `min_age` od poprzedniej zmiany (reset
+    statystyk też jest zmianą i zaczyna okno od nowa). Pierwsze wywołanie
+    tylko zapamiętuje liczniki; `dry_run` niczego nie zapisuje.
+    """
+    candidates = list(TableIndex.objects.all())
+    if not candidates:
+        return []
+
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT indexrelname, idx_scan
+            FROM pg_stat_user_indexes
+            WHERE schemaname = 'public' AND indexrelname = ANY(%s)
+        """, [[index.index_name for index in candidates]])
+        scans = dict(cursor.fetchall())
+
+        dropped = []
+        for index in candidates:
+            idx_scan = scans.get(index.index_name, 0)
+            if index.idx_scan != idx_scan or index.idx_scan_changed_at is None:
+                if not dry_run:
+                    index.idx_scan, index.idx_scan_changed_at = idx_scan, now
+                    index.save(update_fields=['idx_scan', 'idx_scan_changed_at'])
+                continue
+            if index.idx_scan_changed_at > now - min_age:
+                continue
+            if not dry_run:
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.index_name}"')
+                index.delete()
+                logger.info(f"Dropped unused index {index.index_name}")
+            dropped.append(index.index_name)
+    return dropped
+
+
+def uploaded_tables():
+    return list(UploadedFile.objects.exclude(table_name='').values_list('table_name', flat=True))
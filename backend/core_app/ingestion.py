@@ -0,0 +1,125 @@
+import io
+import logging
+import resource
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Liczba wierszy wysyłanych do PostgreSQL w jednym poleceniu COPY
+COPY_CHUNK_SIZE = 5000
+
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+class IngestStats:
+    """Statystyki pojedynczego ładowania danych"""
+
+    def __init__(self, track_memory=False):
+        self.rows = 0
+        self.chunks = 0
+        self.elapsed = 0.0
+        self.peak_memory_kb = 0
+        self.track_memory = track_memory
+        self._started = None
+
+    def start(self):
+        if self.track_memory:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self._started
+        if self.track_memory:
+            # Szczyt pamięci zaalokowanej przez Pythona w trakcie ładowania
+            self.peak_memory_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        else:
+            # Szczyt RSS całego procesu (Linux raportuje w KB)
+            self.peak_memory_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.rows / self.elapsed
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'chunks': self.chunks,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'peak_memory_kb': self.peak_memory_kb,
+        }
+
+    def __str__(self):
+        return (f"{self.rows} wierszy w {self.elapsed:.2f}s "
+                f"({self.rows_per_second:.0f} wierszy/s, szczyt pamięci {self.peak_memory_kb} KB)")
+
+
+def format_copy_value(value):
+    """Zamiana wartości na pole w formacie tekstowym COPY"""
+    if value is None:
+        return '\\N'
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def iter_csv_rows(csv_reader, headers):
+    """Wiersze CSV ograniczone do kolumn z niepustym nagłówkiem"""
+    keep = [idx for idx, header in enumerate(headers) if header]
+    width = len(headers)
+
+    for row in csv_reader:
+        if len(row) < width:
+            row = row + [None] * (width - len(row))
+        yield [row[idx] for idx in keep]
+
+
+def copy_rows(cursor, table_name, columns, rows, chunk_size=COPY_CHUNK_SIZE,
+              progress=None, track_memory=False):
+    """
+    Strumieniowe ładowanie wierszy do tabeli przez COPY ... FROM STDIN.
+
+    Wiersze są buforowane w paczkach po `chunk_size`, więc zużycie pamięci
+    nie zależy od rozmiaru pliku. `progress` (jeśli podany) jest wywoływany
+    po każdej paczce z łączną liczbą załadowanych wierszy.
+    """
+    copy_sql = f"COPY {table_name} ({', '.join(columns)}) FROM STDIN"
+    stats = IngestStats(track_memory=track_memory)
+    stats.start()
+
+    buffer = io.StringIO()
+    pending = 0
+
+    def flush():
+        with cursor.copy(copy_sql) as copy:
+            copy.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+        stats.rows += pending
+        stats.chunks += 1
+        if progress is not None:
+            progress(stats.rows)
+
+    try:
+        for row in rows:
+            buffer.write('\t'.join(map(format_copy_value, row)))
+            buffer.write('\n')
+            pending += 1
+            if pending >= chunk_size:
+                flush()
+                pending = 0
+
+        if pending:
+            flush()
+    finally:
+        stats.stop()
+
+    logger.info(f"COPY do {table_name}: {stats}")
+    return stats
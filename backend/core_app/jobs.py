@@ -0,0 +1,246 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .indexes import advise_table
+from .models import IngestionJob, UploadedFile
+from .sync import SyncError
+
+logger = logging.getLogger(__name__)
+
+# Zadanie bez sygnału życia przez ten czas uznajemy za porzucone przez workera
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+# Co tyle sekund działające zadanie odświeża heartbeat_at, niezależnie od postępu COPY
+HEARTBEAT_INTERVAL = 30
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def check_sync_target(table_name, key, file_type):
+    """
+    Tabela do synchronizacji musi pochodzić z importu pliku tego samego typu, a klucz musi być podany.
+    Bez `file_type` (typ jeszcze nieznany) zgodność typu nie jest sprawdzana.
+    """
+    if not table_name:
+        return
+    if not key:
+        raise SyncError('sync_key is required to sync an existing table')
+    uploaded_file = UploadedFile.objects.filter(table_name=table_name).first()
+    if uploaded_file is None:
+        raise SyncError(f'Table {table_name} is not an uploaded table')
+    if file_type and uploaded_file.file_type.lower() != file_type.lower():
+        raise SyncError(f'Table {table_name} was loaded from a {uploaded_file.file_type} file, not {file_type}')
+
+
+def enqueue_upload(file_path, title, file_type, sync_table='', sync_key='', sha256=''):
+    """
+    Utworzenie zadania importu dla zapisanego już pliku. Z `sync_table`
+    plik aktualizuje istniejącą tabelę (wiersze dopasowane po `sync_key`),
+    a `sha256` pozwala pominąć import pliku, którego treść już jest w bazie.
+    """
+    check_sync_target(sync_table, sync_key, file_type)
+    return IngestionJob.objects.create(file=file_path, title=title, file_type=file_type, sha256=sha256 or '',
+                                       sync_table=sync_table or '', sync_key=sync_key or '')
+
+
+def discard_partial_uploads(file_names):
+    """
+    Rekordy UploadedFile bez tabeli, zostawione przez workera, który przerwał
+    import. Sama tabela powstaje w transakcji, więc razem z workerem znika.
+    """
+    deleted, _ = UploadedFile.objects.filter(file__in=file_names, table_name='').delete()
+    if deleted:
+        logger.warning(f"Removed {deleted} partial uploads of abandoned jobs: {', '.join(file_names)}")
+
+
+def claim_next_job(name=None):
+    """Pobranie najstarszego zadania z kolejki (SKIP LOCKED pozwala na wielu workerów)"""
+    now = timezone.now()
+    stale = Q(phase=IngestionJob.PHASE_LOADING, heartbeat_at__lt=now - STALE_JOB_TIMEOUT)
+
+    with transaction.atomic():
+        # Porzucone zadanie bez kolejnych prób kończy się błędem - inaczej status pokazywałby import bez końca
+        exhausted = list(IngestionJob.objects.select_for_update(skip_locked=True)
+                         .filter(stale, attempts__gte=MAX_ATTEMPTS).values_list('pk', flat=True))
+        if exhausted:
+            logger.error(f"Ingestion jobs abandoned after {MAX_ATTEMPTS} attempts: {exhausted}")
+            IngestionJob.objects.filter(pk__in=exhausted).update(
+                phase=IngestionJob.PHASE_FAILED, finished_at=now,
+                error=f'Worker stopped responding; gave up after {MAX_ATTEMPTS} attempts',
+            )
+            discard_partial_uploads(list(IngestionJob.objects.filter(pk__in=exhausted)
+                                         .values_list('file', flat=True)))
+
+        job = (IngestionJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(Q(phase=IngestionJob.PHASE_QUEUED) | stale, attempts__lt=MAX_ATTEMPTS)
+               .order_by('created_at')
+               .first())
+        if job is None:
+            return None
+        if job.phase == IngestionJob.PHASE_LOADING:
+            # Ponowna próba po porzuconym imporcie - bez rekordu z poprzedniej
+            discard_partial_uploads([job.file.name])
+
+        job.phase = IngestionJob.PHASE_LOADING
+        job.attempts += 1
+        job.worker = name or worker_name()
+        job.rows_processed = 0
+        job.rows_per_second = 0
+        job.error = ''
+        job.started_at = now
+        job.heartbeat_at = now
+        job.save()
+
+    return job
+
+
+class JobProgress:
+    """
+    Zapis postępu zadania przez osobne połączenie z bazą.
+
+    Ingestia działa wewnątrz transaction.atomic(), więc aktualizacje wykonane
+    na głównym połączeniu nie byłyby widoczne dla endpointu statusu aż do
+    zakończenia importu.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        self._started = time.perf_counter()
+
+    def __call__(self, rows):
+        elapsed = time.perf_counter() - self._started
+        self.job.rows_processed = rows
+        self.job.rows_per_second = rows / elapsed if elapsed else 0
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {IngestionJob._meta.db_table} '
+                'SET rows_processed = %s, rows_per_second = %s, heartbeat_at = %s WHERE id = %s',
+                [self.job.rows_processed, self.job.rows_per_second, timezone.now(), self.job.id]
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class Heartbeat(threading.Thread):
+    """
+    Odświeżanie heartbeat_at zadania w tle przez cały import. Postęp COPY
+    nie wystarcza - budowa indeksów i indeksu wyszukiwania może trwać
+    dłużej niż STALE_JOB_TIMEOUT bez nowych wierszy.
+    """
+
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL):
+        super().__init__(name=f'heartbeat-{job.id}', daemon=True)
+        self.job = job
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        # Własne połączenie - połączenie Django należy do wątku, który je utworzył
+        connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            f'UPDATE {IngestionJob._meta.db_table} SET heartbeat_at = %s '
+                            'WHERE id = %s AND phase = %s',
+                            [timezone.now(), self.job.id, IngestionJob.PHASE_LOADING]
+                        )
+                except DatabaseError as e:
+                    logger.error(f"Heartbeat of ingestion job {self.job.id} failed: {str(e)}")
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """Wykonanie importu dla pobranego zadania"""
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        return _run_job(job)
+    finally:
+        heartbeat.stop()
+
+
+def _run_job(job):
+    progress = JobProgress(job)
+    if job.sync_table:
+        uploaded_file = UploadedFile.objects.filter(table_name=job.sync_table).first()
+    else:
+        uploaded_file = UploadedFile(title=job.title, file=job.file.name, file_type=job.file_type, sha256=job.sha256)
+
+    try:
+        if not job.sync_table:
+            uploaded_file.save(progress=progress)
+        elif uploaded_file is None:
+            raise SyncError(f'Table {job.sync_table} is not an uploaded table')
+        else:
+            changes = uploaded_file.sync_file(job.file.name, job.sync_key, progress=progress, sha256=job.sha256)
+            job.rows_inserted = changes.inserted
+            job.rows_updated = changes.updated
+            job.rows_deleted = changes.deleted
+    except Exception as e:
+        logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+        # Tabeli synchronizowanej nie usuwamy - błąd wycofał tylko zmiany
+        if not job.sync_table and uploaded_file.pk:
+            UploadedFile.objects.filter(pk=uploaded_file.pk).delete()
+        job.phase = IngestionJob.PHASE_FAILED
+        job.error = str(e)
+    else:
+        stats = uploaded_file.ingest_stats
+        job.phase = IngestionJob.PHASE_DONE
+        job.uploaded_file = uploaded_file
+        job.rows_processed = stats.rows
+        job.rows_per_second = stats.rows_per_second
+    finally:
+        progress.close()
+
+    job.finished_at = timezone.now()
+    job.heartbeat_at = job.finished_at
+    job.save()
+
+    # Indeksy budowane są po oznaczeniu zadania jako zakończone - tabela jest już dostępna
+    if job.phase == IngestionJob.PHASE_DONE:
+        try:
+            advise_table(uploaded_file.table_name)
+        except Exception as e:
+            logger.error(f"Index advisor failed for {uploaded_file.table_name}: {str(e)}")
+    return job
+
+
+def run_worker(poll_interval=2.0, once=False, should_stop=None):
+    """Pętla workera: pobiera i wykonuje zadania aż do zatrzymania"""
+    name = worker_name()
+    logger.info(f"Ingestion worker {name} started")
+
+    while should_stop is None or not should_stop():
+        # Worker nie przechodzi przez cykl żądania - połączenie oddajemy do puli sami
+        close_old_connections()
+        job = claim_next_job(name)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logger.info(f"Worker {name} processing job {job.id} ({job.title})")
+        run_job(job)
+
+    logger.info(f"Ingestion worker {name} stopped")
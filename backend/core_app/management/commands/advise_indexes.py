@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core_app.indexes import advise_table, drop_unused_indexes, uploaded_tables
+
+
+class Command(BaseCommand):
+    help = 'Proponuje i tworzy indeksy dla tabel z importu oraz usuwa nieużywane indeksy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append',
+                            help='Tabela do analizy (domyślnie wszystkie tabele z importu)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Tylko wypisz propozycje, bez zmian w bazie')
+        parser.add_argument('--drop-unused', action='store_true',
+                            help='Usuń nieużywane indeksy utworzone przez doradcę')
+
+    def handle(self, *args, **options):
+        build = not options['dry_run']
+
+        for table_name in options['table'] or uploaded_tables():
+            for proposal in advise_table(table_name, build=build):
+                self.stdout.write(f'{table_name}.{proposal.column}: {proposal.method} ({proposal.reason})')
+
+        if options['drop_unused']:
+            for index_name in drop_unused_indexes(dry_run=not build):
+                self.stdout.write(f'Nieużywany indeks: {index_name}')
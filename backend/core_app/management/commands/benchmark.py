@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from core_app.benchmarks import DEFAULT_ROUNDS, DEFAULT_SIZES, SUITES, Benchmark, generate_parcels_csv
+
+
+class Command(BaseCommand):
+    help = ('Benchmarki importu, drzewa sekcji, listy tabel i podglądów w adminie '
+            'na testowej bazie PostgreSQL; wyniki w formacie JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', action='append', choices=sorted(SUITES),
+                            help='Zestaw do uruchomienia (domyślnie wszystkie)')
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                            help='Liczba wierszy w plikach z działkami, np. 10000 100000 1000000')
+        parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help='Liczba mierzonych rund')
+        parser.add_argument('--output', help='Plik JSON z wynikami')
+        parser.add_argument('--compare', help='Plik JSON z poprzedniego przebiegu do porównania')
+        parser.add_argument('--keepdb', action='store_true', help='Nie usuwaj testowej bazy po przebiegu')
+        parser.add_argument('--generate', metavar='DIR',
+                            help='Tylko wygeneruj pliki CSV z działkami do katalogu DIR')
+        parser.add_argument('--geometry', action='store_true',
+                            help='Dodaj kolumnę geom (EWKB, EPSG:2180) do generowanych plików')
+
+    def handle(self, *args, **options):
+        if options['rounds'] < 1:
+            raise CommandError('--rounds musi być dodatnie')
+
+        if options['generate']:
+            os.makedirs(options['generate'], exist_ok=True)
+            for rows in options['sizes']:
+                path = os.path.join(options['generate'], f'parcels_{rows}.csv')
+                generate_parcels_csv(path, rows, geometry=options['geometry'])
+                self.stdout.write(path)
+            return
+
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = {result['fullname']: result for result in json.load(f)['benchmarks']}
+
+        verbosity = options['verbosity']
+        bench = Benchmark(rounds=options['rounds'])
+        # Jak w testach: osobna baza, pliki i cache w katalogu tymczasowym, bez logowania zapytań
+        # i bez manifestu plików statycznych (nie wymaga collectstatic)
+        settings.DEBUG = False
+        old_config = setup_databases(verbosity, interactive=False, keepdb=options['keepdb'])
+        try:
+            with tempfile.TemporaryDirectory() as workdir, override_settings(
+                MEDIA_ROOT=os.path.join(workdir, 'media'),
+                RESPONSE_CACHE_ROOT=os.path.join(workdir, 'cache', 'responses'),
+                STORAGES={**settings.STORAGES, 'staticfiles': {
+                    'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+                }},
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': os.path.join(workdir, 'cache', 'django'),
+                }},
+            ):
+                for name in options['suite'] or SUITES:
+                    self.stderr.write(f'Zestaw {name}...')
+                    SUITES[name](bench, workdir, options['sizes'])
+                report = bench.report()
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=options['keepdb'])
+
+        for result in report['benchmarks']:
+            stats = result['stats']
+            line = (f"{result['fullname']:40} median {stats['median'] * 1000:10.2f} ms  "
+                    f"min {stats['min'] * 1000:10.2f} ms  stddev {stats['stddev'] * 1000:8.2f} ms")
+            if previous and result['fullname'] in previous:
+                ratio = stats['median'] / previous[result['fullname']]['stats']['median']
+                line += f'  {ratio:5.2f}x poprzedniego'
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wyniki zapisane w {options['output']}"))
@@ -0,0 +1,116 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Serwery porównywane w teście: tryb deweloperski i produkcyjny z obrazu Dockera
+SERVERS = {
+    'runserver': [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:{port}'],
+}
+
+DEFAULT_PATHS = ['/api/csrf/', '/static/admin/css/base.css']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/csrf/', timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Serwer na porcie {port} nie wystartował w {timeout} s')
+
+
+def run_load(port, path, requests, concurrency):
+    """Czasy odpowiedzi (s) dla `requests` żądań wysłanych przez `concurrency` połączeń keep-alive"""
+    per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+    def client(count):
+        timings, errors = [], 0
+        conn = HTTPConnection('127.0.0.1', port, timeout=30)
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Accept-Encoding': 'gzip, br'})
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors += 1
+                if response.getheader('Connection', '').lower() == 'close' or response.will_close:
+                    conn.close()
+            except OSError:
+                errors += 1
+                conn.close()
+            timings.append(time.perf_counter() - start)
+        conn.close()
+        return timings, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(client, per_client))
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(t for result in results for t in result[0])
+    return {
+        'rps': len(timings) / elapsed,
+        'p50': statistics.median(timings) * 1000,
+        'p95': timings[int(len(timings) * 0.95) - 1] * 1000,
+        'errors': sum(result[1] for result in results),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Porównuje przepustowość runserver i gunicorn (tryb produkcyjny) dla wybranych adresów'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', choices=sorted(SERVERS),
+                            help='Serwer do testu (domyślnie wszystkie)')
+        parser.add_argument('--path', action='append',
+                            help=f'Adres do obciążenia (domyślnie {", ".join(DEFAULT_PATHS)})')
+        parser.add_argument('--requests', type=int, default=2000, help='Liczba żądań na adres')
+        parser.add_argument('--concurrency', type=int, default=16, help='Liczba równoległych połączeń')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < options['concurrency']:
+            raise CommandError('--requests musi być nie mniejsze niż --concurrency >= 1')
+
+        results = {}
+        for name in options['server'] or sorted(SERVERS, reverse=True):
+            port = free_port()
+            command = [part.format(port=port) for part in SERVERS[name]]
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, 'PORT': str(port)},
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_server(port)
+                for path in options['path'] or DEFAULT_PATHS:
+                    run_load(port, path, options['concurrency'], options['concurrency'])
+                    stats = run_load(port, path, options['requests'], options['concurrency'])
+                    results[name, path] = stats
+                    self.stdout.write(
+                        f'{name:10} {path:40} {stats["rps"]:8.1f} req/s  '
+                        f'p50 {stats["p50"]:7.1f} ms  p95 {stats["p95"]:7.1f} ms  błędy {stats["errors"]}'
+                    )
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+        for path in options['path'] or DEFAULT_PATHS:
+            if ('runserver', path) in results and ('gunicorn', path) in results:
+                gain = results['gunicorn', path]['rps'] / results['runserver', path]['rps']
+                self.stdout.write(self.style.SUCCESS(f'{path}: gunicorn {gain:.1f}x szybciej niż runserver'))
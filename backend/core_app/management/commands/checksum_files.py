@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core_app.dedup import file_sha256
+from core_app.models import CSVFile, UploadedFile
+
+
+class Command(BaseCommand):
+    help = 'Uzupełnia skróty SHA-256 plików przesłanych przed włączeniem deduplikacji'
+
+    def handle(self, *args, **options):
+        for model in (UploadedFile, CSVFile):
+            count = 0
+            for record in model.objects.filter(sha256='').exclude(file='').iterator():
+                try:
+                    with record.file.open('rb') as f:
+                        sha256 = file_sha256(f)
+                except FileNotFoundError:
+                    self.stderr.write(f'{model.__name__} {record.pk}: brak pliku {record.file.name}')
+                    continue
+                model.objects.filter(pk=record.pk).update(sha256=sha256)
+                count += 1
+            self.stdout.write(f'{model.__name__}: uzupełniono {count} skrótów')
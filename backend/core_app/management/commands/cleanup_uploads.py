@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core_app.uploads import UPLOAD_EXPIRY, delete_expired_uploads
+
+
+class Command(BaseCommand):
+    help = 'Usuwa porzucone przesyłania plików w częściach razem z niedokończonymi plikami'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=UPLOAD_EXPIRY.total_seconds() / 3600,
+                            help='Wiek (od ostatniej części), po którym sesja jest porzucona')
+
+    def handle(self, *args, **options):
+        count = delete_expired_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(f'Usunięto {count} porzuconych przesyłań')
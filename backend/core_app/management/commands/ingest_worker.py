@@ -0,0 +1,60 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core_app.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Uruchamia workera przetwarzającego kolejkę importu plików'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Liczba równoległych procesów workera')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Odstęp (w sekundach) między sprawdzeniami pustej kolejki')
+        parser.add_argument('--once', action='store_true',
+                            help='Zakończ po opróżnieniu kolejki')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker_kwargs = {'poll_interval': options['poll_interval'], 'once': options['once']}
+
+        if concurrency == 1:
+            self._run(**worker_kwargs)
+            return
+
+        # Procesy potomne nie mogą współdzielić połączenia z bazą rodzica. Nie są demoniczne -
+        # import dużego CSV uruchamia w nich własną pulę procesów (core_app.parallel_csv)
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=self._run, kwargs=worker_kwargs)
+            for _ in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+
+        # SIGTERM przekazujemy dalej, workery kończą po bieżącym zadaniu
+        signal.signal(signal.SIGTERM, lambda signum, frame: [p.terminate() for p in processes])
+
+        self.stdout.write(f'Uruchomiono {concurrency} workerów importu')
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+        finally:
+            # Procesy niedemoniczne nie kończą się razem z rodzicem - czekamy na bieżące zadania
+            for process in processes:
+                process.join()
+
+    def _run(self, poll_interval, once):
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        try:
+            run_worker(poll_interval=poll_interval, once=once, should_stop=lambda: bool(stopping))
+        except KeyboardInterrupt:
+            pass
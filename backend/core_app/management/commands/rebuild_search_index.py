@@ -0,0 +1,23 @@
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+
+from core_app.models import SearchEntry, UploadedFile
+from core_app.table_queries import get_columns
+
+
+class Command(BaseCommand):
+    help = 'Przebudowuje indeks wyszukiwania dla tabel z importu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append',
+                            help='Tabela do przebudowy (domyślnie wszystkie tabele z importu)')
+
+    def handle(self, *args, **options):
+        tables = options['table'] or UploadedFile.objects.exclude(table_name='').values_list('table_name', flat=True)
+
+        for table_name in tables:
+            with transaction.atomic(), connection.cursor() as cursor:
+                columns = get_columns(cursor, table_name)
+                text_columns = [column for column, udt_name in columns.items() if udt_name in ('text', 'varchar')]
+                rows = SearchEntry.index_table(cursor, table_name, text_columns)
+            self.stdout.write(f'{table_name}: {rows} wierszy')
@@ -0,0 +1,46 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core_app.archives import ArchiveError, upload_file_type
+from core_app.dedup import file_sha256
+from core_app.jobs import check_sync_target
+from core_app.models import UploadedFile
+from core_app.sync import SyncError
+
+
+class Command(BaseCommand):
+    help = 'Nanosi na tabelę z importu tylko zmiany z nowej wersji pliku (np. codzienny eksport)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table_name', help='Tabela utworzona z wcześniej przesłanego pliku')
+        parser.add_argument('path', help='Nowa wersja pliku')
+        parser.add_argument('--key', required=True, help='Kolumna klucza naturalnego, np. identyfikator')
+
+    def handle(self, *args, **options):
+        table_name, path = options['table_name'], options['path']
+        try:
+            with open(path, 'rb') as f:
+                file_type = upload_file_type(path, f)[1]
+            check_sync_target(table_name, options['key'], file_type)
+        except (ArchiveError, SyncError) as e:
+            raise CommandError(str(e))
+
+        uploaded_file = UploadedFile.objects.filter(table_name=table_name).order_by('pk').first()
+        with open(path, 'rb') as f:
+            sha256 = file_sha256(f)
+            original = UploadedFile.find_original(sha256, file_type)
+            if original is not None:
+                file_name = original.file.name
+            else:
+                f.seek(0)
+                file_name = default_storage.save(os.path.join('uploads', os.path.basename(path)), File(f))
+        try:
+            stats = uploaded_file.sync_file(file_name, options['key'], sha256=sha256)
+        except SyncError as e:
+            if original is None:
+                default_storage.delete(file_name)
+            raise CommandError(str(e))
+        self.stdout.write(f'{table_name}: {stats}')
@@ -0,0 +1,103 @@
+"""
+Metryki żądań w formacie Prometheusa (prometheus_client).
+
+Przy wielu procesach gunicorna liczniki trafiają do plików w katalogu
+PROMETHEUS_MULTIPROC_DIR (ustawianym w gunicorn.conf.py), a /metrics sumuje
+je ze wszystkich procesów. Bez tej zmiennej metryki dotyczą jednego procesu.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from .db_pool import POOL_STATS, pool_stats
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Czas obsługi żądania',
+    ['view', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Liczba zapytań SQL na żądanie',
+    ['view'], buckets=QUERY_COUNT_BUCKETS,
+)
+DB_SECONDS = Histogram(
+    'http_request_db_duration_seconds', 'Łączny czas zapytań SQL na żądanie',
+    ['view'], buckets=LATENCY_BUCKETS,
+)
+SPAN_SECONDS = Histogram(
+    'http_request_span_duration_seconds', 'Czas etapów żądania (serialize, build)',
+    ['view', 'span'], buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    'http_response_size_bytes', 'Rozmiar treści odpowiedzi',
+    ['view'], buckets=SIZE_BUCKETS,
+)
+N_PLUS_ONE = Counter(
+    'http_request_n_plus_one', 'Żądania z powtarzanym w pętli zapytaniem SQL',
+    ['view'],
+)
+
+
+class RequestMetrics:
+    """Pomiary jednego żądania zbierane przez InstrumentationMiddleware"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = 'unmatched'
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}
+        self.spans = {}
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+current_request = ContextVar('current_request_metrics', default=None)
+
+
+@contextmanager
+def span(name):
+    """Pomiar etapu bieżącego żądania - trafia do Server-Timing i do /metrics"""
+    metrics = current_request.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.add_span(name, time.perf_counter() - start)
+
+
+class PoolCollector:
+    """Liczniki puli połączeń procesu obsługującego /metrics"""
+
+    def collect(self):
+        stats = pool_stats()
+        if stats is None:
+            return
+        for key, description in POOL_STATS.items():
+            family = GaugeMetricFamily(f'db_pool_{key}', description, labels=['pid'])
+            family.add_metric([str(os.getpid())], stats[key])
+            yield family
+
+
+_pool_registry = CollectorRegistry(auto_describe=False)
+_pool_registry.register(PoolCollector())
+
+
+def render_metrics():
+    """Tekst w formacie ekspozycji Prometheusa"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(_pool_registry)
@@ -0,0 +1,115 @@
+import logging
+import re
+import time
+
+from django.db import connection
+
+from .metrics import (
+    DB_QUERIES, DB_SECONDS, N_PLUS_ONE, REQUEST_SECONDS, RESPONSE_BYTES, SPAN_SECONDS, RequestMetrics,
+    current_request,
+)
+
+logger = logging.getLogger(__name__)
+
+# Tyle wykonań tego samego zapytania w jednym żądaniu uznajemy za pętlę N+1
+N_PLUS_ONE_THRESHOLD = 10
+
+# Literały i listy parametrów usuwane przed porównaniem zapytań
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SQL_IN_LISTS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+
+def normalize_sql(sql):
+    """Szablon zapytania: bez literałów i z listami IN (%s, ...) zwiniętymi do jednego elementu"""
+    return _SQL_IN_LISTS.sub('(%s)', _SQL_LITERALS.sub('?', sql))
+
+
+class InstrumentationMiddleware:
+    """
+    Pomiar żądania: czas całkowity, liczba i czas zapytań SQL, etapy
+    (serialize - renderowanie odpowiedzi DRF i szablonów, build - budowa
+    odpowiedzi przy braku wpisu w cache) i rozmiar odpowiedzi. Wyniki
+    trafiają do nagłówka Server-Timing i do /metrics, a powtarzane
+    zapytania do logu jako ostrzeżenie N+1.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            with connection.execute_wrapper(self._record_query(metrics)):
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        elapsed = time.perf_counter() - metrics.started
+        if request.resolver_match is not None:
+            metrics.view = request.resolver_match.view_name
+
+        REQUEST_SECONDS.labels(metrics.view, request.method, response.status_code).observe(elapsed)
+        DB_QUERIES.labels(metrics.view).observe(metrics.queries)
+        DB_SECONDS.labels(metrics.view).observe(metrics.db_seconds)
+        for name, seconds in metrics.spans.items():
+            SPAN_SECONDS.labels(metrics.view, name).observe(seconds)
+        self._check_n_plus_one(request, metrics)
+
+        if response.streaming:
+            response.streaming_content = self._count_streamed(response.streaming_content, metrics.view)
+        else:
+            RESPONSE_BYTES.labels(metrics.view).observe(len(response.content))
+
+        response['Server-Timing'] = self._server_timing(metrics, elapsed)
+        return response
+
+    def process_template_response(self, request, response):
+        # Odpowiedzi DRF są renderowane (serializowane do JSON) dopiero po wyjściu z widoku
+        metrics = current_request.get()
+        if metrics is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: metrics.add_span('serialize', time.perf_counter() - started)
+            )
+        return response
+
+    @staticmethod
+    def _record_query(metrics):
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                metrics.db_seconds += time.perf_counter() - start
+                metrics.queries += 1
+                template = normalize_sql(sql)
+                metrics.statements[template] = metrics.statements.get(template, 0) + 1
+        return wrapper
+
+    @staticmethod
+    def _check_n_plus_one(request, metrics):
+        repeated = {sql: count for sql, count in metrics.statements.items() if count >= N_PLUS_ONE_THRESHOLD}
+        if not repeated:
+            return
+        N_PLUS_ONE.labels(metrics.view).inc()
+        for sql, count in sorted(repeated.items(), key=lambda item: -item[1]):
+            logger.warning(f"N+1 w {metrics.view} ({request.method} {request.path}): "
+                           f"{count} wykonań zapytania {sql[:300]}")
+
+    @staticmethod
+    def _count_streamed(content, view):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            RESPONSE_BYTES.labels(view).observe(size)
+
+    @staticmethod
+    def _server_timing(metrics, elapsed):
+        entries = [f'app;dur={elapsed * 1000:.1f}',
+                   f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in metrics.spans.items()]
+        return ', '.join(entries)
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:31
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to='uploads/')),
+                ('title', models.CharField(max_length=255)),
+                ('file_type', models.CharField(max_length=10)),
+                ('phase', models.CharField(choices=[('queued', 'W kolejce'), ('loading', 'Ładowanie'), ('done', 'Zakończone'), ('failed', 'Błąd')], db_index=True, default='queued', max_length=10)),
+                ('rows_processed', models.BigIntegerField(default=0)),
+                ('rows_per_second', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('uploaded_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='core_app.uploadedfile')),
+            ],
+            options={
+                'verbose_name': 'Zadanie importu',
+                'verbose_name_plural': 'Zadania importu',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
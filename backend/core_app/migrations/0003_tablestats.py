@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0002_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableStats',
+            fields=[
+                ('table_name', models.CharField(max_length=63, primary_key=True, serialize=False)),
+                ('row_count', models.BigIntegerField()),
+                ('last_ingested_at', models.DateTimeField(blank=True, null=True)),
+                ('counted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Statystyki tabeli',
+                'verbose_name_plural': 'Statystyki tabel',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0003_tablestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index_name', models.CharField(max_length=63, unique=True)),
+                ('table_name', models.CharField(db_index=True, max_length=63)),
+                ('column_name', models.CharField(max_length=63)),
+                ('method', models.CharField(choices=[('btree', 'B-tree'), ('trigram', 'Trigram (pg_trgm)'), ('gist', 'GiST')], max_length=10)),
+                ('reason', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Indeks tabeli',
+                'verbose_name_plural': 'Indeksy tabel',
+            },
+        ),
+    ]
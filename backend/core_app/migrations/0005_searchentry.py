@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:46
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0004_tableindex'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=63)),
+                ('row_id', models.BigIntegerField()),
+                ('title', models.TextField()),
+                ('content', models.TextField()),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField()),
+            ],
+            options={
+                'verbose_name': 'Wpis indeksu wyszukiwania',
+                'verbose_name_plural': 'Indeks wyszukiwania',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='searchentry_vector_gin'), django.contrib.postgres.indexes.GinIndex(fields=['content'], name='searchentry_content_trgm', opclasses=['gin_trgm_ops'])],
+                'constraints': [models.UniqueConstraint(fields=('table_name', 'row_id'), name='searchentry_table_row_unique')],
+            },
+        ),
+    ]
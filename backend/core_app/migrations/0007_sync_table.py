@@ -0,0 +1,53 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0006_uploadsession_uploadchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvfile',
+            name='sync_key',
+            field=models.CharField(blank=True, help_text='Jeśli tabela już istnieje, nanoszone są tylko zmiany względem niej, a wiersze dopasowywane są po tej kolumnie', max_length=63, verbose_name='kolumna klucza'),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='rows_deleted',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='rows_inserted',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='rows_updated',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='sync_key',
+            field=models.CharField(blank=True, max_length=63),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='sync_table',
+            field=models.CharField(blank=True, max_length=63),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='sync_key',
+            field=models.CharField(blank=True, max_length=63),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='sync_table',
+            field=models.CharField(blank=True, max_length=63),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0008_upload_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableindex',
+            name='idx_scan',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tableindex',
+            name='idx_scan_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0009_tableindex_idx_scan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Wersja cache',
+                'verbose_name_plural': 'Wersje cache',
+            },
+        ),
+    ]
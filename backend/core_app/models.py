@@ -1,15 +1,184 @@
 import csv
+import io
 import logging
 import re
 import uuid
+from contextlib import contextmanager
+from itertools import chain, islice
 
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models, transaction, connection
 from django.db.models import QuerySet
+from django.utils import timezone
+
+from .archives import compression_of, open_data
+from .cache import bump_table_version
+from .column_types import INFER_SAMPLE_ROWS, TEXT, TypedRows, infer_column_types
+from .dedup import file_sha256
+from .geometry import DEFAULT_SRID, create_spatial_index, ensure_postgis, geometry_type, is_geometry_type
+from .ingestion import IngestStats, copy_rows, iter_csv_rows
+from .parallel_csv import ParallelParseError, local_path, parallel_copy, pool_available, read_header, use_parallel
+from .readers import READERS, feature_rows, read_features
+from .sync import SyncStats, sync_rows, table_column_types
+from .table_swap import prepare_staging, swap_tables, table_exists
 
 logger = logging.getLogger(__name__)
 
 
+class TableStats(models.Model):
+    """Dokładna liczba wierszy tabeli zapisywana przy imporcie (bez COUNT(*) przy każdym odczycie)"""
+    table_name = models.CharField(max_length=63, primary_key=True)
+    row_count = models.BigIntegerField()
+    last_ingested_at = models.DateTimeField(null=True, blank=True)
+    counted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Statystyki tabeli'
+        verbose_name_plural = 'Statystyki tabel'
+
+    def __str__(self):
+        return f"{self.table_name} ({self.row_count} wierszy)"
+
+    @classmethod
+    def record_ingest(cls, table_name, row_count):
+        now = timezone.now()
+        cls.objects.update_or_create(
+            table_name=table_name,
+            defaults={'row_count': row_count, 'last_ingested_at': now, 'counted_at': now}
+        )
+
+    @classmethod
+    def count_exact(cls, table_name):
+        """Dokładne COUNT(*) - wykonywane tylko na żądanie"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+            row_count = cursor.fetchone()[0]
+        cls.objects.update_or_create(
+            table_name=table_name,
+            defaults={'row_count': row_count, 'counted_at': timezone.now()}
+        )
+        return row_count
+
+
+class CacheVersion(models.Model):
+    """
+    Wersja przestrzeni nazw cache odpowiedzi (tabela z importu albo drzewo
+    użytkownika) - wspólna dla wszystkich procesów i instancji, podbijana w core_app.cache
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Wersja cache'
+        verbose_name_plural = 'Wersje cache'
+
+    def __str__(self):
+        return f"{self.name} (v{self.version})"
+
+
+class TableIndex(models.Model):
+    """Indeks utworzony przez doradcę indeksów (core_app.indexes) dla tabeli z importu"""
+    METHOD_BTREE = 'btree'
+    METHOD_TRIGRAM = 'trigram'
+    METHOD_GIST = 'gist'
+    METHOD_CHOICES = [
+        (METHOD_BTREE, 'B-tree'),
+        (METHOD_TRIGRAM, 'Trigram (pg_trgm)'),
+        (METHOD_GIST, 'GiST'),
+    ]
+
+    index_name = models.CharField(max_length=63, unique=True)
+    table_name = models.CharField(max_length=63, db_index=True)
+    column_name = models.CharField(max_length=63)
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES)
+    reason = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Ostatnio odczytany licznik pg_stat_user_indexes.idx_scan i chwila, w której się zmienił
+    # (licznik jest skumulowany od resetu statystyk - o użyciu świadczy dopiero jego zmiana)
+    idx_scan = models.BigIntegerField(null=True, blank=True)
+    idx_scan_changed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Indeks tabeli'
+        verbose_name_plural = 'Indeksy tabel'
+
+    def __str__(self):
+        return f"{self.index_name} ({self.get_method_display()})"
+
+
+class SearchEntry(models.Model):
+    """
+    Wiersz tabeli z importu w ujednoliconym indeksie wyszukiwania (core_app.search).
+    Treść to połączone kolumny tekstowe wiersza, indeksowana jako tsvector
+    (wyszukiwanie prefiksowe) i trigramami (wyszukiwanie przybliżone).
+    """
+    SEARCH_CONFIG = 'simple'
+
+    # Kolumny, z których preferencyjnie bierzemy tytuł wyniku
+    TITLE_COLUMNS = ['identyfikator', 'nazwa', 'name', 'title', 'adres']
+
+    table_name = models.CharField(max_length=63)
+    row_id = models.BigIntegerField()
+    title = models.TextField()
+    content = models.TextField()
+    search_vector = SearchVectorField()
+
+    class Meta:
+        verbose_name = 'Wpis indeksu wyszukiwania'
+        verbose_name_plural = 'Indeks wyszukiwania'
+        constraints = [
+            models.UniqueConstraint(fields=['table_name', 'row_id'], name='searchentry_table_row_unique'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='searchentry_vector_gin'),
+            GinIndex(fields=['content'], name='searchentry_content_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f"{self.table_name}#{self.row_id}: {self.title}"
+
+    @classmethod
+    def index_table(cls, cursor, table_name, text_columns, row_ids=None, source_table=None):
+        """
+        Przebudowa wpisów tabeli jednym INSERT ... SELECT (w transakcji importu).
+        Z `row_ids` przebudowywane są tylko wpisy tych wierszy (synchronizacja),
+        a `source_table` to budowana nowa wersja tabeli, która zastąpi `table_name`.
+        """
+        if row_ids is None:
+            cursor.execute(f'DELETE FROM {cls._meta.db_table} WHERE table_name = %s', [table_name])
+            row_filter, row_params = '', []
+        else:
+            row_ids = list(row_ids)
+            cursor.execute(f'DELETE FROM {cls._meta.db_table} WHERE table_name = %s AND row_id = ANY(%s)',
+                           [table_name, row_ids])
+            row_filter, row_params = 'WHERE id = ANY(%s)', [row_ids]
+        if not text_columns or row_ids == []:
+            return 0
+
+        title_column = next((c for c in cls.TITLE_COLUMNS if c in text_columns), text_columns[0])
+        quoted_columns = ', '.join(f'"{column}"' for column in text_columns)
+        content = f"concat_ws(' ', {quoted_columns})"
+        cursor.execute(f"""
+            INSERT INTO {cls._meta.db_table} (table_name, row_id, title, content, search_vector)
+            SELECT %s, id, coalesce("{title_column}", ''), {content},
+                   setweight(to_tsvector(%s, coalesce("{title_column}", '')), 'A')
+                   || to_tsvector(%s, {content})
+            FROM "{source_table or table_name}"
+            {row_filter}
+        """, [table_name, cls.SEARCH_CONFIG, cls.SEARCH_CONFIG, *row_params])
+        logger.info(f"Indexed {cursor.rowcount} rows of {table_name} for search")
+        return cursor.rowcount
+
+
+def drop_table_metadata(table_name):
+    """Usunięcie danych pomocniczych usuniętej tabeli z importu"""
+    TableStats.objects.filter(table_name=table_name).delete()
+    TableIndex.objects.filter(table_name=table_name).delete()
+    SearchEntry.objects.filter(table_name=table_name).delete()
+
+
 class DatabaseTableManager(models.Manager):
     def get_queryset(self):
         return DatabaseTableQuerySet(self.model, using=self._db)
@@ -22,36 +191,17 @@ class DatabaseTableQuerySet(models.QuerySet):
 
     def _fetch_all(self):
         if self._result_cache is None:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public'
-                    AND table_type = 'BASE TABLE'
-                    AND table_name NOT LIKE 'django_%'
-                    AND table_name NOT LIKE 'auth_%'
-                """)
-                tables = cursor.fetchall()
-
-                self._result_cache = []
-                for (table_name,) in tables:
-                    try:
-                        cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
-                        count = cursor.fetchone()[0]
-                        self._result_cache.append(
-                            DatabaseTable(
-                                table_name=table_name,
-                                row_count=count
-                            )
-                        )
-                    except Exception as e:
-                        logger.error(f"Error processing table {table_name}: {str(e)}")
+            self._result_cache = DatabaseTable.fetch_tables()
         return self._result_cache
 
 
 class DatabaseTable(models.Model):
     table_name = models.CharField("Nazwa tabeli", max_length=100, primary_key=True)
     row_count = models.IntegerField("Liczba wierszy")
+    row_count_exact = models.BooleanField("Dokładna liczba wierszy", default=False)
+    total_size = models.BigIntegerField("Rozmiar na dysku", default=0)
+    index_size = models.BigIntegerField("Rozmiar indeksów", default=0)
+    last_ingested_at = models.DateTimeField("Ostatni import", null=True)
 
     objects = DatabaseTableManager()
 
@@ -64,44 +214,101 @@ class DatabaseTable(models.Model):
     def __str__(self):
         return f"{self.table_name} ({self.row_count} wierszy)"
 
-    def __str__(self):
-        return f"{self.table_name} ({self.row_count} wierszy)"
+    @classmethod
+    def fetch_tables(cls, table_name=None):
+        """
+        Lista tabel z liczbą wierszy i rozmiarami w jednym zapytaniu.
+
+        Liczba wierszy pochodzi z TableStats (dokładna, zapisana przy imporcie),
+        a w drugiej kolejności z estymat pg_stat_user_tables / pg_class.reltuples.
+        """
+        table_filter = 'AND c.relname = %s' if table_name else ''
+        params = [table_name] if table_name else []
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT c.relname,
+                       m.row_count,
+                       s.n_live_tup,
+                       c.reltuples::bigint,
+                       pg_total_relation_size(c.oid),
+                       pg_indexes_size(c.oid),
+                       m.last_ingested_at
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                LEFT JOIN {TableStats._meta.db_table} m ON m.table_name = c.relname
+                WHERE n.nspname = 'public'
+                AND c.relkind IN ('r', 'p')
+                AND c.relname NOT LIKE 'django_%%'
+                AND c.relname NOT LIKE 'auth_%%'
+                {table_filter}
+                ORDER BY c.relname
+            """, params)
+            rows = cursor.fetchall()
+
+        indexes = cls.fetch_indexes(table_name)
+
+        tables = []
+        for table_name, exact, live_tuples, reltuples, total_size, index_size, last_ingested_at in rows:
+            if exact is not None:
+                row_count = exact
+            elif live_tuples:
+                row_count = live_tuples
+            else:
+                row_count = max(reltuples, 0)
+            tables.append(cls(
+                table_name=table_name,
+                row_count=row_count,
+                row_count_exact=exact is not None,
+                total_size=total_size,
+                index_size=index_size,
+                last_ingested_at=last_ingested_at,
+            ))
+            tables[-1].indexes = indexes.get(table_name, [])
+        return tables
+
+    @classmethod
+    def fetch_indexes(cls, table_name=None):
+        """Indeksy tabel ze statystykami użycia z pg_stat_user_indexes: {tabela: [indeksy]}"""
+        table_filter = 'AND s.relname = %s' if table_name else ''
+        params = [table_name] if table_name else []
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT s.relname, s.indexrelname, s.idx_scan, s.idx_tup_read,
+                       pg_relation_size(s.indexrelid), m.method
+                FROM pg_stat_user_indexes s
+                LEFT JOIN {TableIndex._meta.db_table} m ON m.index_name = s.indexrelname
+                WHERE s.schemaname = 'public'
+                {table_filter}
+                ORDER BY s.relname, s.indexrelname
+            """, params)
+            rows = cursor.fetchall()
+
+        indexes = {}
+        for table, index_name, scans, tuples_read, size, method in rows:
+            indexes.setdefault(table, []).append({
+                'name': index_name,
+                'scans': scans,
+                'tuples_read': tuples_read,
+                'size': size,
+                'managed': method is not None,
+            })
+        return indexes
+
+    @classmethod
+    def get_table(cls, table_name):
+        tables = cls.fetch_tables(table_name)
+        return tables[0] if tables else None
 
     @classmethod
     def get_all_tables(cls) -> QuerySet:
         try:
             # Создаем пустой QuerySet
             qs = cls.objects.none()
-            table_objects = []
-
-            with connection.cursor() as cursor:
-                # Получаем список всех таблиц
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public'
-                    AND table_type = 'BASE TABLE'
-                    AND table_name NOT LIKE 'django_%'
-                    AND table_name NOT LIKE 'auth_%'
-                """)
-                tables = cursor.fetchall()
-
-                logger.info(f"Found {len(tables)} tables in database")
-
-                # Получаем количество строк для каждой таблицы
-                for (table_name,) in tables:
-                    try:
-                        cursor.execute(f"SELECT COUNT(*) FROM \"{table_name}\"")
-                        count = cursor.fetchone()[0]
-                        table_objects.append(
-                            cls(
-                                table_name=table_name,
-                                row_count=count
-                            )
-                        )
-                        logger.info(f"Added table {table_name} with {count} rows")
-                    except Exception as e:
-                        logger.error(f"Error processing table {table_name}: {str(e)}")
+            table_objects = cls.fetch_tables()
+            logger.info(f"Found {len(table_objects)} tables in database")
 
             # Если есть объекты, создаем новый QuerySet с ними
             if table_objects:
@@ -120,6 +327,12 @@ class DatabaseTable(models.Model):
 class CSVFile(models.Model):
     title = models.CharField(max_length=100, verbose_name='nazwa tublica')
     file = models.FileField(upload_to='csv_files/')
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    sync_key = models.CharField(
+        max_length=63, blank=True, verbose_name='kolumna klucza',
+        help_text='Jeśli tabela już istnieje, nanoszone są tylko zmiany względem niej, '
+                  'a wiersze dopasowywane są po tej kolumnie'
+    )
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -143,18 +356,43 @@ class CSVFile(models.Model):
 
         return clean_name
 
+    @property
+    def table_name(self):
+        return ''.join(e if e.isalnum() else '_' for e in self.title.lower())
+
+    def loaded_sha256(self):
+        """Skrót pliku, z którego pochodzi obecna zawartość tabeli (ostatni plik o tej nazwie tabeli)"""
+        previous = CSVFile.objects.exclude(pk=self.pk).order_by('-uploaded_at', '-pk').only('title', 'sha256')
+        return next((f.sha256 for f in previous if f.table_name == self.table_name), '')
+
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        if is_new and self.file and not self.file._committed:
+            # Skrót przed zapisem - identyczny plik nie trafia drugi raz do storage
+            self.sha256 = self.sha256 or file_sha256(self.file)
+            original = CSVFile.objects.filter(sha256=self.sha256).order_by('pk').first()
+            if original is not None:
+                self.file = original.file.name
         super().save(*args, **kwargs)
 
         if is_new:  # Только для новых файлов
             try:
                 with transaction.atomic():
-                    table_name = self.title.lower()
-                    table_name = ''.join(e if e.isalnum() else '_' for e in table_name)
+                    table_name = self.table_name
 
                     with connection.cursor() as cursor:
-                        cursor.execute(f'DROP TABLE IF EXISTS {table_name}')
+                        if self.sha256 and self.sha256 == self.loaded_sha256() and table_exists(cursor, table_name):
+                            logger.info(f"{table_name} already holds the content of this file, skipping import")
+                            return
+
+                        transaction.on_commit(lambda: bump_table_version(table_name))
+                        if self.sync_key and table_column_types(cursor, table_name):
+                            # Ponownie przesłany arkusz - tylko różnice względem istniejącej tabeli
+                            self.sync_table(cursor, table_name)
+                            return
+
+                        # Nowa wersja powstaje obok bieżącej tabeli, która do końca importu obsługuje odczyty
+                        staging_name = prepare_staging(cursor, table_name)
 
                         with self.file.open(mode='r') as file:
                             csv_reader = csv.DictReader(file)
@@ -174,35 +412,52 @@ class CSVFile(models.Model):
                             columns = [f"{header} TEXT" for header in clean_headers]
 
                             create_table_sql = f"""
-                            CREATE TABLE {table_name} (
+                            CREATE TABLE {staging_name} (
                                 id SERIAL PRIMARY KEY,
                                 {', '.join(columns)}
                             )
                             """
                             cursor.execute(create_table_sql)
 
-                            insert_sql = f"""
-                            INSERT INTO {table_name} (
-                                {', '.join(clean_headers)}
-                            )
-                            VALUES ({', '.join(['%s' for _ in clean_headers])})
-                            """
-
-                            # Читаем все строки разом
-                            file.seek(0)
-                            next(csv_reader)  # Пропускаем заголовки
-                            batch = [
-                                [row[header] for header in original_headers if header and header in header_mapping]
-                                for row in csv_reader
-                            ]
-
-                            # Вставляем все данные одним запросом
-                            if batch:
-                                cursor.executemany(insert_sql, batch)
+                            path = local_path(self.file)
+                            if use_parallel(path):
+                                headers, ranges = read_header(path)
+                                self.ingest_stats = parallel_copy(cursor, staging_name, clean_headers, path,
+                                                                  headers, ranges)
+                            else:
+                                # Strumieniowo ładujemy dane paczkami przez COPY
+                                file.seek(0)
+                                csv_reader = csv.reader(file)
+                                next(csv_reader)  # Пропускаем заголовки
+                                self.ingest_stats = copy_rows(
+                                    cursor, staging_name, clean_headers,
+                                    iter_csv_rows(csv_reader, original_headers)
+                                )
+                            TableStats.record_ingest(table_name, self.ingest_stats.rows)
+                            SearchEntry.index_table(cursor, table_name, clean_headers, source_table=staging_name)
+                            swap_tables(cursor, table_name, staging_name)
 
             except Exception as e:
                 raise Exception(f'Błąd podczas przetwarzania pliku CSV: {str(e)}')
 
+    def sync_table(self, cursor, table_name):
+        """Synchronizacja istniejącej tabeli z plikiem po kolumnie sync_key (core_app.sync)"""
+        with self.file.open(mode='r') as file:
+            csv_reader = csv.reader(file)
+            headers = next(csv_reader)
+
+            # Te same nazwy kolumn co przy tworzeniu tabeli w save()
+            columns = []
+            for header in headers:
+                if header:
+                    columns.append(self.clean_column_name(header, set(columns)))
+            key = self.clean_column_name(self.sync_key, set())
+            self.sync_stats = sync_rows(cursor, table_name, key, columns, iter_csv_rows(csv_reader, headers))
+
+        self.ingest_stats = self.sync_stats.load
+        TableStats.record_ingest(table_name, self.sync_stats.rows)
+        SearchEntry.index_table(cursor, table_name, columns, row_ids=self.sync_stats.changed_ids)
+
 
 class UploadedFile(models.Model):
     file = models.FileField(upload_to='uploads/')
@@ -210,10 +465,20 @@ class UploadedFile(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     file_type = models.CharField(max_length=10)
     table_name = models.CharField(max_length=63, blank=True)
+    # Skrót treści pliku - identyczne pliki współdzielą plik w storage i tabelę (core_app.dedup)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
 
     def __str__(self):
         return f"{self.title} ({self.uploaded_at})"
 
+    @classmethod
+    def find_original(cls, sha256, file_type):
+        """Wcześniej zaimportowany plik o tej samej treści albo None"""
+        if not sha256:
+            return None
+        return (cls.objects.filter(sha256=sha256, file_type__iexact=file_type)
+                .exclude(table_name='').order_by('pk').first())
+
     def clean_column_name(self, name):
         """Czyszczenie nazwy kolumny do użycia w PostgreSQL"""
         # Zamień wszystkie znaki niealfanumeryczne na podkreślenie
@@ -221,7 +486,7 @@ class UploadedFile(models.Model):
         # Usuń wielokrotne podkreślenia
         clean_name = re.sub(r'_+', '_', clean_name)
         # Usuń podkreślenia na początku i końcu
-        clean_name = clean_name.strip('_')
+        clean_name = clean_name.strip('_') or 'column'
 
         # Upewnij się, że nazwa nie zaczyna się od cyfry
         if clean_name[0].isdigit():
@@ -247,11 +512,131 @@ class UploadedFile(models.Model):
 
         return table_name
 
-    def save(self, *args, **kwargs):
+    def unique_column_names(self, names, reserved=('id',)):
+        """Oczyszczone, niepowtarzające się nazwy kolumn (z pominięciem zarezerwowanych)"""
+        existing = set(reserved)
+        unique_names = []
+        for name in names:
+            base_name = self.clean_column_name(name or 'column')
+            clean_name = base_name
+            counter = 1
+            while clean_name in existing:
+                clean_name = f"{base_name}_{counter}"
+                counter += 1
+            existing.add(clean_name)
+            unique_names.append(clean_name)
+        return unique_names
+
+    @contextmanager
+    def open_rows(self):
+        """Nazwy kolumn i strumień wierszy z pliku CSV albo pliku przestrzennego"""
+        file_type = self.file_type.lower()
+
+        # Pliki .gz/.zst/.zip rozpakowywane są strumieniowo w trakcie czytania (core_app.archives)
+        if file_type in READERS:
+            with open_data(self.file, file_type) as (file, open_sibling):
+                features = read_features(file_type, file, open_sibling)
+                keys, rows = feature_rows(features, INFER_SAMPLE_ROWS)
+                yield self.unique_column_names(keys, reserved=('id', 'geom')) + ['geom'], rows
+        else:
+            # Читаем файл как текст
+            with open_data(self.file, file_type) as (file, _):
+                csv_reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8', newline=''))
+                headers = next(csv_reader)
+
+                # Очищаем имена столбцов
+                clean_headers = self.unique_column_names(header for header in headers if header)
+                yield clean_headers, iter_csv_rows(csv_reader, headers)
+
+    def load_rows(self, cursor, table_name, columns, rows, progress=None):
+        """Utworzenie tabeli o zgadniętych typach i strumieniowe załadowanie wierszy"""
+        # Typy kolumn zgadujemy na podstawie pierwszych wierszy
+        sample = list(islice(rows, INFER_SAMPLE_ROWS))
+        column_types = self.create_table(cursor, table_name, columns, sample)
+
+        # Strumieniowo ładujemy dane paczkami przez COPY
+        typed_rows = TypedRows(cursor, table_name, columns, column_types, chain(sample, rows))
+        self.ingest_stats = copy_rows(cursor, table_name, columns, typed_rows, progress=progress)
+        self.finish_load(cursor, table_name, columns, typed_rows.column_types)
+
+    def load_csv_parallel(self, cursor, table_name, path, progress=None):
+        """
+        Import dużego pliku CSV z parsowaniem w puli procesów (core_app.parallel_csv).
+        Jeśli zakresu nie da się sparsować osobno, plik jest ładowany sekwencyjnie.
+        """
+        if not pool_available():
+            logger.warning(f"Process pool not available in a daemonic process, loading {path} sequentially")
+            with self.open_rows() as (columns, rows):
+                self.load_rows(cursor, table_name, columns, rows, progress=progress)
+            return
+
+        headers, ranges = read_header(path)
+        columns = self.unique_column_names(header for header in headers if header)
+        with self.open_rows() as (_, rows):
+            sample = list(islice(rows, INFER_SAMPLE_ROWS))
+        column_types = self.create_table(cursor, table_name, columns, sample)
+
+        typed_rows = TypedRows(cursor, table_name, columns, column_types, [])
+        try:
+            # Punkt zapisu cofa też poszerzenia kolumn wykonane w trakcie ładowania
+            with transaction.atomic():
+                self.ingest_stats = parallel_copy(cursor, table_name, columns, path, headers, ranges,
+                                                  typed_rows, progress=progress)
+        except ParallelParseError as e:
+            logger.warning(f"Parallel CSV parsing of {path} failed ({e}), loading sequentially")
+            with self.open_rows() as (_, rows):
+                typed_rows = TypedRows(cursor, table_name, columns, column_types, rows)
+                self.ingest_stats = copy_rows(cursor, table_name, columns, typed_rows, progress=progress)
+        self.finish_load(cursor, table_name, columns, typed_rows.column_types)
+
+    def create_table(self, cursor, table_name, columns, sample):
+        """Tabela o typach kolumn zgadniętych z próbki wierszy; zwraca te typy"""
+        column_types = infer_column_types(sample, len(columns))
+        if self.file_type.lower() in READERS and not is_geometry_type(column_types[-1]):
+            # Ostatnia kolumna plików przestrzennych to zawsze geometria
+            column_types[-1] = geometry_type(DEFAULT_SRID)
+
+        if any(is_geometry_type(column_type) for column_type in column_types):
+            ensure_postgis(cursor)
+
+        # Создаем таблицу
+        create_table_sql = f"""
+        CREATE TABLE {table_name} (
+            id SERIAL PRIMARY KEY,
+            {', '.join(f"{column} {column_type}" for column, column_type in zip(columns, column_types))}
+        )
+        """
+        cursor.execute(create_table_sql)
+        return column_types
+
+    def finish_load(self, cursor, table_name, columns, column_types):
+        """Statystyki, indeks wyszukiwania i indeksy przestrzenne po załadowaniu wierszy"""
+        self.column_types = dict(zip(columns, column_types))
+        TableStats.record_ingest(table_name, self.ingest_stats.rows)
+        SearchEntry.index_table(cursor, table_name,
+                                [column for column, column_type in self.column_types.items() if column_type == TEXT])
+
+        # Indeks przestrzenny budujemy dopiero po załadowaniu wszystkich danych
+        for column, column_type in self.column_types.items():
+            if is_geometry_type(column_type):
+                create_spatial_index(cursor, table_name, column)
+
+    def save(self, *args, progress=None, **kwargs):
         is_new = self.pk is None
+        if is_new and self.file and not self.file._committed:
+            self.sha256 = self.sha256 or file_sha256(self.file)
+        original = self.find_original(self.sha256, self.file_type) if is_new else None
+        if original is not None:
+            # Identyczny plik był już importowany - bez zapisu w storage i bez ponownego importu
+            self.file = original.file.name
+            self.table_name = original.table_name
+            self.ingest_stats = IngestStats()
+            self.ingest_stats.rows = (TableStats.objects.filter(table_name=self.table_name)
+                                      .values_list('row_count', flat=True).first() or 0)
+            logger.info(f"{self.title}: same content as upload {original.pk}, sharing table {self.table_name}")
         super().save(*args, **kwargs)
 
-        if is_new:
+        if is_new and original is None:
             try:
                 with transaction.atomic():
                     base_table_name = self.title.lower()
@@ -259,59 +644,173 @@ class UploadedFile(models.Model):
                     table_name = self.generate_unique_table_name(base_table_name)
                     self.table_name = table_name
 
+                    # Równolegle parsujemy tylko nieskompresowany CSV - zakresy bajtów wymagają dostępu swobodnego
+                    path = (local_path(self.file) if self.file_type.lower() == 'csv'
+                            and not compression_of(self.file.name) else None)
                     with connection.cursor() as cursor:
-                        # Читаем файл как текст для подсчета строк
-                        with self.file.open(mode='r') as file:
-                            # Используем csv.reader вместо DictReader для точного подсчета
-                            csv_reader = csv.reader(file)
-                            headers = next(csv_reader)
-
-                            # Очищаем имена столбцов
-                            clean_headers = [self.clean_column_name(header) for header in headers if header]
-
-                            # Создаем таблицу
-                            create_table_sql = f"""
-                            CREATE TABLE {table_name} (
-                                id SERIAL PRIMARY KEY,
-                                {', '.join(f"{header} TEXT" for header in clean_headers)}
-                            )
-                            """
-                            cursor.execute(create_table_sql)
-
-                            # SQL для вставки данных
-                            insert_sql = f"""
-                            INSERT INTO {table_name} (
-                                {', '.join(clean_headers)}
-                            )
-                            VALUES ({', '.join(['%s' for _ in clean_headers])})
-                            """
-
-                            # Собираем все строки данных
-                            batch = []
-                            for row in csv_reader:
-                                # Берем только значения для непустых столбцов
-                                values = []
-                                col_idx = 0
-                                for cell in row:
-                                    if headers[col_idx]:
-                                        values.append(cell)
-                                    col_idx += 1
-                                batch.append(values)
-
-                            # Вставляем данные
-                            if batch:
-                                cursor.executemany(insert_sql, batch)
+                        if use_parallel(path):
+                            self.load_csv_parallel(cursor, table_name, path, progress=progress)
+                        else:
+                            with self.open_rows() as (columns, rows):
+                                self.load_rows(cursor, table_name, columns, rows, progress=progress)
 
                     super().save(update_fields=['table_name'])
+                    transaction.on_commit(lambda: bump_table_version(table_name))
 
             except Exception as e:
                 raise Exception(f'Błąd podczas przetwarzania pliku: {str(e)}')
 
+    def sync_file(self, file_name, key, progress=None, sha256=''):
+        """
+        Ponowne przesłanie pliku do istniejącej tabeli: zamiast nowej tabeli
+        nanoszone są tylko różnice, a wiersze dopasowywane po kolumnie `key`
+        """
+        table_name = self.table_name
+        self.file = file_name
+        if sha256 and UploadedFile.objects.filter(table_name=table_name, sha256=sha256).exists():
+            # Ten sam plik co ostatnio - tabela już zawiera dokładnie te dane
+            self.sha256 = sha256
+            self.sync_stats = SyncStats()
+            self.sync_stats.rows = (TableStats.objects.filter(table_name=table_name)
+                                    .values_list('row_count', flat=True).first() or 0)
+            self.sync_stats.load = self.ingest_stats = IngestStats()
+            self.ingest_stats.rows = self.sync_stats.rows
+            super().save(update_fields=['file', 'sha256'])
+            return self.sync_stats
+
+        with transaction.atomic():
+            with connection.cursor() as cursor, self.open_rows() as (columns, rows):
+                self.sync_stats = sync_rows(cursor, table_name, self.clean_column_name(key), columns, rows,
+                                            progress=progress)
+                self.ingest_stats = self.sync_stats.load
+                self.column_types = table_column_types(cursor, table_name)
+
+                # Kolumna poszerzona do TEXT trafia do indeksu wyszukiwania - wtedy przebudowa całej tabeli
+                text_columns = [column for column, column_type in self.column_types.items() if column_type == TEXT]
+                reindex_all = any(column in text_columns for column in self.sync_stats.widened)
+                SearchEntry.index_table(cursor, table_name, text_columns,
+                                        row_ids=None if reindex_all else self.sync_stats.changed_ids)
+            TableStats.record_ingest(table_name, self.sync_stats.rows)
+            self.sha256 = sha256
+            super().save(update_fields=['file', 'sha256'])
+            # Pozostałe rekordy tej tabeli wskazują na poprzedni plik - ich skrót nie opisuje już treści tabeli,
+            # więc nie mogą posłużyć za oryginał przy deduplikacji
+            UploadedFile.objects.filter(table_name=table_name).exclude(pk=self.pk).update(sha256='')
+            if self.sync_stats.changed:
+                transaction.on_commit(lambda: bump_table_version(table_name))
+        return self.sync_stats
+
     def delete(self, *args, **kwargs):
-        if self.table_name:
-            with connection.cursor() as cursor:
-                cursor.execute(f"DROP TABLE IF EXISTS {self.table_name}")
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            # Tabelę współdzieloną przez identyczne pliki usuwa dopiero ostatni rekord, który na nią wskazuje
+            # (blokada wszystkich odwołań w stałej kolejności - równoległe usuwanie nie pominie DROP)
+            references = list(UploadedFile.objects.select_for_update().filter(table_name=self.table_name)
+                              .order_by('pk').values_list('pk', flat=True)) if self.table_name else []
+            if self.table_name and set(references) <= {self.pk}:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {self.table_name}")
+                drop_table_metadata(self.table_name)
+                bump_table_version(self.table_name)
+            super().delete(*args, **kwargs)
+
+
+class IngestionJob(models.Model):
+    PHASE_QUEUED = 'queued'
+    PHASE_LOADING = 'loading'
+    PHASE_DONE = 'done'
+    PHASE_FAILED = 'failed'
+    PHASES = [
+        (PHASE_QUEUED, 'W kolejce'),
+        (PHASE_LOADING, 'Ładowanie'),
+        (PHASE_DONE, 'Zakończone'),
+        (PHASE_FAILED, 'Błąd'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file = models.FileField(upload_to='uploads/')
+    title = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=10)
+    phase = models.CharField(max_length=10, choices=PHASES, default=PHASE_QUEUED, db_index=True)
+    rows_processed = models.BigIntegerField(default=0)
+    rows_per_second = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    uploaded_file = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='jobs')
+    sha256 = models.CharField(max_length=64, blank=True)
+    # Synchronizacja istniejącej tabeli zamiast tworzenia nowej (core_app.sync)
+    sync_table = models.CharField(max_length=63, blank=True)
+    sync_key = models.CharField(max_length=63, blank=True)
+    rows_inserted = models.BigIntegerField(null=True, blank=True)
+    rows_updated = models.BigIntegerField(null=True, blank=True)
+    rows_deleted = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Zadanie importu'
+        verbose_name_plural = 'Zadania importu'
+
+    def __str__(self):
+        return f"{self.title} ({self.phase})"
+
+
+class UploadSession(models.Model):
+    """Wznawialne przesyłanie pliku w częściach (core_app.uploads)"""
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETE = 'complete'
+    STATUSES = [
+        (STATUS_OPEN, 'W trakcie'),
+        (STATUS_COMPLETE, 'Zakończone'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file = models.FileField(upload_to='uploads/')
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=10)
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    checksum = models.CharField(max_length=64, blank=True)
+    sync_table = models.CharField(max_length=63, blank=True)
+    sync_key = models.CharField(max_length=63, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_OPEN)
+    job = models.ForeignKey(IngestionJob, on_delete=models.SET_NULL, null=True, blank=True,
+                            related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Przesyłanie pliku'
+        verbose_name_plural = 'Przesyłania plików'
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index):
+        """Oczekiwany rozmiar części `index` - ostatnia może być krótsza"""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+
+class UploadChunk(models.Model):
+    """Część pliku zapisana już w docelowym pliku sesji, ze sprawdzoną sumą SHA-256"""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    checksum = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='uploadchunk_session_index_unique'),
+        ]
 
 
 class Section(models.Model):
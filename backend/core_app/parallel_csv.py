@@ -0,0 +1,238 @@
+"""
+Równoległe parsowanie dużych plików CSV.
+
+Plik jest dzielony na zakresy bajtów kończące się na granicy rekordu:
+znak nowej linii jest granicą tylko wtedy, gdy liczba cudzysłowów przed
+nim jest parzysta (pola w cudzysłowie mogą zawierać nowe linie, a ""
+wewnątrz pola nie zmienia parzystości). Procesy z puli parsują zakresy,
+odrzucają kolumny bez nagłówka, konwertują wartości do typów kolumn
+i zwracają gotowy tekst dla COPY; proces główny ładuje je po kolei.
+
+Moduł nie importuje Django - procesy potomne startują metodą spawn
+i nie dziedziczą połączeń z bazą ani wątków serwera.
+"""
+import csv
+import io
+import logging
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import current_process, get_context
+
+from .column_types import TEXT, get_parser
+from .ingestion import IngestStats, format_copy_value
+
+logger = logging.getLogger(__name__)
+
+# Mniejsze pliki parsujemy w jednym procesie - start puli kosztuje więcej niż zysk
+PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+
+# Docelowy rozmiar zakresu przekazywanego do jednego procesu
+RANGE_SIZE = 8 * 1024 * 1024
+
+# Górny limit procesów parsujących (INGEST_PARSE_WORKERS nadpisuje liczbę procesorów)
+MAX_WORKERS = 8
+
+_SCAN_BLOCK = 16 * 1024 * 1024
+
+
+class ParallelParseError(Exception):
+    """Zakres nie dał się sparsować samodzielnie - plik trzeba wczytać sekwencyjnie"""
+
+
+def parse_workers():
+    workers = int(os.getenv('INGEST_PARSE_WORKERS', 0)) or len(os.sched_getaffinity(0))
+    return max(1, min(workers, MAX_WORKERS))
+
+
+def local_path(file):
+    """Ścieżka pliku z FieldFile albo None, gdy storage nie jest lokalny"""
+    try:
+        return file.path
+    except (NotImplementedError, ValueError):
+        return None
+
+
+def pool_available():
+    """Proces demoniczny (np. uruchomiony przez multiprocessing z daemon=True) nie może mieć procesów potomnych"""
+    return not current_process().daemon
+
+
+def use_parallel(path):
+    return (path is not None and pool_available() and parse_workers() > 1
+            and os.path.getsize(path) >= PARALLEL_MIN_SIZE)
+
+
+def _count_quotes(mm, start, end):
+    count = 0
+    for block_start in range(start, end, _SCAN_BLOCK):
+        count += mm[block_start:min(block_start + _SCAN_BLOCK, end)].count(b'"')
+    return count
+
+
+def split_ranges(path, range_size=RANGE_SIZE):
+    """
+    Pierwszy rekord (nagłówek) i zakresy (początek, koniec) pozostałych
+    rekordów, każdy o rozmiarze co najmniej `range_size` bajtów.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return (0, 0), []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            quotes = 0
+            position = 0
+
+            def next_boundary(target):
+                """Pozycja za pierwszą nową linią >= target leżącą poza cudzysłowem"""
+                nonlocal quotes, position
+                quotes += _count_quotes(mm, position, target)
+                position = target
+                while True:
+                    newline = mm.find(b'\n', position)
+                    if newline == -1:
+                        quotes += _count_quotes(mm, position, size)
+                        position = size
+                        return size
+                    quotes += _count_quotes(mm, position, newline)
+                    position = newline + 1
+                    if quotes % 2 == 0:
+                        return position
+
+            header_end = next_boundary(0)
+            ranges = []
+            start = header_end
+            while start < size:
+                end = size if start + range_size >= size else next_boundary(start + range_size)
+                ranges.append((start, end))
+                start = end
+    return (0, header_end), ranges
+
+
+def read_header(path, encoding='utf-8'):
+    (start, end), ranges = split_ranges(path)
+    with open(path, 'rb') as f:
+        header = next(csv.reader(io.StringIO(f.read(end).decode(encoding), newline='')), [])
+    return header, ranges
+
+
+def _convert(value, converter, idx, failures):
+    """Ta sama konwersja co TypedRows._convert; niepasująca wartość trafia do `failures`"""
+    if converter is None:
+        return value
+    if value is None or not value.strip():
+        return None
+    parser, inferred_parser = converter
+    if parser is not None:
+        try:
+            return parser(value)
+        except ValueError:
+            failures.setdefault(idx, value)
+            return value
+    # Kolumna poszerzona do TEXT - wartości zgodne z pierwotnym typem nadal normalizujemy
+    try:
+        return inferred_parser(value)
+    except ValueError:
+        return value
+
+
+def parse_range(path, start, end, headers, column_types, inferred_types, encoding='utf-8'):
+    """
+    Zakres pliku jako tekst dla COPY. Zwraca (tekst, liczba wierszy,
+    {indeks kolumny: pierwsza wartość niepasująca do jej typu}); przy
+    niepasujących wartościach tekst jest pusty - zakres trzeba powtórzyć
+    po poszerzeniu kolumn.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding)
+
+    keep = [idx for idx, header in enumerate(headers) if header]
+    width = len(headers)
+    converters = []
+    for column_type, inferred_type in zip(column_types, inferred_types):
+        if inferred_type == TEXT:
+            converters.append(None)
+        else:
+            converters.append((None if column_type == TEXT else get_parser(column_type), get_parser(inferred_type)))
+
+    lines = []
+    failures = {}
+    rows = 0
+    all_text = all(converter is None for converter in converters)
+    try:
+        for row in csv.reader(io.StringIO(text, newline=''), strict=True):
+            if len(row) < width:
+                row = row + [None] * (width - len(row))
+            if all_text:
+                lines.append('\t'.join([format_copy_value(row[source]) for source in keep]))
+            else:
+                lines.append('\t'.join([format_copy_value(_convert(row[source], converters[idx], idx, failures))
+                                        for idx, source in enumerate(keep)]))
+            rows += 1
+    except csv.Error as e:
+        raise ParallelParseError(f'Bytes {start}-{end}: {e}')
+
+    if failures:
+        return '', rows, failures
+    lines.append('')
+    return '\n'.join(lines), rows, failures
+
+
+def parallel_copy(cursor, table_name, columns, path, headers, ranges, typed=None, progress=None,
+                  encoding='utf-8'):
+    """
+    Ładowanie zakresów `ranges` przez COPY w kolejności pliku, z parsowaniem
+    w puli procesów. `typed` (TypedRows) daje typy kolumn i poszerza je,
+    gdy zakres zawiera niepasującą wartość; bez niego wszystkie kolumny są TEXT.
+    """
+    copy_sql = f"COPY {table_name} ({', '.join(columns)}) FROM STDIN"
+    stats = IngestStats()
+    stats.start()
+
+    def current_types():
+        if typed is None:
+            return [TEXT] * len(columns), [TEXT] * len(columns)
+        return list(typed.column_types), list(typed.inferred_types)
+
+    workers = parse_workers()
+    with ProcessPoolExecutor(workers, mp_context=get_context('spawn')) as pool:
+        pending = deque()
+        queue = iter(ranges)
+
+        def submit():
+            for start, end in queue:
+                pending.append((start, end, pool.submit(parse_range, path, start, end, headers,
+                                                        *current_types(), encoding)))
+                return
+
+        # Okno 2 zakresów na proces ogranicza pamięć, gdy COPY nie nadąża za parsowaniem
+        for _ in range(workers * 2):
+            submit()
+
+        try:
+            while pending:
+                start, end, future = pending.popleft()
+                text, rows, failures = future.result()
+                while failures:
+                    for idx, value in failures.items():
+                        typed.widen(idx, value)
+                    text, rows, failures = parse_range(path, start, end, headers, *current_types(), encoding)
+
+                with cursor.copy(copy_sql) as copy:
+                    copy.write(text)
+                stats.rows += rows
+                stats.chunks += 1
+                if progress is not None:
+                    progress(stats.rows)
+                submit()
+        except BaseException:
+            for _, _, future in pending:
+                future.cancel()
+            raise
+        finally:
+            stats.stop()
+
+    logger.info(f"Równoległy COPY do {table_name} ({workers} procesów): {stats}")
+    return stats
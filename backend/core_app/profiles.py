@@ -0,0 +1,33 @@
+"""
+Cache profilu użytkownika zwracanego przez /api/auth/user/.
+
+Profil (UserSerializer) jest zapisywany przy logowaniu przez allauth
+i usuwany przy zmianie konta społecznościowego lub użytkownika
+(core_app.signals), więc odpowiedź nie wymaga zapytań o SocialAccount.
+"""
+from django.core.cache import cache
+
+from .serializers import UserSerializer
+
+PROFILE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def profile_cache_key(user_id):
+    return f'user_profile:{user_id}'
+
+
+def cache_user_profile(user):
+    profile = dict(UserSerializer(user).data)
+    cache.set(profile_cache_key(user.pk), profile, PROFILE_CACHE_TIMEOUT)
+    return profile
+
+
+def get_user_profile(user):
+    profile = cache.get(profile_cache_key(user.pk))
+    if profile is None:
+        profile = cache_user_profile(user)
+    return profile
+
+
+def invalidate_user_profile(user_id):
+    cache.delete(profile_cache_key(user_id))
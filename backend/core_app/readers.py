@@ -0,0 +1,440 @@
+"""
+Strumieniowe czytniki plików przestrzennych (GeoJSON, KML, GML, SHP).
+
+Każdy czytnik zwraca generator par (atrybuty, geometria), gdzie geometria
+jest już w postaci EWKT (`SRID=...;WKT`) albo None. Pliki są czytane
+przyrostowo, więc zużycie pamięci nie zależy od ich rozmiaru.
+"""
+import codecs
+import io
+import json
+import logging
+import re
+import struct
+import xml.etree.ElementTree as ET
+from itertools import chain, islice
+
+from .geometry import DEFAULT_SRID, LAT_LON_FIRST_SRIDS, collect_geometries, srid_from_name, to_ewkt
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+_FEATURES_RE = re.compile(r'"features"\s*:\s*\[')
+_CRS_NAME_RE = re.compile(r'"crs"\s*:\s*\{.*?"name"\s*:\s*"([^"]+)"', re.DOTALL)
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+# GeoJSON
+
+def _iter_json_array(text_file, buffer):
+    """Kolejne obiekty tablicy JSON, której zawartość zaczyna się w `buffer`"""
+    decoder = json.JSONDecoder()
+    eof = False
+
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith(']'):
+            return
+
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            raise ValueError('Niekompletna tablica features')
+
+        # Obiekt nie mieści się w buforze - doczytujemy (co najmniej podwajając bufor)
+        chunk = text_file.read(max(READ_CHUNK_SIZE, len(buffer)))
+        eof = not chunk
+        buffer += chunk
+
+
+def read_geojson(fileobj):
+    text_file = io.TextIOWrapper(fileobj, encoding='utf-8-sig')
+    head = ''
+    match = None
+    while match is None:
+        chunk = text_file.read(READ_CHUNK_SIZE)
+        head += chunk
+        match = _FEATURES_RE.search(head)
+        if not chunk:
+            break
+
+    if match is None:
+        # Pojedynczy Feature lub sama geometria
+        document = json.loads(head)
+        features = [document] if document.get('type') == 'Feature' else [
+            {'type': 'Feature', 'properties': {}, 'geometry': document}
+        ]
+        crs_match = None
+    else:
+        features = _iter_json_array(text_file, head[match.end():])
+        crs_match = _CRS_NAME_RE.search(head[:match.start()])
+
+    srid = srid_from_name(crs_match.group(1)) if crs_match else None
+    srid = srid or 4326
+
+    for feature in features:
+        yield feature.get('properties') or {}, to_ewkt(feature.get('geometry'), srid)
+
+
+# KML
+
+def _kml_positions(text):
+    positions = []
+    for token in (text or '').split():
+        values = token.split(',')
+        positions.append([float(values[0]), float(values[1])])
+    return positions
+
+
+def _kml_geometry(element):
+    name = _local_name(element.tag)
+
+    if name == 'Point':
+        positions = _kml_positions(element.findtext('{*}coordinates'))
+        return {'type': 'Point', 'coordinates': positions[0]} if positions else None
+    if name == 'LineString':
+        return {'type': 'LineString', 'coordinates': _kml_positions(element.findtext('{*}coordinates'))}
+    if name == 'Polygon':
+        rings = [_kml_positions(element.findtext('{*}outerBoundaryIs/{*}LinearRing/{*}coordinates'))]
+        for inner in element.iterfind('{*}innerBoundaryIs/{*}LinearRing'):
+            rings.append(_kml_positions(inner.findtext('{*}coordinates')))
+        return {'type': 'Polygon', 'coordinates': rings}
+    if name == 'MultiGeometry':
+        return collect_geometries(_kml_geometry(child) for child in element)
+    return None
+
+
+def _kml_properties(placemark):
+    properties = {}
+    for field in ('name', 'description'):
+        value = placemark.findtext(f'{{*}}{field}')
+        if value is not None:
+            properties[field] = value.strip()
+
+    for data in placemark.iterfind('.//{*}ExtendedData/{*}Data'):
+        properties[data.get('name')] = data.findtext('{*}value')
+    for data in placemark.iterfind('.//{*}ExtendedData/{*}SchemaData/{*}SimpleData'):
+        properties[data.get('name')] = data.text
+    return properties
+
+
+def read_kml(fileobj):
+    for event, element in ET.iterparse(fileobj, events=('end',)):
+        if _local_name(element.tag) != 'Placemark':
+            continue
+
+        geometry = None
+        for child in element:
+            geometry = _kml_geometry(child)
+            if geometry is not None:
+                break
+
+        yield _kml_properties(element), to_ewkt(geometry, 4326)
+        element.clear()
+
+
+# GML
+
+_GML_FEATURE_CONTAINERS = {'featureMember', 'featureMembers', 'member'}
+_GML_GEOMETRIES = {
+    'Point', 'LineString', 'LinearRing', 'Polygon', 'Surface', 'Curve',
+    'MultiPoint', 'MultiLineString', 'MultiCurve', 'MultiPolygon', 'MultiSurface', 'MultiGeometry',
+}
+
+
+def _gml_positions(element, swap):
+    """Współrzędne z gml:posList, gml:pos lub gml:coordinates"""
+    dimension = int(element.get('srsDimension') or element.get('dimension') or 2)
+    pos_list = element.find('.//{*}posList')
+
+    if pos_list is not None:
+        dimension = int(pos_list.get('srsDimension') or dimension)
+        values = [float(v) for v in pos_list.text.split()]
+        positions = [values[i:i + 2] for i in range(0, len(values), dimension)]
+    else:
+        pos = element.findall('.//{*}pos')
+        if pos:
+            positions = [[float(v) for v in p.text.split()[:2]] for p in pos]
+        else:
+            coordinates = element.findtext('.//{*}coordinates') or ''
+            positions = [[float(v) for v in token.split(',')[:2]] for token in coordinates.split()]
+
+    if swap:
+        positions = [[y, x] for x, y in positions]
+    return positions
+
+
+def _gml_geometry(element, swap):
+    name = _local_name(element.tag)
+
+    if name == 'Point':
+        positions = _gml_positions(element, swap)
+        return {'type': 'Point', 'coordinates': positions[0]} if positions else None
+    if name in ('LineString', 'Curve'):
+        return {'type': 'LineString', 'coordinates': _gml_positions(element, swap)}
+    if name == 'LinearRing':
+        return {'type': 'Polygon', 'coordinates': [_gml_positions(element, swap)]}
+    if name in ('Polygon', 'Surface'):
+        rings = []
+        for boundary in element.iter():
+            if _local_name(boundary.tag) in ('exterior', 'outerBoundaryIs'):
+                rings.insert(0, _gml_positions(boundary, swap))
+            elif _local_name(boundary.tag) in ('interior', 'innerBoundaryIs'):
+                rings.append(_gml_positions(boundary, swap))
+        return {'type': 'Polygon', 'coordinates': rings}
+
+    # Multi*: zbieramy geometrie z elementów *Member/*Members
+    members = []
+    for member in element:
+        for child in member:
+            if _local_name(child.tag) in _GML_GEOMETRIES:
+                members.append(_gml_geometry(child, swap))
+    return collect_geometries(members)
+
+
+def _gml_swap_axes(srs_name, srid):
+    # Tylko zapis URN/HTTP wymusza kolejność osi z definicji EPSG
+    srs_name = srs_name or ''
+    return srid in LAT_LON_FIRST_SRIDS and (srs_name.startswith('urn:') or srs_name.startswith('http://www.opengis.net/def/'))
+
+
+def _gml_feature(feature, default_srs):
+    properties = {}
+    geometry = None
+    srid = srid_from_name(default_srs) or DEFAULT_SRID
+
+    for child in feature:
+        geometries = [g for g in child if _local_name(g.tag) in _GML_GEOMETRIES]
+        if geometries:
+            if geometry is None:
+                srs_name = geometries[0].get('srsName') or default_srs
+                srid = srid_from_name(srs_name) or srid
+                geometry = _gml_geometry(geometries[0], _gml_swap_axes(srs_name, srid))
+        elif len(child) == 0 and _local_name(child.tag) != 'boundedBy':
+            properties[_local_name(child.tag)] = child.text
+
+    return properties, to_ewkt(geometry, srid)
+
+
+def read_gml(fileobj):
+    stack = []
+    default_srs = None
+
+    for event, element in ET.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            if default_srs is None and element.get('srsName'):
+                default_srs = element.get('srsName')
+            stack.append(_local_name(element.tag))
+            continue
+
+        stack.pop()
+        if stack and stack[-1] in _GML_FEATURE_CONTAINERS:
+            yield _gml_feature(element, default_srs)
+            element.clear()
+
+
+# Shapefile
+
+_SHP_POINT = {1, 11, 21}
+_SHP_POLYLINE = {3, 13, 23}
+_SHP_POLYGON = {5, 15, 25}
+_SHP_MULTIPOINT = {8, 18, 28}
+
+
+def _ring_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:]))
+
+
+def _shp_geometry(content):
+    shape_type = struct.unpack('<i', content[:4])[0]
+
+    if shape_type == 0:
+        return None
+    if shape_type in _SHP_POINT:
+        return {'type': 'Point', 'coordinates': list(struct.unpack('<2d', content[4:20]))}
+    if shape_type in _SHP_MULTIPOINT:
+        count = struct.unpack('<i', content[36:40])[0]
+        values = struct.unpack(f'<{count * 2}d', content[40:40 + count * 16])
+        return {'type': 'MultiPoint', 'coordinates': [list(values[i:i + 2]) for i in range(0, len(values), 2)]}
+    if shape_type not in _SHP_POLYLINE | _SHP_POLYGON:
+        raise ValueError(f'Nieobsługiwany typ geometrii shapefile: {shape_type}')
+
+    num_parts, num_points = struct.unpack('<2i', content[36:44])
+    parts = list(struct.unpack(f'<{num_parts}i', content[44:44 + num_parts * 4])) + [num_points]
+    offset = 44 + num_parts * 4
+    values = struct.unpack(f'<{num_points * 2}d', content[offset:offset + num_points * 16])
+    points = [list(values[i:i + 2]) for i in range(0, len(values), 2)]
+    rings = [points[parts[i]:parts[i + 1]] for i in range(num_parts)]
+
+    if shape_type in _SHP_POLYLINE:
+        if len(rings) == 1:
+            return {'type': 'LineString', 'coordinates': rings[0]}
+        return {'type': 'MultiLineString', 'coordinates': rings}
+
+    # Pierścienie zewnętrzne są zapisane zgodnie z ruchem wskazówek zegara, otwory przeciwnie
+    polygons = []
+    for ring in rings:
+        if _ring_area(ring) <= 0 or not polygons:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    if len(polygons) == 1:
+        return {'type': 'Polygon', 'coordinates': polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def _iter_shp_records(fileobj):
+    header = fileobj.read(100)
+    if len(header) < 100 or struct.unpack('>i', header[:4])[0] != 9994:
+        raise ValueError('Niepoprawny plik SHP')
+
+    while True:
+        record_header = fileobj.read(8)
+        if len(record_header) < 8:
+            return
+        length = struct.unpack('>2i', record_header)[1] * 2
+        yield _shp_geometry(fileobj.read(length))
+
+
+def _decode_dbf(value, encoding):
+    try:
+        return value.decode(encoding)
+    except UnicodeDecodeError:
+        return value.decode('cp1250', errors='replace')
+
+
+def _iter_dbf_records(fileobj, encoding):
+    header = fileobj.read(32)
+    num_records, header_length, record_length = struct.unpack('<IHH', header[4:12])
+
+    fields = []
+    descriptors = fileobj.read(header_length - 32)
+    for offset in range(0, len(descriptors) - 1, 32):
+        descriptor = descriptors[offset:offset + 32]
+        if descriptor[0] == 0x0D:
+            break
+        name = descriptor[:11].split(b'\x00')[0].decode('ascii', errors='replace')
+        fields.append((name, chr(descriptor[11]), descriptor[16]))
+
+    for _ in range(num_records):
+        record = fileobj.read(record_length)
+        if len(record) < record_length:
+            return
+
+        properties = {}
+        position = 1
+        for name, field_type, length in fields:
+            value = _decode_dbf(record[position:position + length], encoding).strip()
+            position += length
+            if field_type == 'D' and len(value) == 8:
+                value = f'{value[:4]}-{value[4:6]}-{value[6:]}'
+            elif field_type == 'L':
+                value = {'T': 'true', 'Y': 'true', 'F': 'false', 'N': 'false'}.get(value.upper(), '')
+            properties[name] = value
+        # Rekordy oznaczone jako usunięte pomijamy razem z geometrią
+        yield None if record[:1] == b'*' else properties
+
+
+def srid_from_prj(text):
+    authorities = re.findall(r'AUTHORITY\["EPSG",\s*"(\d+)"\]', text)
+    if authorities:
+        return int(authorities[-1])
+    if 'CS92' in text or '1992' in text:
+        return 2180
+    if 'Pseudo_Mercator' in text or 'Pseudo-Mercator' in text or 'Auxiliary_Sphere' in text:
+        return 3857
+    if text.lstrip().startswith('GEOGCS') and ('WGS_1984' in text or 'WGS 84' in text):
+        return 4326
+    return None
+
+
+def read_shapefile(fileobj, open_sibling=None):
+    """
+    Odczyt .shp wraz z atrybutami z .dbf i układem z .prj.
+
+    `open_sibling(ext)` zwraca otwarty binarnie plik towarzyszący
+    (np. '.dbf') albo None, jeśli go nie ma.
+    """
+    open_sibling = open_sibling or (lambda ext: None)
+
+    srid = DEFAULT_SRID
+    prj = open_sibling('.prj')
+    if prj is not None:
+        with prj:
+            srid = srid_from_prj(prj.read().decode('latin-1')) or DEFAULT_SRID
+
+    encoding = 'utf-8'
+    cpg = open_sibling('.cpg')
+    if cpg is not None:
+        with cpg:
+            encoding = cpg.read().decode('ascii', errors='ignore').strip() or encoding
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'utf-8'
+
+    dbf = open_sibling('.dbf')
+    try:
+        records = _iter_dbf_records(dbf, encoding) if dbf is not None else None
+        for geometry in _iter_shp_records(fileobj):
+            properties = next(records, {}) if records is not None else {}
+            if properties is None:
+                continue
+            yield properties, to_ewkt(geometry, srid)
+    finally:
+        if dbf is not None:
+            dbf.close()
+
+
+READERS = {
+    'geojson': read_geojson,
+    'kml': read_kml,
+    'gml': read_gml,
+    'shp': read_shapefile,
+}
+
+
+def read_features(file_type, fileobj, open_sibling=None):
+    if file_type == 'shp':
+        return read_shapefile(fileobj, open_sibling)
+    return READERS[file_type](fileobj)
+
+
+def _format_property(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def feature_rows(features, sample_size):
+    """
+    Zamiana obiektów na wiersze tabeli: kolumny atrybutów ustalane na podstawie
+    pierwszych `sample_size` obiektów, geometria jako ostatnia kolumna.
+    """
+    sample = list(islice(features, sample_size))
+    keys = list(dict.fromkeys(key for properties, _ in sample for key in properties))
+
+    def rows():
+        for properties, geometry in chain(sample, features):
+            yield [_format_property(properties.get(key)) for key in keys] + [geometry]
+
+    return keys, rows()
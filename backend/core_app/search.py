@@ -0,0 +1,77 @@
+"""
+Wyszukiwanie wierszy we wszystkich tabelach z importu.
+
+Korzysta z indeksu SearchEntry: najpierw dopasowanie prefiksowe po
+tsvector, a dla literówek podobieństwo trigramowe (pg_trgm, operator <%).
+Ranking liczony jest tylko dla ograniczonej puli kandydatów, dzięki czemu
+czas odpowiedzi nie rośnie z liczbą pasujących wierszy.
+"""
+from django.db import connection, transaction
+
+from .models import SearchEntry, UploadedFile
+
+DEFAULT_RESULTS = 20
+MAX_RESULTS = 100
+
+# Liczba kandydatów pobieranych z indeksów przed rankingiem
+CANDIDATE_LIMIT = 500
+
+# Górna granica liczby wierszy zwracanych przez skan indeksu GIN dla bardzo częstych słów
+GIN_SCAN_LIMIT = 5000
+
+MIN_QUERY_LENGTH = 2
+
+# Krótsze słowa są dopasowywane dokładnie, a nie jako prefiks
+MIN_PREFIX_LENGTH = 3
+
+
+def search(query, limit=DEFAULT_RESULTS, table_name=None):
+    """Wyniki wyszukiwania posortowane od najlepszego dopasowania"""
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+
+    table_filter = 'AND e.table_name = %s' if table_name else ''
+    table_params = [table_name] if table_name else []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SET LOCAL gin_fuzzy_search_limit = {GIN_SCAN_LIMIT}')
+        cursor.execute(f"""
+            -- Słowa zapytania dzielone tym samym parserem co treść
+            WITH q AS (
+                SELECT to_tsquery(%s, string_agg(
+                    quote_literal(lexeme) || CASE WHEN length(lexeme) >= %s THEN ':*' ELSE '' END, ' & '
+                )) AS query
+                FROM unnest(to_tsvector(%s, %s))
+            ),
+            candidates AS (
+                (SELECT e.id FROM {SearchEntry._meta.db_table} e, q
+                 WHERE e.search_vector @@ q.query {table_filter}
+                 LIMIT %s)
+                UNION
+                (SELECT e.id FROM {SearchEntry._meta.db_table} e
+                 WHERE %s <%% e.content {table_filter}
+                 LIMIT %s)
+            )
+            SELECT e.table_name, e.row_id, e.title,
+                   ts_rank(e.search_vector, q.query) AS rank,
+                   word_similarity(%s, e.content) AS similarity
+            FROM candidates c
+            JOIN {SearchEntry._meta.db_table} e ON e.id = c.id, q
+            ORDER BY e.search_vector @@ q.query DESC, rank DESC, similarity DESC, e.id
+            LIMIT %s
+        """, [SearchEntry.SEARCH_CONFIG, MIN_PREFIX_LENGTH, SearchEntry.SEARCH_CONFIG, query, *table_params, CANDIDATE_LIMIT,
+              query, *table_params, CANDIDATE_LIMIT, query, limit])
+        rows = cursor.fetchall()
+
+    file_titles = dict(
+        UploadedFile.objects.filter(table_name__in={row[0] for row in rows}).values_list('table_name', 'title')
+    )
+    return [{
+        'table_name': table,
+        'file_title': file_titles.get(table),
+        'id': row_id,
+        'title': title,
+        'rank': round(rank, 4),
+        'similarity': round(similarity, 4),
+    } for table, row_id, title, rank, similarity in rows]
@@ -1,4 +1,3 @@
-from allauth.socialaccount.models import SocialAccount
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
@@ -15,19 +14,23 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'email', 'name', 'picture']
 
+    def _google_account(self, obj):
+        # Jedno zapytanie na użytkownika dla obu pól
+        if not hasattr(obj, '_google_account'):
+            obj._google_account = obj.socialaccount_set.filter(provider='google').first()
+        return obj._google_account
+
     def get_picture(self, obj):
-        try:
-            social_account = obj.socialaccount_set.get(provider='google')
-            return social_account.extra_data.get('picture', '')
-        except SocialAccount.DoesNotExist:
+        social_account = self._google_account(obj)
+        if social_account is None:
             return ''
+        return social_account.extra_data.get('picture', '')
 
     def get_name(self, obj):
-        try:
-            social_account = obj.socialaccount_set.get(provider='google')
-            return social_account.extra_data.get('name', obj.get_full_name())
-        except SocialAccount.DoesNotExist:
+        social_account = self._google_account(obj)
+        if social_account is None:
             return obj.get_full_name() or obj.email
+        return social_account.extra_data.get('name', obj.get_full_name())
 
 
 class FileRecordSerializer(serializers.ModelSerializer):
@@ -62,3 +65,40 @@ class SectionTreeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Section
         fields = ['id', 'name', 'order', 'folders']
+
+
+class TreeOperationSerializer(serializers.Serializer):
+    """Pojedyncza operacja na drzewie w /api/tree/batch/"""
+    OPERATIONS = ['create', 'move', 'reorder', 'rename', 'delete']
+    TYPES = ['section', 'folder', 'file']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    type = serializers.ChoiceField(choices=TYPES)
+    id = serializers.UUIDField(required=False)
+    parent = serializers.UUIDField(required=False)
+    name = serializers.CharField(max_length=255, required=False)
+    order = serializers.IntegerField(required=False)
+    file_type = serializers.ChoiceField(choices=FileRecord.FILE_TYPES, required=False)
+
+    def validate(self, attrs):
+        op, node_type = attrs['op'], attrs['type']
+        required = {
+            'create': ['name'] + ([] if node_type == 'section' else ['parent'])
+                      + (['file_type'] if node_type == 'file' else []),
+            'move': ['id', 'parent'],
+            'reorder': ['id', 'order'],
+            'rename': ['id', 'name'],
+            'delete': ['id'],
+        }[op]
+        missing = [field for field in required if field not in attrs]
+        if missing:
+            raise serializers.ValidationError(f"Operation {op} requires: {', '.join(missing)}")
+        if op == 'move' and node_type == 'section':
+            raise serializers.ValidationError('Sections cannot be moved')
+        return attrs
+
+
+class TreeBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 1000
+
+    operations = TreeOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
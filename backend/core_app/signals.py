@@ -0,0 +1,52 @@
+from allauth.account.signals import user_logged_in
+from allauth.socialaccount.models import SocialAccount
+from allauth.socialaccount.signals import social_account_added, social_account_removed, social_account_updated
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import FileRecord, Folder, Section
+from .profiles import cache_user_profile, invalidate_user_profile
+from .tree import invalidate_tree_on_commit
+
+
+# Bez zapytań w sygnałach - właścicieli ustala jedno unieważnienie na transakcję (tree.TreeInvalidation)
+@receiver([post_save, post_delete], sender=Section)
+def section_changed(sender, instance, **kwargs):
+    invalidate_tree_on_commit(user_ids=[instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Folder)
+def folder_changed(sender, instance, **kwargs):
+    invalidate_tree_on_commit(section_ids=[instance.section_id])
+
+
+@receiver([post_save, post_delete], sender=FileRecord)
+def file_record_changed(sender, instance, **kwargs):
+    invalidate_tree_on_commit(folder_ids=[instance.folder_id])
+
+
+@receiver(user_logged_in)
+def user_logged_in_profile(sender, request, user, **kwargs):
+    # Logowanie przez Google odświeża extra_data - zapisujemy aktualny profil
+    transaction.on_commit(lambda: cache_user_profile(user))
+
+
+@receiver([social_account_added, social_account_updated, social_account_removed])
+def social_account_changed(sender, request, sociallogin=None, socialaccount=None, **kwargs):
+    account = socialaccount or sociallogin.account
+    invalidate_user_profile(account.user_id)
+
+
+@receiver([post_save, post_delete], sender=SocialAccount)
+def social_account_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_user_profile(instance.user_id))
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Zapis last_login przy logowaniu nie zmienia profilu
+    if update_fields == frozenset({'last_login'}):
+        return
+    transaction.on_commit(lambda: invalidate_user_profile(instance.pk))
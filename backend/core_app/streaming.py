@@ -0,0 +1,114 @@
+"""
+Strumieniowe renderowanie tabel do HTML i CSV.
+
+Wiersze są czytane kursorem po stronie serwera (albo czytnikiem CSV)
+i wysyłane w paczkach przez StreamingHttpResponse, więc pierwsze bajty
+idą do przeglądarki od razu, a zużycie pamięci nie zależy od rozmiaru tabeli.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils.html import escape
+
+from .archives import open_data
+
+# Liczba wierszy pobieranych z kursora i wysyłanych w jednej paczce
+STREAM_CHUNK_SIZE = 2000
+
+# Liczba wierszy w podglądzie tabeli w panelu administracyjnym
+PREVIEW_ROWS = 1000
+
+PREVIEW_STYLE = (
+    'table { border-collapse: collapse; width: 100%; margin-top: 20px; }'
+    'th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }'
+    'tr:nth-child(even) { background-color: #f2f2f2; }'
+    'th { background-color: #4CAF50; color: white; }'
+    '.table-info { padding: 10px; background-color: #f8f9fa; border-radius: 5px; }'
+)
+
+
+def iter_table_rows(table_name, columns, limit=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Wiersze tabeli czytane nazwanym kursorem w paczkach po `chunk_size`.
+
+    Kursor działa wewnątrz transakcji, więc nie jest materializowany
+    (WITH HOLD) przed wysłaniem pierwszego wiersza.
+    """
+    select = ', '.join(f'"{column}"' for column in columns)
+    query = f'SELECT {select} FROM "{table_name}" ORDER BY 1'
+    params = []
+    if limit is not None:
+        query += ' LIMIT %s'
+        params.append(limit)
+
+    with transaction.atomic():
+        cursor = connection.chunked_cursor()
+        try:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+
+def iter_csv_file_rows(uploaded_file):
+    """Nagłówki i wiersze pliku CSV czytane strumieniowo z magazynu plików (także skompresowanego)"""
+    with open_data(uploaded_file.file, 'csv') as (f, _):
+        yield from csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+
+
+def _chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _html_cell(tag, value):
+    return f'<{tag}>{escape(value) if value is not None else ""}</{tag}>'
+
+
+def iter_html_table(headers, rows, header_html='', chunk_size=STREAM_CHUNK_SIZE):
+    """Strona HTML z tabelą wysyłana w paczkach wierszy; liczba wierszy trafia na koniec strony"""
+    yield f'<html><head><meta charset="utf-8"><style>{PREVIEW_STYLE}</style></head><body>{header_html}<table>'
+    yield '<tr>' + ''.join(_html_cell('th', header) for header in headers) + '</tr>'
+
+    count = 0
+    for chunk in _chunks(rows, chunk_size):
+        count += len(chunk)
+        yield ''.join('<tr>' + ''.join(_html_cell('td', cell) for cell in row) + '</tr>' for row in chunk)
+
+    yield f'</table><p class="table-info">Wyświetlone rekordy: {count}</p></body></html>'
+
+
+class _Echo:
+    """Bufor dla csv.writer, który od razu zwraca zapisany wiersz"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(headers, rows, chunk_size=STREAM_CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def streaming_html_response(headers, rows, header_html=''):
+    return StreamingHttpResponse(iter_html_table(headers, rows, header_html), content_type='text/html; charset=utf-8')
+
+
+def streaming_csv_response(headers, rows, filename):
+    response = StreamingHttpResponse(iter_csv(headers, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
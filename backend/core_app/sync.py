@@ -0,0 +1,187 @@
+"""
+Przyrostowa synchronizacja tabeli z ponownie przesłanym plikiem.
+
+Nowa wersja pliku trafia przez COPY do tymczasowej tabeli o typach kolumn
+tabeli docelowej. Wiersze są porównywane po kluczu naturalnym (np.
+identyfikator) i skrócie md5 całego wiersza, a do tabeli docelowej trafiają
+tylko różnice: INSERT nowych kluczy, UPDATE zmienionych wierszy i DELETE
+kluczy, których nie ma w pliku. Niezmienione wiersze zachowują swoje id,
+a zapisy, indeks wyszukiwania i indeksy tabeli aktualizowane są tylko dla
+zmienionych wierszy.
+"""
+import logging
+import time
+
+from .column_types import BIGINT, BOOLEAN, DATE, INTEGER, NUMERIC, TEXT, TypedRows
+from .geometry import is_geometry_type
+from .ingestion import copy_rows
+
+logger = logging.getLogger(__name__)
+
+# Tabela tymczasowa z nową wersją pliku (schemat pg_temp, usuwana po synchronizacji)
+STAGE_TABLE = 'sync_stage'
+
+# Typy PostgreSQL (format_type) odpowiadające typom kolumn z importu
+_PG_TYPES = {
+    'integer': INTEGER,
+    'bigint': BIGINT,
+    'numeric': NUMERIC,
+    'date': DATE,
+    'boolean': BOOLEAN,
+    'text': TEXT,
+}
+
+
+class SyncError(ValueError):
+    """Plik nie da się zsynchronizować z tabelą - komunikat trafia do użytkownika"""
+
+
+class SyncStats:
+    """Wynik synchronizacji: liczby wierszy wstawionych, zmienionych i usuniętych"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.elapsed = 0.0
+        self.changed_ids = []
+        self.widened = []
+        self.load = None
+
+    @property
+    def unchanged(self):
+        return self.rows - self.inserted - self.updated
+
+    @property
+    def changed(self):
+        return self.inserted + self.updated + self.deleted
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'deleted': self.deleted,
+            'unchanged': self.unchanged,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return (f"{self.rows} wierszy w pliku: +{self.inserted} ~{self.updated} -{self.deleted} "
+                f"({self.unchanged} bez zmian) w {self.elapsed:.2f}s")
+
+
+def table_column_types(cursor, table_name):
+    """Kolumny tabeli (bez id) z typami w zapisie używanym przy imporcie"""
+    cursor.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped AND a.attname <> 'id'
+        ORDER BY a.attnum
+    """, [f'public.{table_name}'])
+    column_types = {}
+    for column, pg_type in cursor.fetchall():
+        column_types[column] = pg_type if is_geometry_type(pg_type) else _PG_TYPES.get(pg_type, TEXT)
+    return column_types
+
+
+def _row_hash(alias, columns):
+    return f"md5(ROW({', '.join(f'{alias}.{column}' for column in columns)})::text)"
+
+
+def sync_rows(cursor, table_name, key, columns, rows, progress=None):
+    """
+    Zastosowanie do `table_name` różnic między tabelą a wierszami `rows`
+    (kolumny `columns`, w kolejności z pliku), dopasowanymi po kolumnie `key`.
+    Wymaga transakcji - błąd w trakcie zostawia tabelę bez zmian.
+    """
+    stats = SyncStats()
+    started = time.perf_counter()
+
+    column_types = table_column_types(cursor, table_name)
+    if not column_types:
+        raise SyncError(f'Table {table_name} does not exist')
+    if key not in columns:
+        raise SyncError(f'Key column {key} is not in the file (columns: {", ".join(columns)})')
+    missing = [column for column in column_types if column not in columns]
+    extra = [column for column in columns if column not in column_types]
+    if missing or extra:
+        raise SyncError(f'File columns do not match {table_name}: missing {missing or "-"}, unexpected {extra or "-"}')
+
+    # Nowa wersja pliku w tabeli tymczasowej o typach kolumn tabeli docelowej
+    # (błąd wycofuje transakcję razem z tabelą tymczasową)
+    cursor.execute(f"CREATE TEMP TABLE {STAGE_TABLE} AS SELECT {', '.join(columns)} FROM {table_name} WITH NO DATA")
+    types = [column_types[column] for column in columns]
+    typed_rows = TypedRows(cursor, STAGE_TABLE, columns, types, rows)
+    stats.load = copy_rows(cursor, STAGE_TABLE, columns, typed_rows, progress=progress)
+    stats.rows = stats.load.rows
+    cursor.execute(f'ANALYZE {STAGE_TABLE}')
+
+    # Wartość spoza typu kolumny poszerzyła kolumnę tabeli tymczasowej - docelową poszerzamy tak samo
+    for column, old_type, new_type in zip(columns, types, typed_rows.column_types):
+        if new_type != old_type:
+            logger.warning(f"Column {column} in {table_name}: widening to {new_type} for sync")
+            stats.widened.append(column)
+            cursor.execute(f'ALTER TABLE {table_name} ALTER COLUMN {column} TYPE {new_type} '
+                           f'USING {column}::{new_type}')
+
+    _check_unique_key(cursor, table_name, key)
+    _apply_changes(cursor, table_name, key, columns, stats)
+    cursor.execute(f'DROP TABLE {STAGE_TABLE}')
+
+    stats.elapsed = time.perf_counter() - started
+    logger.info(f"Sync {table_name} by {key}: {stats}")
+    return stats
+
+
+def _check_unique_key(cursor, table_name, key):
+    cursor.execute(f"""
+        SELECT {key}, count(*) FROM {STAGE_TABLE}
+        GROUP BY {key} HAVING count(*) > 1 OR {key} IS NULL
+        ORDER BY count(*) DESC LIMIT 5
+    """)
+    duplicates = cursor.fetchall()
+    if duplicates:
+        raise SyncError(f'Key column {key} must be unique and not empty in the file: '
+                        + ', '.join(f'{value!r} x{count}' for value, count in duplicates))
+
+    # Indeks unikalny na kluczu zakładamy przy pierwszej synchronizacji - kolejne łączą tabele po nim
+    index_name = f'{table_name}_{key}_key'
+    cursor.execute('SELECT to_regclass(%s)', [f'public.{index_name}'])
+    if cursor.fetchone()[0] is not None:
+        return
+
+    cursor.execute(f'SELECT {key} FROM {table_name} GROUP BY {key} HAVING count(*) > 1 LIMIT 5')
+    duplicates = [row[0] for row in cursor.fetchall()]
+    if duplicates:
+        raise SyncError(f'Key column {key} is not unique in {table_name}: {duplicates}')
+    cursor.execute(f'CREATE UNIQUE INDEX {index_name} ON {table_name} ({key})')
+
+
+def _apply_changes(cursor, table_name, key, columns, stats):
+    cursor.execute(f"""
+        DELETE FROM {table_name} t
+        WHERE NOT EXISTS (SELECT 1 FROM {STAGE_TABLE} s WHERE s.{key} = t.{key})
+        RETURNING t.id
+    """)
+    deleted_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(f"""
+        UPDATE {table_name} t SET {', '.join(f'{column} = s.{column}' for column in columns)}
+        FROM {STAGE_TABLE} s
+        WHERE s.{key} = t.{key} AND {_row_hash('s', columns)} <> {_row_hash('t', columns)}
+        RETURNING t.id
+    """)
+    updated_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(f"""
+        INSERT INTO {table_name} ({', '.join(columns)})
+        SELECT {', '.join(f's.{column}' for column in columns)} FROM {STAGE_TABLE} s
+        WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE t.{key} = s.{key})
+        RETURNING id
+    """)
+    inserted_ids = [row[0] for row in cursor.fetchall()]
+
+    stats.deleted, stats.updated, stats.inserted = len(deleted_ids), len(updated_ids), len(inserted_ids)
+    stats.changed_ids = deleted_ids + updated_ids + inserted_ids
@@ -0,0 +1,266 @@
+"""
+Odczyt wierszy z tabel utworzonych przez import plików.
+
+Nazwy kolumn przyjmowane z żądania są zawsze sprawdzane względem
+information_schema.columns, więc do SQL trafiają tylko istniejące
+identyfikatory; wartości idą jako parametry zapytania.
+"""
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .column_types import PARSERS, BIGINT, BOOLEAN, DATE, INTEGER, NUMERIC
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Parametry żądania, które nie są filtrami kolumn
+RESERVED_PARAMS = {'columns', 'sort', 'cursor', 'limit', 'format', 'bbox'}
+
+# Operatory filtra: kolumna__operator=wartość (bez operatora oznacza eq)
+COMPARISON_OPERATORS = {'eq': '=', 'ne': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+FILTER_OPERATORS = set(COMPARISON_OPERATORS) | {'range', 'in', 'ilike', 'isnull'}
+
+# Typy PostgreSQL (udt_name) kolumn z typem zgadniętym przy imporcie
+UDT_TYPES = {'int4': INTEGER, 'int8': BIGINT, 'numeric': NUMERIC, 'date': DATE, 'bool': BOOLEAN}
+
+
+class TableQueryError(ValueError):
+    pass
+
+
+def get_columns(cursor, table_name):
+    """Kolumny tabeli w kolejności definicji: {nazwa: udt_name}"""
+    cursor.execute("""
+        SELECT column_name, udt_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+        AND table_name = %s
+        ORDER BY ordinal_position
+    """, [table_name])
+    return dict(cursor.fetchall())
+
+
+def get_indexed_columns(cursor, table_name):
+    """Kolumny, które są pierwszą kolumną jakiegoś indeksu"""
+    cursor.execute("""
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE n.nspname = 'public' AND c.relname = %s
+    """, [table_name])
+    return {column for (column,) in cursor.fetchall()}
+
+
+def select_expression(column, udt_name):
+    if udt_name == 'geometry':
+        return f'ST_AsGeoJSON("{column}")::json AS "{column}"'
+    return f'"{column}"'
+
+
+def project_columns(columns, requested=None):
+    """Kolumny do zwrócenia; domyślnie wszystkie oprócz geometrii"""
+    if not requested:
+        return [column for column, udt_name in columns.items() if udt_name != 'geometry']
+
+    unknown = [column for column in requested if column not in columns]
+    if unknown:
+        raise TableQueryError(f"Unknown columns: {', '.join(unknown)}")
+    projected = list(dict.fromkeys(requested))
+    if 'id' not in projected:
+        projected.insert(0, 'id')
+    return projected
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(token, length=None):
+    """
+    Wartości kursora: [id] albo [wartość kolumny sortowania, id]. Kursor
+    przychodzi od klienta, więc kształt jest sprawdzany - `length` to
+    oczekiwana liczba wartości dla bieżącego sortowania.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise TableQueryError('Invalid cursor')
+    if (not isinstance(values, list) or len(values) not in ((length,) if length else (1, 2))
+            or type(values[-1]) is not int
+            or not all(value is None or isinstance(value, (str, int, float)) for value in values)):
+        raise TableQueryError('Invalid cursor')
+    return values
+
+
+def keyset_condition(sort_column, descending, cursor_values):
+    """
+    Warunek "po kursorze" dla sortowania (sort_column, id).
+
+    Rosnąco NULL-e są na końcu (NULLS LAST), malejąco na początku
+    (NULLS FIRST) - tak jak przy przechodzeniu zwykłego indeksu B-tree.
+    """
+    if sort_column == 'id':
+        return ('"id" < %s' if descending else '"id" > %s'), [cursor_values[-1]]
+
+    value, last_id = cursor_values
+    column = f'"{sort_column}"'
+    if not descending:
+        if value is None:
+            return f'({column} IS NULL AND "id" > %s)', [last_id]
+        return (f'({column} > %s OR ({column} = %s AND "id" > %s) OR {column} IS NULL)',
+                [value, value, last_id])
+
+    if value is None:
+        return f'(({column} IS NULL AND "id" < %s) OR {column} IS NOT NULL)', [last_id]
+    return f'({column} < %s OR ({column} = %s AND "id" < %s))', [value, value, last_id]
+
+
+def order_by(sort_column, descending):
+    if sort_column == 'id':
+        return '"id" DESC' if descending else '"id"'
+    if descending:
+        return f'"{sort_column}" DESC NULLS FIRST, "id" DESC'
+    return f'"{sort_column}" ASC NULLS LAST, "id"'
+
+
+def parse_page_size(value):
+    try:
+        page_size = int(value or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise TableQueryError('Invalid limit')
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def _filter_value(column, udt_name, value):
+    """Wartość filtra w postaci zgodnej z typem kolumny (te same formaty co przy imporcie)"""
+    parser = PARSERS.get(UDT_TYPES.get(udt_name))
+    if parser is None:
+        return value
+    try:
+        return parser(value)
+    except ValueError:
+        raise TableQueryError(f'Invalid value for {column}: {value}')
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def compile_filters(columns, filters):
+    """
+    Zamiana filtrów z parametrów żądania na sparametryzowany warunek SQL.
+
+    `filters` to pary (klucz, wartość), np. ('cena__gte', '100000'),
+    ('status__in', 'available,reserved'), ('nazwa__ilike', 'las').
+    Operatory: eq, ne, gt, gte, lt, lte, range (od,do - jeden koniec może
+    być pusty), in (lista po przecinku), ilike (fragment tekstu) oraz
+    isnull (true/false). Zwraca (warunek, parametry).
+    """
+    conditions = []
+    params = []
+    for key, value in filters:
+        column, _, operator = key.partition('__')
+        operator = operator or 'eq'
+        if column not in columns:
+            raise TableQueryError(f'Unknown filter column: {column}')
+        if operator not in FILTER_OPERATORS:
+            raise TableQueryError(f'Unknown filter operator: {operator}')
+
+        udt_name = columns[column]
+        if udt_name == 'geometry':
+            raise TableQueryError(f'Use bbox to filter geometry column: {column}')
+        quoted = f'"{column}"'
+
+        if operator in COMPARISON_OPERATORS:
+            conditions.append(f'{quoted} {COMPARISON_OPERATORS[operator]} %s')
+            params.append(_filter_value(column, udt_name, value))
+        elif operator == 'range':
+            low, separator, high = value.partition(',')
+            if not separator or not (low or high):
+                raise TableQueryError(f'Invalid range for {column}: {value}')
+            if low:
+                conditions.append(f'{quoted} >= %s')
+                params.append(_filter_value(column, udt_name, low))
+            if high:
+                conditions.append(f'{quoted} <= %s')
+                params.append(_filter_value(column, udt_name, high))
+        elif operator == 'in':
+            values = [_filter_value(column, udt_name, item) for item in value.split(',')]
+            conditions.append(f'{quoted} = ANY(%s)')
+            params.append(values)
+        elif operator == 'ilike':
+            conditions.append(f"{quoted}::text ILIKE %s ESCAPE '\\'")
+            params.append(f'%{_escape_like(value)}%')
+        else:
+            is_null = _filter_value(column, 'bool', value) == 't'
+            conditions.append(f'{quoted} IS {"" if is_null else "NOT "}NULL')
+
+    return ' AND '.join(conditions), params
+
+
+def compile_bbox(geometry_column, srid, value):
+    """Warunek przecięcia z prostokątem minx,miny,maxx,maxy podanym w EPSG:4326"""
+    try:
+        bounds = [float(item) for item in value.split(',')]
+    except ValueError:
+        bounds = []
+    if len(bounds) != 4:
+        raise TableQueryError(f'Invalid bbox: {value}')
+    return f'"{geometry_column}" && ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, 4326), %s)', bounds + [srid]
+
+
+def fetch_page(cursor, table_name, columns, projected, sort='id', after=None, page_size=DEFAULT_PAGE_SIZE,
+               where='', params=None):
+    """
+    Jedna strona wierszy z paginacją keyset (bez OFFSET).
+
+    Zwraca (wiersze jako słowniki, kursor następnej strony albo None).
+    `where`/`params` pozwalają dołożyć dodatkowy, już sparametryzowany warunek.
+    """
+    descending = sort.startswith('-')
+    sort_column = sort.lstrip('-')
+    if sort_column not in columns:
+        raise TableQueryError(f'Unknown sort column: {sort_column}')
+    if columns[sort_column] == 'geometry':
+        # Kursor z wartości GeoJSON nie da się porównać z surową geometrią
+        raise TableQueryError(f'Cannot sort by geometry column: {sort_column}')
+    if sort_column != 'id' and sort_column not in get_indexed_columns(cursor, table_name):
+        raise TableQueryError(f'Sorting is only allowed on indexed columns: {sort_column}')
+
+    conditions = [where] if where else []
+    params = list(params or [])
+    if after:
+        condition, condition_params = keyset_condition(
+            sort_column, descending, decode_cursor(after, 1 if sort_column == 'id' else 2))
+        conditions.append(condition)
+        params += condition_params
+
+    # Kolumny potrzebne do zbudowania kursora dokładamy do zapytania
+    selected = list(projected)
+    for column in ('id', sort_column):
+        if column not in selected:
+            selected.append(column)
+
+    cursor.execute(f"""
+        SELECT {', '.join(select_expression(column, columns[column]) for column in selected)}
+        FROM "{table_name}"
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY {order_by(sort_column, descending)}
+        LIMIT %s
+    """, params + [page_size + 1])
+
+    names = [description[0] for description in cursor.description]
+    rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([last['id']] if sort_column == 'id' else [last[sort_column], last['id']])
+
+    return [{column: row[column] for column in projected} for row in rows], next_cursor
@@ -0,0 +1,147 @@
+"""
+Przeładowanie tabeli bez przerwy w odczytach.
+
+Nowa wersja tabeli jest budowana obok działającej (nazwa z przyrostkiem
+__new): COPY, indeksy skopiowane z bieżącej tabeli i ANALYZE. Dopiero na
+końcu transakcji obie tabele zamieniają się nazwami (ALTER TABLE ...
+RENAME), więc blokada ACCESS EXCLUSIVE na bieżącej tabeli trwa tylko
+przez zamianę i zatwierdzenie. Stara wersja (__old) jest usuwana po
+zatwierdzeniu w osobnym wątku, kiedy skończą się zapytania, które jeszcze
+z niej czytają.
+"""
+import logging
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+STAGING_SUFFIX = '__new'
+OLD_SUFFIX = '__old'
+
+# Zamiana nazw czeka na blokadę najwyżej tyle; w tym czasie nowe zapytania stoją w kolejce za nią
+SWAP_LOCK_TIMEOUT = '2s'
+SWAP_ATTEMPTS = 5
+
+# Usunięcie starej wersji może czekać dłużej - nikt poza długimi zapytaniami z niej nie czyta
+DROP_LOCK_TIMEOUT = '60s'
+
+
+def suffixed(table_name, suffix):
+    """Nazwa z przyrostkiem, skrócona tak, żeby zmieściła się w 63 znakach PostgreSQL"""
+    return f'{table_name[:63 - len(suffix)]}{suffix}'
+
+
+def table_exists(cursor, table_name):
+    cursor.execute('SELECT to_regclass(%s)', [f'public.{table_name}'])
+    return cursor.fetchone()[0] is not None
+
+
+def _dependent_names(cursor, table_name):
+    """Indeksy i sekwencje tabeli - ich nazwy zaczynają się od nazwy tabeli"""
+    cursor.execute("""
+        SELECT 'INDEX', ic.relname
+        FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s)
+        UNION ALL
+        SELECT 'SEQUENCE', s.relname
+        FROM pg_depend d JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        WHERE d.refobjid = to_regclass(%s) AND d.deptype IN ('a', 'i')
+    """, [f'public.{table_name}'] * 2)
+    return cursor.fetchall()
+
+
+def rename_table(cursor, table_name, new_name):
+    """Zmiana nazwy tabeli razem z nazwami jej indeksów i sekwencji"""
+    dependents = _dependent_names(cursor, table_name)
+    cursor.execute(f'ALTER TABLE {table_name} RENAME TO {new_name}')
+    for kind, name in dependents:
+        if name.startswith(table_name):
+            cursor.execute(f'ALTER {kind} "{name}" RENAME TO "{new_name}{name[len(table_name):]}"')
+
+
+def copy_indexes(cursor, table_name, staging_name):
+    """
+    Indeksy bieżącej tabeli (poza kluczem głównym) założone na nowej wersji.
+    Indeks na kolumnie, której nowa wersja nie ma, jest pomijany.
+    """
+    cursor.execute("""
+        SELECT ic.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+    """, [f'public.{table_name}'])
+    for name, definition in cursor.fetchall():
+        if not name.startswith(table_name):
+            logger.warning(f"Index {name} on {table_name} does not follow the naming scheme, not copied")
+            continue
+        prefix = f'INDEX {name} ON public.{table_name} '
+        if prefix not in definition:
+            logger.warning(f"Unexpected definition of index {name}, not copied: {definition}")
+            continue
+        definition = definition.replace(prefix, f'INDEX {staging_name}{name[len(table_name):]} '
+                                                f'ON public.{staging_name} ', 1)
+        try:
+            with transaction.atomic():
+                cursor.execute(definition)
+        except DatabaseError as e:
+            logger.warning(f"Index {name} not recreated on {staging_name}: {str(e)}")
+
+
+def prepare_staging(cursor, table_name):
+    """Nazwa tabeli do zbudowania nowej wersji; pozostałości poprzednich przeładowań są usuwane"""
+    staging_name = suffixed(table_name, STAGING_SUFFIX)
+    cursor.execute(f'DROP TABLE IF EXISTS {staging_name}')
+    cursor.execute(f'DROP TABLE IF EXISTS {suffixed(table_name, OLD_SUFFIX)}')
+    return staging_name
+
+
+def swap_tables(cursor, table_name, staging_name):
+    """
+    Podmiana bieżącej tabeli na zbudowaną `staging_name`. Wymaga transakcji -
+    nowa wersja staje się widoczna dla innych połączeń przy jej zatwierdzeniu.
+    """
+    cursor.execute(f'ANALYZE {staging_name}')
+    if not table_exists(cursor, table_name):
+        rename_table(cursor, staging_name, table_name)
+        return
+
+    copy_indexes(cursor, table_name, staging_name)
+    old_name = suffixed(table_name, OLD_SUFFIX)
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            # Krótki lock_timeout: długie zapytanie na bieżącej tabeli nie zatrzymuje wszystkich pozostałych
+            with transaction.atomic():
+                cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+                rename_table(cursor, table_name, old_name)
+                rename_table(cursor, staging_name, table_name)
+            break
+        except OperationalError as e:
+            if attempt == SWAP_ATTEMPTS:
+                raise
+            logger.warning(f"Swap of {table_name} waiting for readers (attempt {attempt}): {str(e)}")
+    cursor.execute('SET LOCAL lock_timeout = 0')
+
+    transaction.on_commit(lambda: drop_table_later(old_name))
+
+
+def drop_table(table_name):
+    """Usunięcie tabeli przez osobne połączenie (poza transakcją importu)"""
+    connection = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET lock_timeout = '{DROP_LOCK_TIMEOUT}'")
+            try:
+                cursor.execute(f'DROP TABLE IF EXISTS {table_name}')
+            finally:
+                # Połączenie wraca do puli - bez zmienionego lock_timeout
+                cursor.execute('RESET lock_timeout')
+        logger.info(f"Dropped previous version {table_name}")
+    except DatabaseError as e:
+        # Zostanie usunięta przy następnym przeładowaniu (prepare_staging)
+        logger.warning(f"Could not drop {table_name}: {str(e)}")
+    finally:
+        connection.close()
+
+
+def drop_table_later(table_name):
+    threading.Thread(target=drop_table, args=(table_name,), name=f'drop-{table_name}', daemon=True).start()
@@ -1,3 +1,997 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from multiprocessing import get_context
+from unittest import mock
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, OperationalError, connection, connections, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks import PARCEL_COLUMNS, Benchmark, generate_parcels_csv
+from .cache import ResponseCache, bump_table_version, cached_table_response, get_table_version, response_cache, \
+    streaming_table_response
+from .column_types import BIGINT, BOOLEAN, DATE, INTEGER, NUMERIC, PARSERS, TEXT, TypedRows, infer_column_types
+from .db_pool import POOL_STATS, pool_stats
+from .dedup import file_sha256
+from .geometry import geometry_type, parse_geometry
+from .indexes import drop_unused_indexes
+from .jobs import MAX_ATTEMPTS, STALE_JOB_TIMEOUT, Heartbeat, claim_next_job
+from .models import CacheVersion, CSVFile, DatabaseTable, FileRecord, Folder, IngestionJob, SearchEntry, Section, \
+    TableIndex, TableStats, UploadedFile
+from .parallel_csv import parallel_copy, parse_range, read_header, split_ranges
+from .readers import feature_rows, read_geojson
+from .search import search
+from .streaming import iter_csv, iter_html_table, iter_table_rows
+from .table_queries import TableQueryError, decode_cursor, encode_cursor, fetch_page
+from .table_swap import SWAP_ATTEMPTS, rename_table, swap_tables
+from .tiles import ATTRIBUTES_MIN_ZOOM, tile_columns
+from .tree import apply_batch, build_tree
+from .uploads import UploadError, complete_upload, start_upload, write_chunk
+
+
+class TemporaryMediaMixin:
+    """Pliki przesłane w teście trafiają do tymczasowego MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UserInfoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='jan', email='jan@example.com', password='x')
+        self.account = SocialAccount.objects.create(
+            user=self.user, provider='google', uid='1',
+            extra_data={'name': 'Jan Kowalski', 'picture': 'https://example.com/jan.png'}
+        )
+        self.client.force_login(self.user)
+
+    def test_profile_served_from_cache(self):
+        response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.json()['name'], 'Jan Kowalski')
+
+        # Tylko sesja i użytkownik - bez zapytań o SocialAccount
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.json(), {
+            'id': self.user.pk,
+            'email': 'jan@example.com',
+            'name': 'Jan Kowalski',
+            'picture': 'https://example.com/jan.png',
+            'isAuthenticated': True,
+        })
+
+    def test_profile_invalidated_on_social_account_update(self):
+        self.client.get('/api/auth/user/')
+
+        self.account.extra_data = {'name': 'Jan Nowak', 'picture': ''}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.save()
+
+        response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.json()['name'], 'Jan Nowak')
+
+
+class ServingConfigTests(SimpleTestCase):
+    def load_gunicorn_config(self, files, environ=None):
+        def fake_open(path, *args, **kwargs):
+            if path not in files:
+                raise FileNotFoundError(path)
+            return io.StringIO(files[path])
+
+        spec = importlib.util.spec_from_file_location(
+            'gunicorn_conf', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+        config = importlib.util.module_from_spec(spec)
+        environ = {key: value for key, value in os.environ.items()
+                   if key not in ('WEB_CONCURRENCY', 'GUNICORN_THREADS', 'PORT')} | (environ or {})
+        with mock.patch.dict(os.environ, environ, clear=True), mock.patch('builtins.open', fake_open):
+            spec.loader.exec_module(config)
+        return config
+
+    def test_workers_follow_container_cpu_limit(self):
+        self.assertEqual(self.load_gunicorn_config({'/sys/fs/cgroup/cpu.max': '150000 100000'}).workers, 5)
+        config = self.load_gunicorn_config({
+            '/sys/fs/cgroup/cpu.max': 'max 100000',
+            '/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '100000',
+            '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000',
+        })
+        self.assertEqual(config.workers, 3)
+
+    def test_worker_count_overridden_by_environment(self):
+        config = self.load_gunicorn_config({}, {'WEB_CONCURRENCY': '2', 'GUNICORN_THREADS': '8', 'PORT': '9000'})
+        self.assertEqual((config.workers, config.threads, config.bind), (2, 8, '0.0.0.0:9000'))
+
+    def test_hashed_static_files_are_immutable(self):
+        immutable = re.compile(settings.WHITENOISE_IMMUTABLE_FILE_TEST)
+        self.assertTrue(immutable.match('static/js/main.1a2b3c4d.chunk.js'))
+        self.assertTrue(immutable.match('admin/css/base.0123456789ab.css'))
+        self.assertFalse(immutable.match('favicon.ico'))
+
+
+class DatabaseHealthTests(TestCase):
+    def test_health_reports_database_and_pool(self):
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ok')
+        self.assertGreaterEqual(response.json()['db_ms'], 0)
+
+    def test_unreachable_database_is_503(self):
+        with mock.patch('core_app.views.check_database', side_effect=DatabaseError('connection refused')):
+            response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'status': 'error', 'error': 'connection refused'})
+
+    def test_pool_stats_limited_to_published_keys(self):
+        pool = mock.Mock(**{'get_stats.return_value': {'pool_size': 3, 'pool_available': 1, 'internal': 9}})
+        with mock.patch.object(type(connections['default']), 'pool', new_callable=mock.PropertyMock,
+                               return_value=pool):
+            stats = pool_stats()
+        self.assertEqual(set(stats), set(POOL_STATS))
+        self.assertEqual((stats['pool_size'], stats['pool_available'], stats['requests_num']), (3, 1, 0))
+
+
+class MetricsTests(TestCase):
+    @override_settings(METRICS_TOKEN='sekret')
+    def test_metrics_require_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer inny').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer sekret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds', response.content)
+
+    def test_server_timing_counts_queries(self):
+        response = self.client.get('/api/health/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+
+class BenchmarkHarnessTests(SimpleTestCase):
+    def test_generated_parcels_are_deterministic(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            first = generate_parcels_csv(os.path.join(workdir, 'a.csv'), 50, geometry=True)
+            second = generate_parcels_csv(os.path.join(workdir, 'b.csv'), 50, geometry=True)
+            with open(first, encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+            with open(second, encoding='utf-8') as f:
+                self.assertEqual(list(csv.reader(f)), rows)
+
+        self.assertEqual(rows[0], ['geom'] + PARCEL_COLUMNS)
+        self.assertEqual(len(rows), 51)
+        self.assertTrue(rows[1][0].startswith('010300002084080000'))
+
+    def test_benchmark_skips_warmup_round(self):
+        calls = []
+        bench = Benchmark(rounds=3)
+        stats = bench.run('group', 'case', calls.append, setup=lambda: (len(calls),), size=1)
+
+        self.assertEqual(calls, [0, 1, 2, 3])
+        self.assertEqual(stats['rounds'], 3)
+        self.assertEqual(bench.results[0]['fullname'], 'group::case')
+        self.assertEqual(bench.results[0]['params'], {'size': 1})
+
+
+class ColumnTypeTests(SimpleTestCase):
+    def test_narrowest_type_inferred_per_column(self):
+        sample = [
+            ['1', '3000000000', '1 234,50 zł', '31.12.2023', 'tak', 'A1', None],
+            ['2', '7', '2.5', '2024-01-31', 'nie', '12', ' '],
+        ]
+        self.assertEqual(infer_column_types(sample, 7), [INTEGER, BIGINT, NUMERIC, DATE, BOOLEAN, TEXT, TEXT])
+
+    def test_values_normalized_for_copy(self):
+        self.assertEqual(PARSERS[NUMERIC]('1 234,50 zł'), '1234.50')
+        self.assertEqual(PARSERS[DATE]('31.12.2023'), '2023-12-31')
+        self.assertEqual(PARSERS[BOOLEAN]('Tak'), 't')
+        with self.assertRaises(ValueError):
+            PARSERS[INTEGER]('2147483648')
+
+
+class GeometryTests(SimpleTestCase):
+    def test_geometry_column_inferred_with_embedded_srid(self):
+        self.assertEqual(infer_column_types([['POINT(21 52)'], ['SRID=4326;LINESTRING(0 0, 1 1)']], 1),
+                         [geometry_type(4326)])
+        self.assertEqual(infer_column_types([['SRID=2180;POINT(500000 500000)']], 1), [geometry_type(2180)])
+
+    def test_geojson_converted_to_ewkt(self):
+        self.assertEqual(parse_geometry('{"type": "Point", "coordinates": [21, 52]}', 4326),
+                         'SRID=4326;POINT(21.0 52.0)')
+        with self.assertRaises(ValueError):
+            parse_geometry('SRID=2180;POINT(1 2)', 4326)
+
+    def test_geojson_features_become_rows_in_declared_crs(self):
+        document = io.BytesIO(b'''{
+            "type": "FeatureCollection",
+            "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::2180"}},
+            "features": [
+                {"type": "Feature", "properties": {"nr": "1/2", "pow": 0.5},
+                 "geometry": {"type": "Point", "coordinates": [500000, 600000]}},
+                {"type": "Feature", "properties": {"nr": "3"}, "geometry": null}
+            ]
+        }''')
+        keys, rows = feature_rows(read_geojson(document), 10)
+        self.assertEqual(keys, ['nr', 'pow'])
+        self.assertEqual(list(rows), [['1/2', '0.5', 'SRID=2180;POINT(500000.0 600000.0)'], ['3', None, None]])
+
+
+class TableQueryTests(SimpleTestCase):
+    def test_geometry_column_cannot_be_sorted(self):
+        with self.assertRaisesMessage(TableQueryError, 'Cannot sort by geometry column: geom'):
+            fetch_page(None, 'dzialki', {'id': 'int4', 'geom': 'geometry'}, ['id'], sort='-geom')
+
+    def test_cursor_that_is_not_a_list_is_rejected(self):
+        for values in (5, {'id': 5}, 'abc', None):
+            with self.subTest(values=values), self.assertRaisesMessage(TableQueryError, 'Invalid cursor'):
+                fetch_page(None, 'dzialki', {'id': 'int4'}, ['id'], after=encode_cursor(values))
+
+    def test_cursor_with_wrong_length_or_id_is_rejected(self):
+        for values in ([], [1, 2], ['1'], [True], [1.5]):
+            with self.subTest(values=values), self.assertRaisesMessage(TableQueryError, 'Invalid cursor'):
+                fetch_page(None, 'dzialki', {'id': 'int4'}, ['id'], after=encode_cursor(values))
+        with self.assertRaisesMessage(TableQueryError, 'Invalid cursor'):
+            decode_cursor(encode_cursor([{'a': 1}, 2]), 2)
+        self.assertEqual(decode_cursor(encode_cursor(['2024-01-01', 7]), 2), ['2024-01-01', 7])
+
+
+class TableRowsTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(RESPONSE_CACHE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.enterContext(mock.patch.dict('core_app.cache._versions', clear=True))
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE dzialki_rows (id serial PRIMARY KEY, nr text, cena integer)')
+            cursor.execute('CREATE INDEX dzialki_rows_cena ON dzialki_rows (cena)')
+            cursor.execute("""
+                INSERT INTO dzialki_rows (nr, cena)
+                VALUES ('a', 300), ('b', NULL), ('c', 100), ('d', 300), ('e', 200)
+            """)
+        UploadedFile.objects.bulk_create([
+            UploadedFile(title='dzialki', file='uploads/dzialki.csv', file_type='csv', table_name='dzialki_rows'),
+        ])
+
+    def pages(self, query):
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(f'/api/tables/dzialki_rows/rows/?{query}'
+                                       + (f'&cursor={cursor}' if cursor else ''))
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['nr'] for row in response.json()['rows']])
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_pages_follow_cursor(self):
+        self.assertEqual(self.pages('limit=2'), [['a', 'b'], ['c', 'd'], ['e']])
+
+    def test_sort_by_indexed_column_with_ties_and_nulls(self):
+        self.assertEqual(self.pages('limit=2&sort=cena'), [['c', 'e'], ['a', 'd'], ['b']])
+        self.assertEqual(self.pages('limit=2&sort=-cena'), [['b', 'd'], ['a', 'e'], ['c']])
+
+    def test_projection_and_sort_validation(self):
+        response = self.client.get('/api/tables/dzialki_rows/rows/?columns=cena&limit=1')
+        self.assertEqual(response.json()['columns'], ['id', 'cena'])
+        self.assertEqual(self.client.get('/api/tables/dzialki_rows/rows/?sort=nr').status_code, 400)
+        self.assertEqual(self.client.get('/api/tables/dzialki_rows/rows/?columns=haslo').status_code, 400)
+
+
+class StreamingPreviewTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE dzialki_stream (id serial PRIMARY KEY, opis text)')
+            cursor.execute("INSERT INTO dzialki_stream (opis) VALUES ('<b>las</b>'), (NULL), ('łąka, rola')")
+
+    def test_table_rows_read_in_chunks(self):
+        self.assertEqual(list(iter_table_rows('dzialki_stream', ['id', 'opis'], chunk_size=2)),
+                         [(1, '<b>las</b>'), (2, None), (3, 'łąka, rola')])
+        self.assertEqual(len(list(iter_table_rows('dzialki_stream', ['id'], limit=2))), 2)
+
+    def test_html_cells_escaped_and_rows_counted(self):
+        html = ''.join(iter_html_table(['opis'], [['<b>las</b>'], [None]], chunk_size=1))
+        self.assertIn('<td>&lt;b&gt;las&lt;/b&gt;</td>', html)
+        self.assertIn('<td></td>', html)
+        self.assertIn('Wyświetlone rekordy: 2', html)
+
+    def test_admin_export_streams_whole_table_as_csv(self):
+        admin = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_login(admin)
+        with mock.patch.dict('core_app.cache._versions', clear=True):
+            response = self.client.get(reverse('admin:export-table-csv', args=['dzialki_stream']))
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         ''.join(iter_csv(['id', 'opis'], [[1, '<b>las</b>'], [2, None], [3, 'łąka, rola']])))
+        self.assertIn('dzialki_stream.csv', response['Content-Disposition'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE dzialki_szukaj (id serial PRIMARY KEY, adres text, gmina text, cena integer)')
+            cursor.execute("""
+                INSERT INTO dzialki_szukaj (adres, gmina, cena)
+                VALUES ('Leśna 5', 'Piaseczno', 100), ('Polna 12', 'Leszno', 200), ('Długa 1', NULL, 300)
+            """)
+            self.indexed = SearchEntry.index_table(cursor, 'dzialki_szukaj', ['adres', 'gmina'])
+        UploadedFile.objects.bulk_create([
+            UploadedFile(title='Działki', file='uploads/dzialki.csv', file_type='csv', table_name='dzialki_szukaj'),
+        ])
+
+    def require_trigrams(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not installed')
+
+    def test_rows_indexed_with_title_column(self):
+        self.assertEqual(self.indexed, 3)
+        entry = SearchEntry.objects.get(table_name='dzialki_szukaj', row_id=3)
+        self.assertEqual((entry.title, entry.content), ('Długa 1', 'Długa 1'))
+
+    def test_reindex_of_changed_rows_only(self):
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE dzialki_szukaj SET adres = 'Krótka 2'")
+            SearchEntry.index_table(cursor, 'dzialki_szukaj', ['adres', 'gmina'], row_ids=[2])
+        self.assertEqual(list(SearchEntry.objects.filter(table_name='dzialki_szukaj').order_by('row_id')
+                              .values_list('title', flat=True)), ['Leśna 5', 'Krótka 2', 'Długa 1'])
+
+    def test_prefix_match_ranked_first(self):
+        self.require_trigrams()
+        results = search('lesz')
+        self.assertEqual([(row['id'], row['file_title']) for row in results[:1]], [(2, 'Działki')])
+        self.assertEqual(search('l'), [])
+
+    def test_endpoint_validates_limit(self):
+        self.assertEqual(self.client.get('/api/search/?q=les&limit=x').status_code, 400)
+
+
+class TableStatsTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE dzialki_stats (id serial PRIMARY KEY, nazwa text)')
+            cursor.execute("INSERT INTO dzialki_stats (nazwa) SELECT 'd' || i FROM generate_series(1, 5) i")
+
+    def test_recorded_count_used_without_counting_rows(self):
+        TableStats.record_ingest('dzialki_stats', 5)
+        # Jedno zapytanie o tabele i jedno o indeksy - bez COUNT(*)
+        with self.assertNumQueries(2):
+            table = DatabaseTable.get_table('dzialki_stats')
+        self.assertEqual((table.row_count, table.row_count_exact), (5, True))
+        self.assertIsNotNone(table.last_ingested_at)
+
+    def test_estimate_used_until_counted(self):
+        table = DatabaseTable.get_table('dzialki_stats')
+        self.assertFalse(table.row_count_exact)
+
+        self.assertEqual(TableStats.count_exact('dzialki_stats'), 5)
+        table = DatabaseTable.get_table('dzialki_stats')
+        self.assertEqual((table.row_count, table.row_count_exact), (5, True))
+        self.assertEqual([index['name'] for index in table.indexes], ['dzialki_stats_pkey'])
+
+
+class VectorTileTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(RESPONSE_CACHE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.enterContext(mock.patch.dict('core_app.cache._versions', clear=True))
+        UploadedFile.objects.bulk_create([
+            UploadedFile(title='dzialki', file='uploads/dzialki.geojson', file_type='geojson',
+                         table_name='dzialki_mvt'),
+        ])
+
+    def test_coordinates_outside_the_grid_are_rejected(self):
+        for url in ('/api/tiles/dzialki_mvt/23/0/0.mvt', '/api/tiles/dzialki_mvt/2/4/0.mvt',
+                    '/api/tiles/dzialki_mvt/2/0/4.mvt'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_only_uploaded_tables_are_served(self):
+        response = self.client.get('/api/tiles/auth_user/0/0/0.mvt')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Table not found'})
+
+    def test_unknown_fields_are_rejected(self):
+        with mock.patch('core_app.tiles.get_layer_info', return_value=('geom', 4326, ['id', 'nr'])):
+            response = self.client.get('/api/tiles/dzialki_mvt/14/9000/5000.mvt?fields=nr,haslo')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown fields: haslo'})
+
+    def test_attributes_only_from_min_zoom(self):
+        columns = ['id', 'nr', 'cena']
+        self.assertEqual(tile_columns(columns, ATTRIBUTES_MIN_ZOOM - 1), ['id'])
+        self.assertEqual(tile_columns(columns, ATTRIBUTES_MIN_ZOOM), columns)
+        self.assertEqual(tile_columns(columns, 3, fields=['cena']), ['id', 'cena'])
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(RESPONSE_CACHE_ROOT=root.name))
+        self.root = root.name
+        # Wersje zapamiętane w procesie przez poprzednie testy nie istnieją w tej bazie
+        self.enterContext(mock.patch.dict('core_app.cache._versions', clear=True))
+        response_cache.clear_table('dzialki_cache')
+
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE dzialki_cache (id serial PRIMARY KEY, nazwa text)')
+            cursor.execute("INSERT INTO dzialki_cache (nazwa) VALUES ('a'), ('b'), ('c')")
+        UploadedFile.objects.bulk_create([
+            UploadedFile(title='dzialki', file='uploads/dzialki.csv', file_type='csv', table_name='dzialki_cache'),
+        ])
+
+    def disk_bytes(self):
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(self.root) for name in names)
+
+    def test_unrelated_parameters_share_an_entry(self):
+        first = self.client.get('/api/tables/dzialki_cache/rows/?limit=2')
+        self.assertEqual([row['nazwa'] for row in first.json()['rows']], ['a', 'b'])
+
+        response = self.client.get('/api/tables/dzialki_cache/rows/?_=1&limit=2',
+                                   HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'tables', 'dzialki_cache', '0'))), 1)
+
+    def test_cache_hit_skips_database(self):
+        first = self.client.get('/api/tables/dzialki_cache/query/?nazwa__in=a,c&format=ids')
+        self.assertEqual(len(first.json()['ids']), 2)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tables/dzialki_cache/query/?format=ids&nazwa__in=a,c')
+        self.assertEqual(response.content, first.content)
+
+    def test_tables_outside_uploads_are_not_served(self):
+        for url in ('/api/tables/core_app_cacheversion/rows/', '/api/tiles/core_app_cacheversion/0/0/0.mvt'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'tables', 'core_app_cacheversion')))
+
+    def test_version_bumped_elsewhere_invalidates_after_ttl(self):
+        first = self.client.get('/api/tables/dzialki_cache/rows/')
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO dzialki_cache (nazwa) VALUES ('d')")
+        # Podbicie z innej instancji - tylko wiersz w bazie
+        CacheVersion.objects.create(name='dzialki_cache', version=7)
+
+        response = self.client.get('/api/tables/dzialki_cache/rows/')
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        with mock.patch('core_app.cache.time.monotonic', return_value=10 ** 9):
+            response = self.client.get('/api/tables/dzialki_cache/rows/')
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(len(response.json()['rows']), 4)
+
+    def test_bump_invalidates_etag(self):
+        first = self.client.get('/api/tables/dzialki_cache/rows/')
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE dzialki_cache SET nazwa = 'z' WHERE nazwa = 'a'")
+        bump_table_version('dzialki_cache')
+
+        response = self.client.get('/api/tables/dzialki_cache/rows/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['rows'][0]['nazwa'], 'z')
+
+    def test_only_successful_responses_are_cached(self):
+        request = RequestFactory().get('/')
+        render = mock.Mock(side_effect=[JsonResponse({'error': 'x'}, status=400), HttpResponse(b'ok')])
+        for status in (400, 200):
+            self.assertEqual(cached_table_response(request, 'dzialki_cache', 'k', render).status_code, status)
+        self.assertEqual(cached_table_response(request, 'dzialki_cache', 'k', render).content, b'ok')
+        self.assertEqual(render.call_count, 2)
+
+    def test_streaming_response_revalidated_without_rendering(self):
+        render = mock.Mock(return_value=StreamingHttpResponse(iter([b'a;b\n'])))
+        first = streaming_table_response(RequestFactory().get('/'), 'dzialki_cache', 'csv', render)
+        self.assertTrue(first['ETag'].startswith('W/'))
+
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(streaming_table_response(request, 'dzialki_cache', 'csv', render).status_code, 304)
+        self.assertEqual(render.call_count, 1)
+
+    def test_bump_increments_shared_counter(self):
+        self.assertEqual(get_table_version('dzialki_cache'), 0)
+        self.assertEqual([bump_table_version('dzialki_cache') for _ in range(2)], [1, 2])
+        self.assertEqual(CacheVersion.objects.get(name='dzialki_cache').version, 2)
+        self.assertEqual(get_table_version('dzialki_cache'), 2)
+
+    @override_settings(RESPONSE_CACHE_MAX_BYTES=4000)
+    def test_disk_entries_pruned_to_size_limit(self):
+        store = ResponseCache(max_items=0)
+        for i in range(3):
+            store.set('dzialki_cache', 0, f'k{i}', 'application/json', b'x' * 1000)
+        # Odczyt z dysku odświeża wpis - przy przycinaniu zostaje dłużej niż k1 i k2
+        self.assertIsNotNone(store.get('dzialki_cache', 0, 'k0'))
+        for i in range(3, 5):
+            store.set('dzialki_cache', 0, f'k{i}', 'application/json', b'x' * 1000)
+
+        self.assertLessEqual(self.disk_bytes(), 4000)
+        self.assertIsNotNone(store.get('dzialki_cache', 0, 'k0'))
+        self.assertIsNone(store.get('dzialki_cache', 0, 'k1'))
+        self.assertIsNotNone(store.get('dzialki_cache', 0, 'k4'))
+
+
+class SectionTreeTests(TransactionTestCase):
+    def setUp(self):
+        self.enterContext(override_settings(RESPONSE_CACHE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.enterContext(mock.patch.dict('core_app.cache._versions', clear=True))
+        self.user = get_user_model().objects.create_user(username='jan', email='jan@example.com', password='x')
+        self.section = Section.objects.create(user=self.user, name='Gmina')
+        folder = Folder.objects.create(section=self.section, name='Obręb 1')
+        FileRecord.objects.create(folder=folder, name='dzialki', file_type='csv')
+        self.client.force_login(self.user)
+
+    def test_tree_built_with_one_query(self):
+        with self.assertNumQueries(1):
+            tree = build_tree(self.user)
+        self.assertEqual([(section['name'], [(folder['name'], [file['name'] for file in folder['files']])
+                                             for folder in section['folders']]) for section in tree],
+                         [('Gmina', [('Obręb 1', ['dzialki'])])])
+
+    def test_tree_revalidated_until_changed(self):
+        first = self.client.get('/api/sections/tree/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get('/api/sections/tree/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        Folder.objects.create(section=self.section, name='Obręb 2')
+        response = self.client.get('/api/sections/tree/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([folder['name'] for folder in response.json()[0]['folders']], ['Obręb 1', 'Obręb 2'])
+
+
+class TreeBatchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='jan', email='jan@example.com', password='x')
+        self.section = Section.objects.create(user=self.user, name='Gmina')
+        self.folder = Folder.objects.create(section=self.section, name='Obręb 1')
+        other = get_user_model().objects.create_user(username='ewa', email='ewa@example.com', password='x')
+        self.other_section = Section.objects.create(user=other, name='Gmina')
+        self.other_folder = Folder.objects.create(section=self.other_section, name='Obręb 1')
+        self.client.force_login(self.user)
+
+    def batch(self, *operations):
+        return self.client.post('/api/tree/batch/', {'operations': list(operations)}, content_type='application/json')
+
+    def test_nodes_of_other_users_are_not_found(self):
+        for operation in (
+            {'op': 'rename', 'type': 'folder', 'id': str(self.other_folder.pk), 'name': 'Cudzy'},
+            {'op': 'move', 'type': 'folder', 'id': str(self.folder.pk), 'parent': str(self.other_section.pk)},
+            {'op': 'create', 'type': 'file', 'parent': str(self.other_folder.pk), 'name': 'x', 'file_type': 'csv'},
+        ):
+            with self.subTest(operation=operation['op']):
+                response = self.batch({'op': 'rename', 'type': 'section', 'id': str(self.section.pk),
+                                       'name': 'Powiat'}, operation)
+                self.assertEqual(response.status_code, 404)
+        # Cały batch odrzucony - także poprawna pierwsza operacja
+        self.assertEqual(Section.objects.get(pk=self.section.pk).name, 'Gmina')
+        self.assertEqual(Folder.objects.get(pk=self.other_folder.pk).name, 'Obręb 1')
+
+    def test_invalid_operations_are_rejected(self):
+        for operation in (
+            {'op': 'rename', 'type': 'folder', 'id': str(self.folder.pk)},
+            {'op': 'move', 'type': 'section', 'id': str(self.section.pk), 'parent': str(self.section.pk)},
+            {'op': 'create', 'type': 'file', 'parent': str(self.folder.pk), 'name': 'x'},
+            {'op': 'create', 'type': 'folder', 'parent': str(self.section.pk), 'name': 'Obręb 1'},
+        ):
+            with self.subTest(operation=operation):
+                self.assertEqual(self.batch(operation).status_code, 400)
+        self.assertEqual(self.batch().status_code, 400)
+
+    def test_created_nodes_can_be_referenced_in_the_same_batch(self):
+        section_id, folder_id = str(uuid.uuid4()), str(uuid.uuid4())
+        response = self.batch(
+            {'op': 'create', 'type': 'section', 'id': section_id, 'name': 'Powiat'},
+            {'op': 'create', 'type': 'folder', 'id': folder_id, 'parent': section_id, 'name': 'Obręb 2'},
+            {'op': 'move', 'type': 'folder', 'id': str(self.folder.pk), 'parent': section_id, 'order': 1},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], [section_id, folder_id])
+        self.assertEqual(list(Folder.objects.filter(section_id=section_id).values_list('name', flat=True)),
+                         ['Obręb 2', 'Obręb 1'])
+
+
+class TreeInvalidationTests(TransactionTestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.dict('core_app.cache._versions', clear=True))
+        self.user = get_user_model().objects.create_user(username='jan', email='jan@example.com', password='x')
+        self.section = Section.objects.create(user=self.user, name='Gmina')
+        self.folders = [Folder.objects.create(section=self.section, name=f'Obręb {i}') for i in range(3)]
+        for folder in self.folders:
+            FileRecord.objects.bulk_create([
+                FileRecord(folder=folder, name=f'plik {i}', file_type='csv') for i in range(2)
+            ])
+
+    def test_cascade_delete_bumps_tree_once(self):
+        with mock.patch('core_app.tree.invalidate_user_tree') as invalidate, self.assertNumQueries(9):
+            # SELECT folderów i plików, transakcja z DELETE na model i dwa zapytania o właścicieli
+            # po zatwierdzeniu - liczba zapytań nie zależy od liczby usuwanych obiektów
+            self.section.delete()
+        invalidate.assert_called_once_with(self.user.pk)
+
+    def test_batch_delete_shares_one_invalidation(self):
+        with mock.patch('core_app.tree.invalidate_user_tree') as invalidate:
+            apply_batch(self.user, [
+                {'op': 'delete', 'type': 'folder', 'id': folder.pk} for folder in self.folders[:2]
+            ] + [{'op': 'rename', 'type': 'section', 'id': self.section.pk, 'name': 'Powiat'}])
+        invalidate.assert_called_once_with(self.user.pk)
+        self.assertEqual(Folder.objects.filter(section=self.section).count(), 1)
+
+
+class IngestionQueueTests(TestCase):
+    def test_stale_job_without_attempts_left_is_failed(self):
+        job = IngestionJob.objects.create(file='uploads/dzialki.csv', title='dzialki', file_type='csv',
+                                          phase=IngestionJob.PHASE_LOADING, attempts=MAX_ATTEMPTS,
+                                          heartbeat_at=timezone.now() - STALE_JOB_TIMEOUT * 2)
+
+        self.assertIsNone(claim_next_job('test'))
+        job.refresh_from_db()
+        self.assertEqual(job.phase, IngestionJob.PHASE_FAILED)
+        self.assertIn('gave up after', job.error)
+
+    def test_stale_job_is_reclaimed_without_its_partial_upload(self):
+        job = IngestionJob.objects.create(file='uploads/dzialki.csv', title='dzialki', file_type='csv',
+                                          phase=IngestionJob.PHASE_LOADING, attempts=1, worker='host:1',
+                                          heartbeat_at=timezone.now() - STALE_JOB_TIMEOUT * 2)
+        # Rekord zapisany przez save() przed transakcją importu, której worker nie dokończył
+        UploadedFile.objects.bulk_create([
+            UploadedFile(title='dzialki', file='uploads/dzialki.csv', file_type='csv'),
+            UploadedFile(title='inne', file='uploads/inne.csv', file_type='csv'),
+        ])
+
+        claimed = claim_next_job('host:2')
+        self.assertEqual((claimed.pk, claimed.attempts, claimed.worker), (job.pk, 2, 'host:2'))
+        self.assertEqual(list(UploadedFile.objects.values_list('title', flat=True)), ['inne'])
+
+    def test_job_with_recent_heartbeat_is_not_reclaimed(self):
+        IngestionJob.objects.create(file='uploads/dzialki.csv', title='dzialki', file_type='csv',
+                                    phase=IngestionJob.PHASE_LOADING, attempts=1,
+                                    heartbeat_at=timezone.now() - STALE_JOB_TIMEOUT / 2)
+        self.assertIsNone(claim_next_job('test'))
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    def test_heartbeat_refreshes_job_without_progress(self):
+        stale = timezone.now() - STALE_JOB_TIMEOUT * 2
+        job = IngestionJob.objects.create(file='uploads/dzialki.csv', title='dzialki', file_type='csv',
+                                          phase=IngestionJob.PHASE_LOADING, attempts=1, heartbeat_at=stale)
+        heartbeat = Heartbeat(job, interval=0.01)
+        heartbeat.start()
+        try:
+            for _ in range(200):
+                job.refresh_from_db()
+                if job.heartbeat_at > stale:
+                    break
+                time.sleep(0.01)
+        finally:
+            heartbeat.stop()
+        self.assertGreater(job.heartbeat_at, timezone.now() - STALE_JOB_TIMEOUT)
+        self.assertIsNone(claim_next_job('test'))
+
+
+class UnusedIndexTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE dzialki_idx (id serial PRIMARY KEY, cena integer)')
+            cursor.execute('CREATE INDEX dzialki_idx_cena_btree ON dzialki_idx (cena)')
+        self.index = TableIndex.objects.create(index_name='dzialki_idx_cena_btree', table_name='dzialki_idx',
+                                               column_name='cena', method=TableIndex.METHOD_BTREE)
+
+    def test_index_dropped_only_after_counter_unchanged_for_window(self):
+        # Pierwsze wywołanie tylko zapamiętuje licznik
+        self.assertEqual(drop_unused_indexes(), [])
+        TableIndex.objects.update(idx_scan_changed_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(drop_unused_indexes(dry_run=True), ['dzialki_idx_cena_btree'])
+
+    def test_changed_counter_restarts_the_window(self):
+        TableIndex.objects.update(idx_scan=5, idx_scan_changed_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(drop_unused_indexes(), [])
+        self.index.refresh_from_db()
+        self.assertEqual(self.index.idx_scan, 0)
+
+
+class ParallelCSVTests(SimpleTestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.path = os.path.join(workdir.name, 'quoted.csv')
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'opis', ''])
+            for i in range(200):
+                writer.writerow([i, f'wiersz "{i}"\nciąg dalszy, z przecinkiem' if i % 3 == 0 else f'opis {i}', 'x'])
+
+    def test_ranges_end_on_record_boundaries(self):
+        header, ranges = read_header(self.path)
+        self.assertEqual(header, ['id', 'opis', ''])
+        self.assertGreater(len(split_ranges(self.path, range_size=100)[1]), 10)
+
+        rows = 0
+        for start, end in split_ranges(self.path, range_size=100)[1]:
+            text, count, failures = parse_range(self.path, start, end, header, [INTEGER, TEXT], [INTEGER, TEXT])
+            self.assertEqual(failures, {})
+            self.assertEqual(text.count('\n'), count)
+            rows += count
+        self.assertEqual(rows, 200)
+
+    def test_mismatched_value_is_reported(self):
+        header, ranges = read_header(self.path)
+        text, count, failures = parse_range(self.path, *ranges[0], header, [TEXT, INTEGER], [TEXT, INTEGER])
+        self.assertEqual((text, count), ('', 200))
+        self.assertEqual(failures, {1: 'wiersz "0"\nciąg dalszy, z przecinkiem'})
+
+    def test_column_widened_once_when_ranges_in_flight_fail(self):
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            f.write('cena\n' + ''.join(f'{i}.5\n' for i in range(300)))
+        header = read_header(self.path)[0]
+        ranges = split_ranges(self.path, range_size=300)[1]
+        cursor = mock.MagicMock()
+        typed = TypedRows(cursor, 'ceny', ['cena'], [INTEGER], iter([]))
+
+        with mock.patch.dict(os.environ, {'INGEST_PARSE_WORKERS': '4'}):
+            stats = parallel_copy(cursor, 'ceny', ['cena'], self.path, header, ranges, typed=typed)
+
+        self.assertGreater(len(ranges), 3)
+        self.assertEqual(stats.rows, 300)
+        self.assertEqual(typed.column_types, [NUMERIC])
+        self.assertEqual([c.args[0] for c in cursor.execute.call_args_list],
+                         ['ALTER TABLE ceny ALTER COLUMN cena TYPE NUMERIC USING cena::NUMERIC'])
+
+
+def _load_csv_parallel(name, results):
+    """Import w procesie potomnym (osobne połączenie z bazą); wynik albo błąd trafia do `results`"""
+    try:
+        uploaded_file = UploadedFile(title='Dzialki daemon', file_type='csv', file=name)
+        with transaction.atomic(), connection.cursor() as cursor:
+            uploaded_file.load_csv_parallel(cursor, 'dzialki_daemon', uploaded_file.file.path)
+        results.put(uploaded_file.ingest_stats.rows)
+    except Exception as e:
+        results.put(repr(e))
+    finally:
+        connections.close_all()
+
+
+class DaemonWorkerTests(TemporaryMediaMixin, TransactionTestCase):
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS dzialki_daemon')
+
+    def test_parallel_load_in_daemonic_process_falls_back_to_sequential(self):
+        name = default_storage.save('uploads/dzialki.csv', ContentFile(
+            'Identyfikator,Cena\n' + ''.join(f'A{i},{i}\n' for i in range(200))))
+        context = get_context('fork')
+        results = context.Queue()
+
+        # Jak w ingest_worker --concurrency: proces demoniczny nie może uruchomić puli procesów
+        connections.close_all()
+        process = context.Process(target=_load_csv_parallel, args=(name, results), daemon=True)
+        process.start()
+        process.join(60)
+
+        self.assertEqual(results.get(timeout=5), 200)
+
+
+class TableSyncTests(TemporaryMediaMixin, TestCase):
+    def upload(self, content, sync_key=''):
+        csv_file = CSVFile(title='Dzialki sync', sync_key=sync_key,
+                           file=SimpleUploadedFile('dzialki.csv', content.encode('utf-8')))
+        csv_file.save()
+        return csv_file
+
+    def rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, identyfikator, cena FROM dzialki_sync ORDER BY id')
+            return cursor.fetchall()
+
+    def test_reupload_applies_only_changes(self):
+        self.upload('Identyfikator,Cena\nA,100\nB,200\nC,300\n')
+        self.upload('Identyfikator,Cena\nC,300\nA,150\nD,400\n', sync_key='Identyfikator')
+
+        self.assertEqual(self.rows(), [(1, 'A', '150'), (3, 'C', '300'), (4, 'D', '400')])
+
+    def test_reupload_reports_diff_counts(self):
+        self.upload('Identyfikator,Cena\nA,100\nB,200\n')
+        csv_file = self.upload('Identyfikator,Cena\nA,100\nB,250\nC,300\n', sync_key='identyfikator')
+
+        self.assertEqual(csv_file.sync_stats.as_dict() | {'elapsed': 0},
+                         {'rows': 3, 'inserted': 1, 'updated': 1, 'deleted': 0, 'unchanged': 1, 'elapsed': 0})
+
+    def test_reload_swaps_in_new_table(self):
+        self.upload('Identyfikator,Cena\nA,100\nB,200\n')
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE INDEX dzialki_sync_cena_btree ON dzialki_sync (cena)')
+        self.upload('Identyfikator,Cena\nC,300\n')
+
+        self.assertEqual(self.rows(), [(1, 'C', '300')])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relname FROM pg_class WHERE relname LIKE 'dzialki_sync%%'")
+            relations = [row[0] for row in cursor.fetchall()]
+        # Poprzednia wersja czeka na usunięcie po zatwierdzeniu transakcji
+        self.assertCountEqual(relations, [
+            'dzialki_sync', 'dzialki_sync_id_seq', 'dzialki_sync_pkey', 'dzialki_sync_cena_btree',
+            'dzialki_sync__old', 'dzialki_sync__old_id_seq', 'dzialki_sync__old_pkey', 'dzialki_sync__old_cena_btree',
+        ])
+
+
+class TableSwapTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE zamiana (id serial PRIMARY KEY, nazwa text)")
+            cursor.execute("INSERT INTO zamiana (nazwa) VALUES ('stara')")
+            cursor.execute("CREATE TABLE zamiana__new (id serial PRIMARY KEY, nazwa text)")
+            cursor.execute("INSERT INTO zamiana__new (nazwa) VALUES ('nowa')")
+
+    def names(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nazwa FROM zamiana')
+            return [row[0] for row in cursor.fetchall()]
+
+    def blocked_renames(self, failures):
+        """rename_table, którego pierwsze `failures` wywołań kończy się przekroczeniem lock_timeout"""
+        calls = []
+
+        def rename(cursor, table_name, new_name):
+            calls.append(table_name)
+            if len(calls) <= failures:
+                raise OperationalError('canceling statement due to lock timeout')
+            rename_table(cursor, table_name, new_name)
+        return rename
+
+    def test_swap_retries_after_lock_timeout(self):
+        with mock.patch('core_app.table_swap.rename_table', side_effect=self.blocked_renames(2)) as rename, \
+                mock.patch('core_app.table_swap.drop_table_later') as drop_later, \
+                self.captureOnCommitCallbacks(execute=True):
+            with connection.cursor() as cursor:
+                swap_tables(cursor, 'zamiana', 'zamiana__new')
+
+        self.assertEqual(rename.call_count, 4)
+        self.assertEqual(self.names(), ['nowa'])
+        drop_later.assert_called_once_with('zamiana__old')
+
+    def test_swap_gives_up_and_keeps_current_table(self):
+        with mock.patch('core_app.table_swap.rename_table', side_effect=self.blocked_renames(SWAP_ATTEMPTS)), \
+                mock.patch('core_app.table_swap.drop_table_later') as drop_later, \
+                self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(OperationalError), connection.cursor() as cursor:
+                swap_tables(cursor, 'zamiana', 'zamiana__new')
+
+        self.assertEqual(self.names(), ['stara'])
+        drop_later.assert_not_called()
+
+
+class UploadDedupTests(TemporaryMediaMixin, TestCase):
+    def table_exists(self, table_name):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [table_name])
+            return cursor.fetchone()[0] is not None
+
+    def upload_file(self, title, content):
+        uploaded_file = UploadedFile(title=title, file_type='csv', file=SimpleUploadedFile('dzialki.csv', content))
+        uploaded_file.save()
+        return uploaded_file
+
+    def test_identical_csv_reuses_file_and_table(self):
+        content = b'Identyfikator,Cena\nA,100\n'
+        first = CSVFile(title='Dzialki dedup', file=SimpleUploadedFile('dzialki.csv', content))
+        first.save()
+        second = CSVFile(title='Dzialki dedup', file=SimpleUploadedFile('dzialki.csv', content))
+        second.save()
+
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.file.path))), 1)
+        # Bez ponownego importu nie powstaje poprzednia wersja tabeli
+        self.assertFalse(self.table_exists('dzialki_dedup__old'))
+
+    def test_shared_table_dropped_with_last_reference(self):
+        content = b'Identyfikator,Cena\nA,100\n'
+        files = [self.upload_file(title, content) for title in ('Dzialki a', 'Dzialki b')]
+
+        self.assertEqual(files[1].table_name, files[0].table_name)
+        files[0].delete()
+        self.assertTrue(self.table_exists(files[1].table_name))
+        files[1].delete()
+        self.assertFalse(self.table_exists(files[1].table_name))
+
+    def test_synced_content_deduplicates_onto_synced_file(self):
+        new_content = b'Identyfikator,Cena\nA,150\n'
+        old_content = b'Identyfikator,Cena\nA,100\n'
+        first, second = [self.upload_file(title, old_content) for title in ('Dzialki a', 'Dzialki b')]
+        new_name = default_storage.save('uploads/dzialki.csv', ContentFile(new_content))
+        second.sync_file(new_name, 'Identyfikator', sha256=file_sha256(ContentFile(new_content)))
+
+        # Pierwszy rekord nadal wskazuje na poprzedni plik - nie może być oryginałem dla nowej treści
+        third = self.upload_file('Dzialki c', new_content)
+        self.assertEqual((third.file.name, third.table_name), (new_name, second.table_name))
+        first.refresh_from_db()
+        self.assertEqual(first.sha256, '')
+
+
+class CompressedUploadTests(TemporaryMediaMixin, TestCase):
+    def upload(self, name, content):
+        uploaded_file = UploadedFile(title='Dzialki gz', file_type='csv', file=SimpleUploadedFile(name, content))
+        uploaded_file.save()
+        return uploaded_file
+
+    def test_gzip_csv_is_decompressed_while_loading(self):
+        uploaded_file = self.upload('dzialki.csv.gz', gzip.compress(b'Identyfikator,Cena\nA,100\nB,200\n'))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT identyfikator, cena FROM {uploaded_file.table_name} ORDER BY id')
+            self.assertEqual(cursor.fetchall(), [('A', 100), ('B', 200)])
+
+    def test_decompression_limit_stops_the_import(self):
+        content = gzip.compress(b'Identyfikator\n' + b'A\n' * 10000)
+
+        with mock.patch.dict(os.environ, {'INGEST_MAX_DECOMPRESSED_SIZE': '4096'}):
+            with self.assertRaisesMessage(Exception, 'decompressed data exceeds 4096 bytes'):
+                self.upload('dzialki.csv.gz', content)
+
+
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    content = b'Identyfikator,Cena\nA,100\n'
+
+    def setUp(self):
+        super().setUp()
+        # Rekord bez importu (bulk_create pomija save) - wystarczy jako cel synchronizacji
+        UploadedFile.objects.bulk_create([
+            UploadedFile(title='dzialki', file='uploads/dzialki.csv', file_type='csv', table_name='dzialki'),
+        ])
+
+    def send(self, session, content):
+        write_chunk(session, 0, io.BytesIO(content), len(content), hashlib.sha256(content).hexdigest())
+
+    def test_chunk_checksum_mismatch_is_not_recorded(self):
+        session = start_upload('dzialki.csv', len(self.content))
+        with self.assertRaises(UploadError) as raised:
+            write_chunk(session, 0, io.BytesIO(self.content), len(self.content), hashlib.sha256(b'inne').hexdigest())
+        self.assertEqual(raised.exception.status, 422)
+        self.assertFalse(session.chunks.exists())
+
+        # Ponowienie z poprawną treścią nadpisuje część i ją zalicza
+        self.send(session, self.content)
+        self.assertEqual(list(session.chunks.values_list('index', flat=True)), [0])
+
+    def test_chunk_outside_file_is_rejected(self):
+        session = start_upload('dzialki.csv', len(self.content))
+        checksum = hashlib.sha256(self.content).hexdigest()
+        with self.assertRaisesMessage(UploadError, 'Chunk index must be between 0 and 0'):
+            write_chunk(session, 1, io.BytesIO(self.content), len(self.content), checksum)
+        with self.assertRaisesMessage(UploadError, 'Chunk index must be between 0 and 0'):
+            write_chunk(session, -1, io.BytesIO(self.content), len(self.content), checksum)
+        with self.assertRaisesMessage(UploadError, f'Chunk 0 must be {len(self.content)} bytes'):
+            write_chunk(session, 0, io.BytesIO(self.content + b'B,1\n'), len(self.content) + 4, checksum)
+        self.assertFalse(session.chunks.exists())
+
+    def test_zip_upload_validates_sync_target_at_start(self):
+        with self.assertRaisesMessage(UploadError, 'Table dzialki_nowe is not an uploaded table'):
+            start_upload('dzialki.zip', 100, sync_table='dzialki_nowe', sync_key='identyfikator')
+        with self.assertRaisesMessage(UploadError, 'sync_key is required'):
+            start_upload('dzialki.zip', 100, sync_table='dzialki')
+
+    def test_sync_table_removed_before_complete_is_a_client_error(self):
+        session = start_upload('dzialki.csv', len(self.content), sync_table='dzialki', sync_key='identyfikator')
+        self.send(session, self.content)
+        UploadedFile.objects.filter(table_name='dzialki').delete()
+
+        with self.assertRaises(UploadError) as raised:
+            complete_upload(session)
+        self.assertEqual(raised.exception.status, 400)
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.job), ('open', None))
 
-# Create your tests here.
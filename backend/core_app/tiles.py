@@ -0,0 +1,98 @@
+import logging
+
+from django.db import connection
+
+from .table_queries import TableQueryError
+
+logger = logging.getLogger(__name__)
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MAX_ZOOM = 22
+
+# Poniżej tego zoomu kafelki zawierają tylko id obiektu, bez pozostałych atrybutów
+ATTRIBUTES_MIN_ZOOM = 12
+
+# Obwód Ziemi w metrach EPSG:3857
+WEB_MERCATOR_SIZE = 40075016.68557849
+
+
+def simplify_tolerance(z):
+    """Tolerancja uproszczenia geometrii odpowiadająca jednemu pikselowi siatki kafla"""
+    return WEB_MERCATOR_SIZE / (2 ** z) / MVT_EXTENT
+
+
+def get_layer_info(cursor, table_name):
+    """Kolumna geometrii, jej SRID oraz kolumny atrybutów tabeli (albo None)"""
+    cursor.execute("""
+        SELECT f_geometry_column, srid
+        FROM geometry_columns
+        WHERE f_table_schema = 'public' AND f_table_name = %s
+        ORDER BY f_geometry_column
+        LIMIT 1
+    """, [table_name])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    geometry_column, srid = row
+
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+        AND table_name = %s
+        AND udt_name <> 'geometry'
+        ORDER BY ordinal_position
+    """, [table_name])
+    columns = [column for (column,) in cursor.fetchall()]
+    return geometry_column, srid, columns
+
+
+def tile_columns(columns, z, fields=None):
+    """Atrybuty dołączane do kafla na danym zoomie"""
+    if fields:
+        return [column for column in columns if column in fields or column == 'id']
+    if z < ATTRIBUTES_MIN_ZOOM:
+        return [column for column in columns if column == 'id']
+    return columns
+
+
+def get_tile(table_name, z, x, y, fields=None):
+    """
+    Kafel Mapbox Vector Tile dla tabeli z geometrią.
+
+    Zwraca bajty kafla (pusty kafel to b'') albo None, jeśli tabela nie ma
+    kolumny geometrii. Nazwy tabeli i kolumn pochodzą z katalogu bazy,
+    więc nie trafiają do SQL bezpośrednio z żądania. Nieznane pola w `fields`
+    dają TableQueryError.
+    """
+    with connection.cursor() as cursor:
+        layer = get_layer_info(cursor, table_name)
+        if layer is None:
+            return None
+        geometry_column, srid, columns = layer
+        unknown = [field for field in fields or () if field not in columns]
+        if unknown:
+            raise TableQueryError(f"Unknown fields: {', '.join(unknown)}")
+
+        attributes = ''.join(f', t."{column}"' for column in tile_columns(columns, z, fields))
+        cursor.execute(f"""
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%s, %s, %s) AS geom,
+                       ST_TileEnvelope(%s, %s, %s, margin => %s) AS buffered
+            ),
+            mvtgeom AS (
+                SELECT ST_AsMVTGeom(
+                    ST_SimplifyPreserveTopology(ST_Transform(t."{geometry_column}", 3857), %s),
+                    bounds.geom, {MVT_EXTENT}, {MVT_BUFFER}, true
+                ) AS geom{attributes}
+                FROM "{table_name}" t, bounds
+                WHERE t."{geometry_column}" && ST_Transform(bounds.buffered, %s)
+            )
+            SELECT ST_AsMVT(mvtgeom.*, %s, {MVT_EXTENT}, 'geom')
+            FROM mvtgeom
+            WHERE geom IS NOT NULL
+        """, [z, x, y, z, x, y, MVT_BUFFER / MVT_EXTENT, simplify_tolerance(z), srid, table_name])
+        tile = cursor.fetchone()[0]
+
+    return bytes(tile) if tile else b''
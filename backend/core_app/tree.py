@@ -0,0 +1,249 @@
+"""
+Drzewo sekcji, folderów i plików użytkownika budowane jednym zapytaniem.
+
+Gotowy JSON trafia do wersjonowanego cache odpowiedzi (core_app.cache)
+pod kluczem użytkownika; wersję podbijają sygnały zapisu i usuwania
+Section/Folder/FileRecord (core_app.signals).
+"""
+import json
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .cache import bump_table_version, cached_table_response, get_table_version
+from .models import FileRecord, Folder, Section
+
+# Ten sam format dat co w serializerach DRF
+_datetime_field = serializers.DateTimeField()
+
+_TREE_FIELDS = [
+    'id', 'name', 'order', 'created_at',
+    'folders__id', 'folders__name', 'folders__order', 'folders__created_at',
+    'folders__files__id', 'folders__files__name', 'folders__files__file_type',
+    'folders__files__order', 'folders__files__created_at',
+]
+
+
+def tree_cache_name(user_id):
+    """Przestrzeń nazw drzewa użytkownika w cache odpowiedzi"""
+    return f'section_tree_{user_id}'
+
+
+def invalidate_user_tree(user_id):
+    bump_table_version(tree_cache_name(user_id))
+
+
+class TreeInvalidation:
+    """
+    Węzły drzewa zmienione w jednej transakcji. Po zatwierdzeniu wersja
+    drzewa każdego użytkownika podbijana jest raz, a właściciele sekcji
+    i folderów ustalani są najwyżej dwoma zapytaniami - bez zapytania na
+    każdy obiekt usuwany kaskadowo.
+    """
+
+    def __init__(self):
+        self.user_ids = set()
+        self.section_ids = set()
+        self.folder_ids = set()
+
+    def add(self, user_ids=(), section_ids=(), folder_ids=()):
+        self.user_ids.update(user_ids)
+        self.section_ids.update(section_ids)
+        self.folder_ids.update(folder_ids)
+
+    def __call__(self):
+        user_ids = set(self.user_ids)
+        # Usunięty rodzic nie zostanie znaleziony, ale wtedy sygnał rodzica dodał jego sekcję albo użytkownika
+        if self.section_ids:
+            user_ids.update(Section.objects.filter(pk__in=self.section_ids).order_by()
+                            .values_list('user_id', flat=True))
+        if self.folder_ids:
+            user_ids.update(Section.objects.filter(folders__pk__in=self.folder_ids).order_by()
+                            .values_list('user_id', flat=True))
+        for user_id in user_ids:
+            invalidate_user_tree(user_id)
+
+
+def invalidate_tree_on_commit(user_ids=(), section_ids=(), folder_ids=()):
+    """Unieważnienie drzew po zatwierdzeniu - dołącza do oczekującego TreeInvalidation bieżącej transakcji"""
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        for _, callback, _ in connection.run_on_commit:
+            if isinstance(callback, TreeInvalidation):
+                callback.add(user_ids, section_ids, folder_ids)
+                return
+    pending = TreeInvalidation()
+    pending.add(user_ids, section_ids, folder_ids)
+    transaction.on_commit(pending)
+
+
+def get_tree_version(user_id):
+    # Użytkownik od razu pobiera drzewo po edycji, być może z innej instancji - wersja zawsze z bazy
+    return get_table_version(tree_cache_name(user_id), max_age=0)
+
+
+def build_tree(user, section_created_at=False):
+    """
+    Lista sekcji z folderami i plikami w kształcie SectionSerializer
+    (section_created_at=True) lub SectionTreeSerializer.
+    """
+    rows = Section.objects.filter(user=user).order_by(
+        'order', 'created_at',
+        'folders__order', 'folders__created_at',
+        'folders__files__order', 'folders__files__created_at',
+    ).values_list(*_TREE_FIELDS)
+
+    sections = {}
+    folders = {}
+    for (section_id, section_name, section_order, section_created,
+         folder_id, folder_name, folder_order, folder_created,
+         file_id, file_name, file_type, file_order, file_created) in rows:
+        section = sections.get(section_id)
+        if section is None:
+            section = sections[section_id] = {
+                'id': str(section_id), 'name': section_name, 'order': section_order, 'folders': [],
+            }
+            if section_created_at:
+                section['created_at'] = _datetime_field.to_representation(section_created)
+
+        if folder_id is None:
+            continue
+        folder = folders.get(folder_id)
+        if folder is None:
+            folder = folders[folder_id] = {
+                'id': str(folder_id), 'name': folder_name, 'order': folder_order, 'files': [],
+                'created_at': _datetime_field.to_representation(folder_created),
+            }
+            section['folders'].append(folder)
+
+        if file_id is not None:
+            folder['files'].append({
+                'id': str(file_id), 'name': file_name, 'file_type': file_type, 'order': file_order,
+                'created_at': _datetime_field.to_representation(file_created),
+            })
+
+    return list(sections.values())
+
+
+def cached_tree_response(request, section_created_at=False):
+    """Drzewo użytkownika jako bajty JSON z cache, z ETagiem i obsługą 304"""
+    def render():
+        body = json.dumps(build_tree(request.user, section_created_at), ensure_ascii=False)
+        return HttpResponse(body.encode(), content_type='application/json')
+
+    key = 'sections' if section_created_at else 'tree'
+    response = cached_table_response(request, tree_cache_name(request.user.pk), key, render, max_age=0)
+    # Drzewo zmienia się przy każdej edycji - przeglądarka zawsze pyta o nie ETagiem
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Typy węzłów w operacjach wsadowych: model, pole rodzica i typ rodzica
+_NODE_TYPES = {
+    'section': (Section, None, None),
+    'folder': (Folder, 'section', 'section'),
+    'file': (FileRecord, 'folder', 'folder'),
+}
+
+
+def _owned_nodes(user, operations):
+    """Węzły wskazane w operacjach, o ile należą do użytkownika - najwyżej jedno zapytanie na model"""
+    ids = {node_type: set() for node_type in _NODE_TYPES}
+    for operation in operations:
+        node_type = operation['type']
+        if operation['op'] != 'create':
+            ids[node_type].add(operation['id'])
+        if 'parent' in operation and node_type != 'section':
+            ids[_NODE_TYPES[node_type][2]].add(operation['parent'])
+
+    owned = {
+        'section': Section.objects.filter(user=user),
+        'folder': Folder.objects.filter(section__user=user),
+        'file': FileRecord.objects.filter(folder__section__user=user),
+    }
+    return {node_type: owned[node_type].in_bulk(ids[node_type]) if ids[node_type] else {}
+            for node_type in _NODE_TYPES}
+
+
+def apply_batch(user, operations):
+    """
+    Wykonanie listy operacji (create/move/reorder/rename/delete) na drzewie
+    użytkownika w jednej transakcji: bulk_create, bulk_update i po jednym
+    DELETE na model. Zwraca (nowa wersja drzewa, id utworzonych węzłów).
+    """
+    nodes = _owned_nodes(user, operations)
+    created = {node_type: {} for node_type in _NODE_TYPES}
+    changed = {node_type: {} for node_type in _NODE_TYPES}
+    changed_fields = {node_type: set() for node_type in _NODE_TYPES}
+    deleted = {node_type: set() for node_type in _NODE_TYPES}
+
+    def lookup(index, node_type, pk):
+        node = nodes[node_type].get(pk)
+        if node is None or pk in deleted[node_type]:
+            raise NotFound(f'Operation {index}: {node_type} {pk} not found')
+        return node
+
+    for index, operation in enumerate(operations):
+        op, node_type = operation['op'], operation['type']
+        model, parent_field, parent_type = _NODE_TYPES[node_type]
+
+        if op == 'create':
+            values = {'name': operation['name'], 'order': operation.get('order', 0)}
+            if 'id' in operation:
+                if operation['id'] in nodes[node_type]:
+                    raise ValidationError(f'Operation {index}: {node_type} {operation["id"]} already exists')
+                values['id'] = operation['id']
+            if parent_field:
+                values[parent_field] = lookup(index, parent_type, operation['parent'])
+            else:
+                values['user'] = user
+            if node_type == 'file':
+                values['file_type'] = operation['file_type']
+            node = model(**values)
+            nodes[node_type][node.pk] = created[node_type][node.pk] = node
+            continue
+
+        node = lookup(index, node_type, operation['id'])
+        if op == 'delete':
+            deleted[node_type].add(node.pk)
+            created[node_type].pop(node.pk, None)
+            changed[node_type].pop(node.pk, None)
+            continue
+
+        fields = []
+        if op == 'move':
+            setattr(node, parent_field, lookup(index, parent_type, operation['parent']))
+            fields.append(parent_field)
+        if op == 'rename':
+            node.name = operation['name']
+            fields.append('name')
+        if 'order' in operation and op in ('move', 'reorder'):
+            node.order = operation['order']
+            fields.append('order')
+
+        if node.pk not in created[node_type]:
+            changed[node_type][node.pk] = node
+            changed_fields[node_type].update(fields)
+
+    try:
+        with transaction.atomic():
+            for node_type, (model, _, _) in _NODE_TYPES.items():
+                if created[node_type]:
+                    model.objects.bulk_create(created[node_type].values())
+            for node_type, (model, _, _) in _NODE_TYPES.items():
+                if changed[node_type]:
+                    model.objects.bulk_update(changed[node_type].values(), changed_fields[node_type])
+            for node_type, (model, _, _) in reversed(_NODE_TYPES.items()):
+                existing = deleted[node_type] - created[node_type].keys()
+                if existing:
+                    model.objects.filter(pk__in=existing).delete()
+            # bulk_create/bulk_update nie wysyłają sygnałów - użytkownika dopisujemy sami;
+            # sygnały usuwania dołączają do tego samego unieważnienia
+            invalidate_tree_on_commit(user_ids=[user.pk])
+    except IntegrityError as e:
+        raise ValidationError(str(e))
+
+    created_ids = [str(pk) for node_type in _NODE_TYPES for pk in created[node_type]]
+    return get_tree_version(user.pk), created_ids
@@ -0,0 +1,184 @@
+"""
+Wznawialne przesyłanie dużych plików w częściach.
+
+Protokół: POST /api/uploads/ (rozmiar, nazwa) rezerwuje docelowy plik
+w default_storage o pełnym rozmiarze; PUT .../chunks/<n>/ zapisuje część
+bezpośrednio pod jej przesunięciem w tym pliku, sprawdzając SHA-256 z
+nagłówka X-Chunk-SHA256; POST .../complete/ kolejkuje import. Po zerwaniu
+połączenia klient pyta GET /api/uploads/<id>/ o brakujące części i wysyła
+tylko je.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .archives import DATA_EXTENSIONS, ArchiveError, split_upload_name, upload_file_type
+from .dedup import file_sha256
+from .jobs import check_sync_target, enqueue_upload
+from .models import UploadChunk, UploadedFile, UploadSession
+from .sync import SyncError
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024 * 1024
+
+# Porzucone sesje (bez nowych części przez ten czas) są usuwane razem z plikiem
+UPLOAD_EXPIRY = timedelta(days=1)
+
+# Bufor kopiowania treści żądania do pliku
+_COPY_BUFFER = 256 * 1024
+
+
+class UploadError(ValueError):
+    """Błędne żądanie w protokole przesyłania - komunikat trafia do klienta"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def start_upload(filename, size, chunk_size=None, checksum='', sync_table='', sync_key=''):
+    """
+    Nowa sesja z zarezerwowanym w storage plikiem docelowym o rozmiarze `size`.
+    Z `sync_table` plik po przesłaniu aktualizuje istniejącą tabelę (core_app.sync).
+    """
+    # Typ danych archiwum zip bez typu w nazwie znany jest dopiero po przesłaniu (complete_upload)
+    title, extension, compression = split_upload_name(filename)
+    if extension not in DATA_EXTENSIONS and compression != '.zip':
+        raise UploadError('Invalid file type')
+    if not isinstance(size, int) or not 0 <= size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f'size must be an integer between 0 and {MAX_UPLOAD_SIZE}')
+
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if not isinstance(chunk_size, int) or not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f'chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}')
+    checksum = (checksum or '').lower()
+    if checksum and len(checksum) != 64:
+        raise UploadError('checksum must be a hex SHA-256 digest')
+    try:
+        # Typ pliku z archiwum zip bez typu w nazwie sprawdza dopiero complete_upload
+        check_sync_target(sync_table, sync_key, extension[1:] or None)
+    except SyncError as e:
+        raise UploadError(str(e))
+
+    # Pusty plik o unikalnej nazwie, powiększony do docelowego rozmiaru (bez zapisu danych)
+    name = default_storage.save(os.path.join('uploads', os.path.basename(filename)), ContentFile(b''))
+    os.truncate(default_storage.path(name), size)
+
+    return UploadSession.objects.create(
+        file=name, filename=os.path.basename(filename), title=title, file_type=extension[1:],
+        size=size, chunk_size=chunk_size, checksum=checksum, sync_table=sync_table or '', sync_key=sync_key or '',
+    )
+
+
+def received_chunks(session):
+    return set(session.chunks.values_list('index', flat=True))
+
+
+def missing_chunks(session):
+    received = received_chunks(session)
+    return [index for index in range(session.chunk_count) if index not in received]
+
+
+def write_chunk(session, index, stream, length, checksum):
+    """
+    Zapis części `index` z `stream` prosto pod jej przesunięciem w pliku
+    docelowym. Część jest oznaczana jako odebrana dopiero po zgodności
+    rozmiaru i sumy SHA-256, więc ponowienie nadpisuje niepełny zapis.
+    """
+    if session.status != UploadSession.STATUS_OPEN:
+        raise UploadError('Upload already completed', status=409)
+    if not 0 <= index < session.chunk_count:
+        raise UploadError(f'Chunk index must be between 0 and {session.chunk_count - 1}')
+    expected_length = session.chunk_length(index)
+    if length != expected_length:
+        raise UploadError(f'Chunk {index} must be {expected_length} bytes, got {length}')
+    checksum = (checksum or '').lower()
+    if len(checksum) != 64:
+        raise UploadError('X-Chunk-SHA256 header with a hex SHA-256 digest is required')
+
+    digest = hashlib.sha256()
+    written = 0
+    fd = os.open(default_storage.path(session.file.name), os.O_WRONLY)
+    try:
+        offset = index * session.chunk_size
+        while written < length:
+            data = stream.read(min(_COPY_BUFFER, length - written))
+            if not data:
+                break
+            digest.update(data)
+            os.pwrite(fd, data, offset + written)
+            written += len(data)
+    finally:
+        os.close(fd)
+
+    if written != length:
+        raise UploadError(f'Chunk {index} truncated: received {written} of {length} bytes')
+    if digest.hexdigest() != checksum:
+        raise UploadError(f'Chunk {index} checksum mismatch', status=422)
+
+    UploadChunk.objects.update_or_create(session=session, index=index, defaults={'checksum': checksum})
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+
+def file_checksum(name):
+    with default_storage.open(name, 'rb') as f:
+        return file_sha256(f)
+
+
+def complete_upload(session):
+    """Sprawdzenie kompletności i zakolejkowanie importu - plik jest już na miejscu"""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.STATUS_COMPLETE:
+            return session
+
+        missing = missing_chunks(session)
+        if missing:
+            raise UploadError(f'Missing chunks: {missing[:100]}', status=409)
+        if split_upload_name(session.filename)[2] == '.zip':
+            try:
+                with default_storage.open(session.file.name, 'rb') as f:
+                    session.file_type = upload_file_type(session.filename, f)[1]
+            except ArchiveError as e:
+                raise UploadError(str(e), status=422)
+
+        checksum = file_checksum(session.file.name)
+        if session.checksum and checksum != session.checksum:
+            raise UploadError('File checksum mismatch', status=422)
+
+        # Ten sam plik był już przesłany - import wskaże istniejący plik
+        original = UploadedFile.find_original(checksum, session.file_type)
+        file_name = original.file.name if original is not None else session.file.name
+        try:
+            # Typ pliku z zip znany jest dopiero teraz, a tabela mogła zniknąć od startu przesyłania
+            session.job = enqueue_upload(file_name, session.title, session.file_type,
+                                         session.sync_table, session.sync_key, sha256=checksum)
+        except SyncError as e:
+            raise UploadError(str(e))
+
+        if original is not None:
+            # Złożona kopia jest zbędna
+            default_storage.delete(session.file.name)
+            session.file.name = file_name
+        session.status = UploadSession.STATUS_COMPLETE
+        session.save(update_fields=['file', 'file_type', 'job', 'status', 'updated_at'])
+    return session
+
+
+def delete_expired_uploads(max_age=UPLOAD_EXPIRY):
+    """Usunięcie porzuconych sesji wraz z niedokończonymi plikami; zwraca ich liczbę"""
+    expired = UploadSession.objects.filter(status=UploadSession.STATUS_OPEN,
+                                           updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for session in expired:
+        default_storage.delete(session.file.name)
+        session.delete()
+        count += 1
+    return count
@@ -1,28 +1,47 @@
-from django.conf import settings
 from django.urls import path, re_path, include
 from django.views.generic import TemplateView
-from django.views.static import serve
 
 from .views import (
-    section_list, section_detail, section_tree, add_folder_to_section,
+    section_list, section_detail, section_tree, tree_batch, add_folder_to_section,
     folder_list, folder_detail, add_file_to_folder,
     file_list, file_detail,
-    csrf, upload_file, get_user_info
+    upload_init, upload_session, upload_chunk, upload_complete,
+    csrf, health, metrics, upload_file, upload_status, vector_tile, table_rows, table_query, search_rows, get_user_info
 )
 
 urlpatterns = [
     # CSRF and Auth endpoints
     path('api/csrf/', csrf, name='csrf'),
+    path('api/health/', health, name='health'),
+    path('metrics', metrics, name='metrics'),
     path('api/auth/user/', get_user_info, name='user_info'),
 
     # File upload endpoint
     path('api/upload/', upload_file, name='upload_file'),
+    path('api/upload/<uuid:job_id>/status/', upload_status, name='upload_status'),
+
+    # Resumable chunked uploads
+    path('api/uploads/', upload_init, name='upload-init'),
+    path('api/uploads/<uuid:upload_id>/', upload_session, name='upload-session'),
+    path('api/uploads/<uuid:upload_id>/chunks/<int:index>/', upload_chunk, name='upload-chunk'),
+    path('api/uploads/<uuid:upload_id>/complete/', upload_complete, name='upload-complete'),
+
+    # Vector tiles
+    path('api/tiles/<str:table_name>/<int:z>/<int:x>/<int:y>.mvt', vector_tile, name='vector-tile'),
+
+    # Table data
+    path('api/tables/<str:table_name>/rows/', table_rows, name='table-rows'),
+    path('api/tables/<str:table_name>/query/', table_query, name='table-query'),
+
+    # Search
+    path('api/search/', search_rows, name='search'),
 
     # Section endpoints
     path('api/sections/', section_list, name='section-list'),
     path('api/sections/<int:pk>/', section_detail, name='section-detail'),
     path('api/sections/tree/', section_tree, name='section-tree'),
     path('api/sections/<int:pk>/add_folder/', add_folder_to_section, name='section-add-folder'),
+    path('api/tree/batch/', tree_batch, name='tree-batch'),
 
     # Folder endpoints
     path('api/folders/', folder_list, name='folder-list'),
@@ -33,7 +52,6 @@ urlpatterns = [
     path('api/files/', file_list, name='file-list'),
     path('api/files/<int:pk>/', file_detail, name='file-detail'),
 
-    # Static and catch-all routes
-    re_path(r'^static/(?P<path>.*)$', serve, {'document_root': settings.REACT_BUILD_PATH + '/static'}),
+    # Catch-all route (pliki /static/ serwuje WhiteNoise)
     re_path(r'^.*$', TemplateView.as_view(template_name='/Users/ernestilchenko/project/frontend/build/index.html')),
 ]
\ No newline at end of file
@@ -1,8 +1,13 @@
+import hmac
+import json
 import os
 
+from django.conf import settings
 from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -10,10 +15,24 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
-from .models import UploadedFile, Folder, FileRecord, Section
-from .serializers import UserSerializer, SectionTreeSerializer, FolderSerializer, FileRecordSerializer, \
-    SectionSerializer
+from django.db import DatabaseError, connection, transaction
+from .archives import ArchiveError, upload_file_type
+from .cache import cache_key, cached_table_response
+from .db_pool import check_database, pool_stats
+from .dedup import uploaded_sha256
+from .metrics import render_metrics
+from .jobs import enqueue_upload
+from .models import DatabaseTable, IngestionJob, UploadedFile, UploadSession, Folder, FileRecord, Section
+from .profiles import get_user_profile
+from .search import DEFAULT_RESULTS, MAX_RESULTS, search
+from .sync import SyncError
+from .serializers import FolderSerializer, FileRecordSerializer, \
+    SectionSerializer, TreeBatchSerializer
+from .table_queries import RESERVED_PARAMS, TableQueryError, compile_bbox, compile_filters, decode_cursor, \
+    fetch_page, get_columns, parse_page_size, project_columns
+from .tiles import MAX_ZOOM, get_layer_info, get_tile
+from .tree import apply_batch, cached_tree_response
+from .uploads import UploadError, complete_upload, missing_chunks, start_upload, write_chunk
 
 
 # Create your views here.
@@ -25,34 +44,41 @@ def upload_file(request):
         if not file:
             return JsonResponse({'error': 'No file provided'}, status=400)
 
-        # Получаем имя файла без расширения для title
-        title = os.path.splitext(file.name)[0]
-
-        # Проверка расширения файла
-        allowed_extensions = ['.geojson', '.kml', '.shp', '.csv', '.gml']
-        file_ext = os.path.splitext(file.name)[1].lower()
+        # Tytuł i typ danych z nazwy pliku (dzialki.geojson.gz); typ archiwum zip - z jego zawartości
+        try:
+            title, file_type = upload_file_type(file.name, file)
+        except ArchiveError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
-        if file_ext not in allowed_extensions:
-            return JsonResponse({'error': 'Invalid file type'}, status=400)
+        # Plik o tej samej treści już jest - nowy rekord wskaże istniejący plik i tabelę
+        digest = uploaded_sha256(request, 'file')
+        original = UploadedFile.find_original(digest, file_type)
 
         # Сохранение файла и создание записи в базе данных
-        file_path = os.path.join('uploads', file.name)
-        saved_path = default_storage.save(file_path, file)
+        if original is not None:
+            saved_path = original.file.name
+        else:
+            file_path = os.path.join('uploads', file.name)
+            saved_path = default_storage.save(file_path, file)
 
         try:
-            # Создание записи в базе данных
-            uploaded_file = UploadedFile.objects.create(
-                title=title,  # Используем имя файла без расширения
-                file=saved_path,
-                file_type=file_ext[1:]  # убираем точку из расширения
-            )
+            # Import wykonuje worker w tle (manage.py ingest_worker); z sync_table tylko zmiany w istniejącej tabeli
+            job = enqueue_upload(saved_path, title, file_type,
+                                 request.POST.get('sync_table', ''), request.POST.get('sync_key', ''),
+                                 sha256=digest)
 
             return JsonResponse({
-                'message': 'File uploaded successfully',
+                'message': 'File queued for processing',
                 'file_path': saved_path,
-                'id': uploaded_file.id,
-                'title': title
-            })
+                'job_id': str(job.id),
+                'status_url': reverse('upload_status', args=[job.id]),
+                'title': title,
+                'deduplicated': original is not None,
+            }, status=202)
+        except SyncError as e:
+            if original is None:
+                default_storage.delete(saved_path)
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({
                 'error': str(e)
@@ -61,19 +87,279 @@ def upload_file(request):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
+def upload_session_payload(session):
+    payload = {
+        'upload_id': str(session.id),
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'chunks': session.chunk_count,
+        'status': session.status,
+        'missing': missing_chunks(session) if session.status == UploadSession.STATUS_OPEN else [],
+        'upload_url': reverse('upload-session', args=[session.id]),
+    }
+    if session.job_id:
+        payload['job_id'] = str(session.job_id)
+        payload['status_url'] = reverse('upload_status', args=[session.job_id])
+    return payload
+
+
+@csrf_exempt
+def upload_init(request):
+    """Początek przesyłania w częściach: {filename, size, chunk_size?, checksum?}"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        data = json.loads(request.body or b'{}')
+        session = start_upload(data.get('filename'), data.get('size'), data.get('chunk_size'),
+                               data.get('checksum', ''), data.get('sync_table', ''), data.get('sync_key', ''))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'error': str(e)}, status=getattr(e, 'status', 400))
+    return JsonResponse(upload_session_payload(session), status=201)
+
+
+def upload_session(request, upload_id):
+    """Stan przesyłania - lista brakujących części do wznowienia"""
+    session = get_object_or_404(UploadSession, pk=upload_id)
+    return JsonResponse(upload_session_payload(session))
+
+
+@csrf_exempt
+def upload_chunk(request, upload_id, index):
+    """PUT z surową treścią części i nagłówkiem X-Chunk-SHA256"""
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    session = get_object_or_404(UploadSession, pk=upload_id)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        write_chunk(session, index, request, length, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+def upload_complete(request, upload_id):
+    """Koniec przesyłania - plik trafia do kolejki importu"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    session = get_object_or_404(UploadSession, pk=upload_id)
+    try:
+        session = complete_upload(session)
+    except UploadError as e:
+        return JsonResponse({'error': str(e), **upload_session_payload(session)}, status=e.status)
+    return JsonResponse(upload_session_payload(session), status=202)
+
+
+def upload_status(request, job_id):
+    job = get_object_or_404(IngestionJob, pk=job_id)
+
+    return JsonResponse({
+        'job_id': str(job.id),
+        'title': job.title,
+        'phase': job.phase,
+        'rows_processed': job.rows_processed,
+        'rows_per_second': round(job.rows_per_second, 1),
+        'error': job.error or None,
+        'attempts': job.attempts,
+        'uploaded_file_id': job.uploaded_file_id,
+        'table_name': job.uploaded_file.table_name if job.uploaded_file else None,
+        'sync': {
+            'table_name': job.sync_table,
+            'key': job.sync_key,
+            'inserted': job.rows_inserted,
+            'updated': job.rows_updated,
+            'deleted': job.rows_deleted,
+        } if job.sync_table else None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    })
+
+
+def vector_tile(request, table_name, z, x, y):
+    if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return JsonResponse({'error': 'Invalid tile coordinates'}, status=400)
+
+    # Kolejność i powtórzenia pól nie zmieniają kafla; nieznane pola dają 400, więc nie trafiają do cache
+    fields = sorted(set(filter(None, request.GET.get('fields', '').split(',')))) or None
+
+    def render():
+        if not is_uploaded_table(table_name):
+            return JsonResponse({'error': 'Table not found'}, status=404)
+        try:
+            tile = get_tile(table_name, z, x, y, fields=fields)
+        except TableQueryError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if tile is None:
+            return JsonResponse({'error': 'Table has no geometry column'}, status=404)
+        return HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+
+    key = cache_key('tile', z=z, x=x, y=y, fields=fields)
+    response = cached_table_response(request, table_name, key, render)
+    # Przeglądarka zawsze rewaliduje kafel ETagiem, bo tabela może zostać przeładowana
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def is_uploaded_table(table_name):
+    """
+    Tylko tabele z importu. Sprawdzane w render() - trafienie w cache nie
+    pyta bazy, a 404 nie trafia do cache.
+    """
+    return UploadedFile.objects.filter(table_name=table_name).exists()
+
+
+def page_params(request):
+    """Parametry stronicowania wspólne dla table_rows i table_query"""
+    requested = request.GET.get('columns')
+    return {
+        'columns': requested.split(',') if requested else None,
+        'sort': request.GET.get('sort') or 'id',
+        'cursor': request.GET.get('cursor') or None,
+        'limit': parse_page_size(request.GET.get('limit')),
+    }
+
+
+def page_key(page):
+    """Parametry stronicowania do klucza cache - kursor w postaci zdekodowanej"""
+    return dict(page, cursor=decode_cursor(page['cursor']) if page['cursor'] else None)
+
+
+def table_rows(request, table_name):
+    """
+    Strona wierszy tabeli z paginacją keyset.
+
+    Parametry: columns (lista po przecinku), sort (kolumna z indeksem,
+    '-' oznacza malejąco), cursor (z next_cursor poprzedniej strony), limit.
+    """
+    try:
+        page = page_params(request)
+        key = cache_key('rows', **page_key(page))
+    except TableQueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def render():
+        if not is_uploaded_table(table_name):
+            return JsonResponse({'error': 'Table not found'}, status=404)
+        try:
+            with connection.cursor() as cursor:
+                columns = get_columns(cursor, table_name)
+                projected = project_columns(columns, page['columns'])
+                rows, next_cursor = fetch_page(
+                    cursor, table_name, columns, projected,
+                    sort=page['sort'], after=page['cursor'], page_size=page['limit'],
+                )
+        except TableQueryError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        table = DatabaseTable.get_table(table_name)
+        return JsonResponse({
+            'columns': projected,
+            'rows': rows,
+            'next_cursor': next_cursor,
+            'total': table.row_count if table else None,
+            'total_exact': table.row_count_exact if table else False,
+        }, encoder=DjangoJSONEncoder)
+
+    return cached_table_response(request, table_name, key, render)
+
+
+def table_query(request, table_name):
+    """
+    Wiersze tabeli spełniające filtry, stronicowane jak w table_rows.
+
+    Filtry: kolumna=wartość oraz kolumna__operator=wartość (eq, ne, gt, gte,
+    lt, lte, range, in, ilike, isnull), bbox=minx,miny,maxx,maxy (EPSG:4326).
+    format=ids zwraca same identyfikatory, format=geojson - obiekty GeoJSON.
+    """
+    output = request.GET.get('format') or 'rows'
+    if output not in ('rows', 'ids', 'geojson'):
+        return JsonResponse({'error': f'Unknown format: {output}'}, status=400)
+
+    # Nieznane kolumny odrzuca compile_filters, a odpowiedzi z błędem nie trafiają do cache
+    filters = sorted((name, value) for name, value in request.GET.items() if name not in RESERVED_PARAMS)
+    bbox = request.GET.get('bbox') or None
+    try:
+        page = page_params(request)
+        key = cache_key('query', format=output, filters=filters, bbox=bbox, **page_key(page))
+    except TableQueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def render():
+        if not is_uploaded_table(table_name):
+            return JsonResponse({'error': 'Table not found'}, status=404)
+        try:
+            with connection.cursor() as cursor:
+                columns = get_columns(cursor, table_name)
+                where, params = compile_filters(columns, filters)
+
+                geometry_column = None
+                if output == 'geojson' or bbox:
+                    layer = get_layer_info(cursor, table_name)
+                    if layer is None:
+                        raise TableQueryError('Table has no geometry column')
+                    geometry_column, srid, _ = layer
+                if bbox:
+                    bbox_where, bbox_params = compile_bbox(geometry_column, srid, bbox)
+                    where = ' AND '.join(filter(None, [where, bbox_where]))
+                    params += bbox_params
+
+                if output == 'ids':
+                    projected = ['id']
+                else:
+                    projected = project_columns(columns, page['columns'])
+                    if output == 'geojson' and geometry_column not in projected:
+                        projected.append(geometry_column)
+
+                rows, next_cursor = fetch_page(
+                    cursor, table_name, columns, projected,
+                    sort=page['sort'], after=page['cursor'], page_size=page['limit'],
+                    where=where, params=params,
+                )
+        except TableQueryError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if output == 'ids':
+            return JsonResponse({'ids': [row['id'] for row in rows], 'next_cursor': next_cursor})
+        if output == 'geojson':
+            return JsonResponse({
+                'type': 'FeatureCollection',
+                'features': [{
+                    'type': 'Feature',
+                    'id': row['id'],
+                    'geometry': row.pop(geometry_column),
+                    'properties': row,
+                } for row in rows],
+                'next_cursor': next_cursor,
+            }, encoder=DjangoJSONEncoder)
+        return JsonResponse({
+            'columns': projected,
+            'rows': rows,
+            'next_cursor': next_cursor,
+        }, encoder=DjangoJSONEncoder)
+
+    return cached_table_response(request, table_name, key, render)
+
+
+def search_rows(request):
+    """Wyszukiwanie w tabelach z importu: ?q=tekst[&table=nazwa][&limit=20]"""
+    try:
+        limit = max(1, min(int(request.GET.get('limit') or DEFAULT_RESULTS), MAX_RESULTS))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    results = search(request.GET.get('q', ''), limit=limit, table_name=request.GET.get('table'))
+    return JsonResponse({'results': results})
+
+
 @api_view(['GET'])
 def get_user_info(request):
-    print("Session ID:", request.session.session_key)
-    print("Is authenticated:", request.user.is_authenticated)
-    print("User:", request.user)
-    print("Cookies:", request.COOKIES)
-
     if not request.user.is_authenticated:
         return Response({'isAuthenticated': False})
 
-    serializer = UserSerializer(request.user)
     return Response({
-        **serializer.data,
+        **get_user_profile(request.user),
         'isAuthenticated': True
     })
 
@@ -82,12 +368,7 @@ def get_user_info(request):
 @permission_classes([IsAuthenticated])
 def section_list(request):
     if request.method == 'GET':
-        sections = Section.objects.filter(user=request.user).prefetch_related(
-            'folders',
-            'folders__files'
-        )
-        serializer = SectionSerializer(sections, many=True)
-        return Response(serializer.data)
+        return cached_tree_response(request, section_created_at=True)
 
     elif request.method == 'POST':
         serializer = SectionSerializer(data=request.data)
@@ -122,12 +403,17 @@ def section_detail(request, pk):
 @permission_classes([IsAuthenticated])
 def section_tree(request):
     """Получить полное дерево секций с папками и файлами"""
-    sections = Section.objects.filter(user=request.user).prefetch_related(
-        'folders',
-        'folders__files'
-    ).order_by('order')
-    serializer = SectionTreeSerializer(sections, many=True)
-    return Response(serializer.data)
+    return cached_tree_response(request)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def tree_batch(request):
+    """Wiele operacji na drzewie (create/move/reorder/rename/delete) w jednej transakcji"""
+    serializer = TreeBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    version, created = apply_batch(request.user, serializer.validated_data['operations'])
+    return Response({'version': version, 'created': created})
 
 
 @api_view(['POST'])
@@ -236,4 +522,22 @@ def file_detail(request, pk):
 
 @ensure_csrf_cookie
 def csrf(request):
-    return HttpResponse()
\ No newline at end of file
+    return HttpResponse()
+
+
+def health(request):
+    """Stan dla load balancera: zapytanie do bazy i liczniki puli połączeń procesu"""
+    try:
+        db_ms = check_database()
+    except DatabaseError as e:
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=503)
+    return JsonResponse({'status': 'ok', 'db_ms': round(db_ms, 2), 'pool': pool_stats()})
+
+
+def metrics(request):
+    """Metryki żądań i puli połączeń w formacie Prometheusa"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
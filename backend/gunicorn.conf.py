@@ -0,0 +1,65 @@
+"""
+Konfiguracja gunicorn dla obrazu produkcyjnego (backend/Dockerfile).
+
+Liczba procesów wynika z liczby procesorów przydzielonych kontenerowi
+(limit cgroup, a nie liczba rdzeni hosta); wątki w każdym procesie
+obsługują żądania czekające na PostgreSQL. Wartości można nadpisać
+zmiennymi WEB_CONCURRENCY i GUNICORN_THREADS.
+"""
+import math
+import os
+import shutil
+
+
+def cpu_count():
+    """Procesory dostępne dla kontenera: limit cgroup v2/v1 albo affinity procesu"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+wsgi_app = 'core.wsgi:application'
+
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', 2 * cpu_count() + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Import plików i eksport CSV mogą trwać długo - strumieniowe odpowiedzi nie mogą być ucinane
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+graceful_timeout = 30
+keepalive = 5
+
+# Okresowy restart procesów ogranicza skutki wycieków pamięci
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+# Metryki Prometheusa z wszystkich procesów (core_app.metrics) - katalog czyszczony przy starcie
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
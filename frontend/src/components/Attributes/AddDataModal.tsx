@@ -3,6 +3,7 @@ import { FileUp, PenLine, X, FolderPlus, ChevronLeft, Plus } from 'lucide-react'
 import { useCustomSectionsStore, CustomSection } from '../../store/customSectionsStore';
 import { useLayerOrderStore } from '../../store/layerOrderStore';
 import { SectionNameModal } from '../LayerTree/SectionCreation';
+import { uploadFileInChunks } from './chunkedUpload';
 
 interface AddDataModalProps {
   onClose: () => void;
@@ -26,17 +27,8 @@ export function AddDataModal({ onClose }: AddDataModalProps) {
     if (!file || !selectedSection) return;
 
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-      // dziala
-      const response = await fetch('https://backend-1004166685896.europe-central2.run.app/api/upload/', {
-        method: 'POST',
-        body: formData,
-      });
-
-      if (!response.ok) {
-        throw new Error('Upload failed');
-      }
+      // Chunked, resumable upload - a retry only sends the missing chunks
+      await uploadFileInChunks(file);
 
       // Add layer to selected section
       const layerName = file.name.split('.')[0]; // Use filename without extension as layer name
@@ -201,7 +193,7 @@ export function AddDataModal({ onClose }: AddDataModalProps) {
                 type="file"
                 ref={fileInputRef}
                 onChange={handleFileSelect}
-                accept=".geojson,.kml,.shp,.csv,.gml"
+                accept=".geojson,.kml,.shp,.csv,.gml,.gz,.zst,.zip"
                 className="hidden"
               />
 
@@ -0,0 +1,106 @@
+// Resumable chunked upload: init, PUT each chunk with its SHA-256, complete.
+// After a network error only the chunks reported as missing are sent again.
+
+const API_URL = 'https://backend-1004166685896.europe-central2.run.app/api';
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const PARALLEL_CHUNKS = 3;
+const MAX_ATTEMPTS = 5;
+
+interface UploadSession {
+  upload_id: string;
+  chunk_size: number;
+  chunks: number;
+  status: 'open' | 'complete';
+  missing: number[];
+  job_id?: string;
+  status_url?: string;
+}
+
+async function sha256Hex(data: ArrayBuffer): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function request<T>(url: string, init?: RequestInit): Promise<T> {
+  const response = await fetch(url, init);
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    throw new Error(body.error || `Upload request failed (${response.status})`);
+  }
+  return response.status === 204 ? (undefined as T) : response.json();
+}
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// The upload id survives a page reload, so the same file picks up where it stopped
+function storageKey(file: File): string {
+  return `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function openSession(file: File): Promise<UploadSession> {
+  const savedId = localStorage.getItem(storageKey(file));
+  if (savedId) {
+    try {
+      const session = await request<UploadSession>(`${API_URL}/uploads/${savedId}/`);
+      if (session.status === 'open') return session;
+    } catch {
+      // Expired or removed session - start a new one
+    }
+  }
+
+  const session = await request<UploadSession>(`${API_URL}/uploads/`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size, chunk_size: CHUNK_SIZE }),
+  });
+  localStorage.setItem(storageKey(file), session.upload_id);
+  return session;
+}
+
+async function putChunk(file: File, session: UploadSession, index: number): Promise<void> {
+  const chunk = await file.slice(index * session.chunk_size, (index + 1) * session.chunk_size).arrayBuffer();
+  const checksum = await sha256Hex(chunk);
+
+  for (let attempt = 1; ; attempt++) {
+    try {
+      await request<void>(`${API_URL}/uploads/${session.upload_id}/chunks/${index}/`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum },
+        body: chunk,
+      });
+      return;
+    } catch (error) {
+      if (attempt >= MAX_ATTEMPTS) throw error;
+      await sleep(500 * 2 ** attempt);
+    }
+  }
+}
+
+export async function uploadFileInChunks(
+  file: File,
+  onProgress?: (sentChunks: number, totalChunks: number) => void,
+): Promise<UploadSession> {
+  let session = await openSession(file);
+
+  while (session.missing.length > 0) {
+    const queue = [...session.missing];
+    let sent = session.chunks - queue.length;
+    onProgress?.(sent, session.chunks);
+
+    const workers = Array.from({ length: Math.min(PARALLEL_CHUNKS, queue.length) }, async () => {
+      for (let index = queue.shift(); index !== undefined; index = queue.shift()) {
+        await putChunk(file, session, index);
+        onProgress?.(++sent, session.chunks);
+      }
+    });
+    await Promise.all(workers);
+
+    session = await request<UploadSession>(`${API_URL}/uploads/${session.upload_id}/`);
+  }
+
+  const completed = await request<UploadSession>(`${API_URL}/uploads/${session.upload_id}/complete/`, {
+    method: 'POST',
+  });
+  localStorage.removeItem(storageKey(file));
+  return completed;
+}